@@ -0,0 +1,131 @@
+"""
+Measure the memory held per key by the in-memory indexes.
+
+Writes a synthetic keys.json per size, then indexes it in a fresh process for
+each layout and reports the resident memory still held once it is indexed,
+divided by the number of keys.
+
+- dict: the indexes as they were before KeyRecord, holding the key dicts
+  parsed from JSON plus a separate secret -> expiry map
+- record: KeySnapshot.build, holding slotted KeyRecords whose identical
+  metadata is shared
+
+Usage:
+    python benchmarks/bench_key_memory.py [--sizes 100000,1000000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from heare_auth.formats import iter_keyring
+from heare_auth.storage import KeySnapshot, parse_expiry, verify_response_body
+
+LAYOUTS = ("dict", "record")
+CHUNK_SIZE = 1024 * 1024
+
+
+def write_keyring(path: str, count: int) -> None:
+    """Write a synthetic keyring shaped like the ones the CLI creates."""
+    with open(path, "w") as f:
+        f.write('{"keys": [')
+        for i in range(count):
+            if i:
+                f.write(", ")
+            f.write(json.dumps({
+                "id": f"key_{i:08d}",
+                "secret": f"sec_{i:060d}",
+                "name": f"Bench Key {i}",
+                "secret_type": "shared_secret",
+                "created_at": "2025-01-01T00:00:00Z",
+                "updated_at": None,
+                "expires_at": "2099-01-01T00:00:00Z" if i % 10 == 0 else None,
+                "metadata": {"service": f"service-{i % 50}", "environment": "production"},
+            }))
+        f.write("]}")
+
+
+def rss_bytes() -> int:
+    """Current resident set size in bytes."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmRSS not found in /proc/self/status")
+
+
+def read_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def build_dict_indexes(keys) -> tuple:
+    """The index layout KeySnapshot.build produced before KeyRecord."""
+    keys_by_secret = {}
+    keys_by_id = {}
+    expires_by_secret = {}
+    responses_by_secret = {}
+    for k in keys:
+        keys_by_secret[k["secret"]] = k
+        keys_by_id[k["id"]] = k
+        responses_by_secret[k["secret"]] = verify_response_body(k)
+        expiry = parse_expiry(k.get("expires_at"))
+        if expiry is not None:
+            expires_by_secret[k["secret"]] = expiry
+    expiry_order = tuple(sorted((e, s) for s, e in expires_by_secret.items()))
+    return keys_by_secret, keys_by_id, expires_by_secret, responses_by_secret, expiry_order
+
+
+def measure(layout: str, path: str) -> None:
+    """Index the keyring with one layout and print a JSON result line."""
+    gc.collect()
+    before = rss_bytes()
+
+    keys = iter_keyring(read_chunks(path))
+    if layout == "dict":
+        indexes = build_dict_indexes(keys)
+        count = len(indexes[0])
+    else:
+        indexes = KeySnapshot.build(keys)
+        count = len(indexes.keys_by_secret)
+
+    gc.collect()
+    print(json.dumps({"keys": count, "held_bytes": rss_bytes() - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--measure", nargs=2, metavar=("LAYOUT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    print(f"{'keys':>10} {'layout':>7} {'held MB':>8} {'bytes/key':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            path = os.path.join(tmp, f"keys-{size}.json")
+            write_keyring(path, size)
+
+            for layout in LAYOUTS:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", layout, path],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                result = json.loads(output.splitlines()[-1])
+                print(f"{result['keys']:>10,} {layout:>7} {result['held_bytes'] / 1e6:>8.0f} "
+                      f"{result['held_bytes'] / result['keys']:>10.0f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Measure peak RSS while loading keyrings of various sizes.
+
+Writes a synthetic keys.json per size, then loads it in a fresh process for
+each loader so every peak is measured from a clean start. "transient" is the
+peak minus the memory still held once the keyring is indexed.
+
+- streaming: KeyStore.load_from_s3, which parses the body chunk by chunk
+  straight into the new indexes
+- json_loads: reading the whole body and json.loads-ing it before indexing
+
+Usage:
+    python benchmarks/bench_load_memory.py [--sizes 100000,1000000,5000000] [--encrypt]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from heare_auth.storage import KeyStore
+
+LOADERS = ("streaming", "json_loads")
+STORAGE_SECRET = "bench-secret"
+
+
+def write_keyring(path: str, count: int, encrypt: bool) -> None:
+    """Write a synthetic keyring, streaming it to disk unless it must be encrypted whole."""
+    records = (
+        json.dumps({
+            "id": f"key_{i:08d}",
+            "secret": f"sec_{i:060d}",
+            "name": f"Bench Key {i}",
+            "metadata": {"service": "bench", "environment": "production"},
+            "created_at": "2025-01-01T00:00:00Z",
+        })
+        for i in range(count)
+    )
+    if encrypt:
+        store = KeyStore("bench", "keys.json", storage_secret=STORAGE_SECRET)
+        data = ('{"keys": [' + ", ".join(records) + "]}").encode()
+        with open(path, "wb") as f:
+            f.write(store._encrypt_data(data))
+        return
+
+    with open(path, "w") as f:
+        f.write('{"keys": [')
+        for i, record in enumerate(records):
+            if i:
+                f.write(", ")
+            f.write(record)
+        f.write("]}")
+
+
+def _status_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024 / 1e6
+    raise RuntimeError(f"{field} not found in /proc/self/status")
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB."""
+    return _status_mb("VmRSS")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    # Not ru_maxrss: Linux carries that over from the parent across exec
+    return _status_mb("VmHWM")
+
+
+class FileS3:
+    """S3 client that serves a local file as the keyring object."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # noqa: N803
+        return {"Body": open(self.path, "rb"), "ETag": '"bench"'}
+
+
+def measure(loader: str, path: str) -> None:
+    """Load the keyring with one loader and print a JSON result line."""
+    store = KeyStore("bench", "keys.json", storage_secret=STORAGE_SECRET)
+    before = rss_mb()
+    start = time.perf_counter()
+
+    if loader == "streaming":
+        store.s3 = FileS3(path)
+        count = store.load_from_s3()
+    else:
+        with open(path, "rb") as f:
+            data = json.loads(store._decrypt_data(f.read()))
+        count = store.set_keys(data["keys"])
+        del data
+
+    print(json.dumps({
+        "keys": count,
+        "seconds": time.perf_counter() - start,
+        "before_mb": before,
+        "peak_mb": peak_rss_mb(),
+        "final_mb": rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="100000,1000000,5000000")
+    parser.add_argument("--encrypt", action="store_true", help="Encrypt the keyring files")
+    parser.add_argument("--measure", nargs=2, metavar=("LOADER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    print(f"{'keys':>10} {'loader':>11} {'file MB':>8} {'peak MB':>8} {'final MB':>9} "
+          f"{'transient':>9} {'seconds':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            path = os.path.join(tmp, f"keys-{size}.json")
+            write_keyring(path, size, args.encrypt)
+            file_mb = os.path.getsize(path) / 1e6
+
+            for loader in LOADERS:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", loader, path],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                result = json.loads(output.splitlines()[-1])
+                peak = result["peak_mb"] - result["before_mb"]
+                final = result["final_mb"] - result["before_mb"]
+                print(f"{result['keys']:>10,} {loader:>11} {file_mb:>8.0f} {peak:>8.0f} "
+                      f"{final:>9.0f} {peak - final:>9.0f} {result['seconds']:>8.1f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare the JSON and binary keyring formats.
+
+For each size, writes an encrypted keyring in each format and reports the
+plaintext and stored (encrypted) sizes, the time to decrypt the object and
+the time for KeyStore.load_from_s3 to decrypt, parse and index it.
+--compression compresses inside the encryption and --encryption aead uses
+chunked AES-256-GCM (HEARE_ENCRYPTED_V3) instead of Fernet.
+
+Usage:
+    python benchmarks/bench_snapshot_format.py [--sizes 100000,1000000] [--compression gzip] \
+        [--encryption aead]
+"""
+
+import argparse
+import io
+import time
+
+from heare_auth.encryption import COMPRESSION_CODECS, ENCRYPTION_SCHEMES
+from heare_auth.formats import KEYRING_FORMATS
+from heare_auth.storage import KeyStore
+
+STORAGE_SECRET = "bench-secret"
+
+
+def make_keys(count: int) -> list:
+    """Synthetic keys shaped like the ones the CLI creates."""
+    return [
+        {
+            "id": f"key_{i:08d}",
+            "secret": f"sec_{i:060d}",
+            "name": f"Bench Key {i}",
+            "secret_type": "shared_secret",
+            "created_at": "2025-01-01T00:00:00Z",
+            "updated_at": None,
+            "expires_at": None,
+            "metadata": {"service": f"service-{i % 50}", "environment": "production"},
+        }
+        for i in range(count)
+    ]
+
+
+class MemoryS3:
+    """S3 client holding written objects in memory."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None):  # noqa: N803
+        self.objects[Key] = Body
+
+    def head_object(self, Bucket, Key):  # noqa: N803
+        return {"Metadata": {}}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # noqa: N803
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": '"bench"'}
+
+
+def measure(keys: list, keyring_format: str, compression=None, encryption="fernet") -> dict:
+    """Write keys in one format, then time decrypting and loading them."""
+    store = KeyStore(
+        "bench",
+        "keys.json",
+        storage_secret=STORAGE_SECRET,
+        keyring_format=keyring_format,
+        compression=compression,
+        encryption=encryption,
+    )
+    store.s3 = MemoryS3()
+    store.save_to_s3(keys)
+    stored = store.s3.objects["keys.json"]
+
+    start = time.perf_counter()
+    plaintext = sum(len(chunk) for chunk in store._read_body(io.BytesIO(stored)))
+    decrypt = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert store.load_from_s3(force=True) == len(keys)
+    load = time.perf_counter() - start
+
+    return {
+        "plaintext_mb": plaintext / 1e6,
+        "stored_mb": len(stored) / 1e6,
+        "decrypt": decrypt,
+        "load": load,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument(
+        "--compression", choices=COMPRESSION_CODECS, help="Compress before encrypting"
+    )
+    parser.add_argument("--encryption", choices=ENCRYPTION_SCHEMES, default="fernet")
+    args = parser.parse_args()
+
+    print(
+        f"{'keys':>10} {'format':>7} {'plain MB':>9} {'stored MB':>10} "
+        f"{'decrypt s':>10} {'load s':>7}"
+    )
+    for size in (int(s) for s in args.sizes.split(",")):
+        keys = make_keys(size)
+        for keyring_format in KEYRING_FORMATS:
+            result = measure(keys, keyring_format, args.compression, args.encryption)
+            print(f"{size:>10,} {keyring_format:>7} {result['plaintext_mb']:>9.1f} "
+                  f"{result['stored_mb']:>10.1f} {result['decrypt']:>10.2f} {result['load']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
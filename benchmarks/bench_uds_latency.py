@@ -0,0 +1,94 @@
+"""
+Benchmark /verify latency over a Unix domain socket vs loopback TCP.
+
+Starts one uvicorn server listening on both, then sends sequential requests
+over each transport with a keep-alive connection and reports percentiles.
+
+Usage:
+    python benchmarks/bench_uds_latency.py [--requests 5000]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import structlog
+import uvicorn
+
+from heare_auth.main import app, store
+from heare_auth.server import bind_tcp_socket, bind_unix_socket
+
+KEYS = [
+    {
+        "id": f"key_{i:08d}",
+        "secret": f"sec_{i:060d}",
+        "name": f"Bench Key {i}",
+        "metadata": {"service": "bench"},
+    }
+    for i in range(1000)
+]
+
+
+def measure(client: httpx.Client, count: int) -> list:
+    """Send count verify requests and return per-request latency in microseconds."""
+    latencies = []
+    for i in range(count):
+        body = {"api_key": KEYS[i % len(KEYS)]["secret"]}
+        start = time.perf_counter()
+        response = client.post("/verify", json=body)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        assert response.status_code == 200
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    """Print latency percentiles."""
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:>5}: p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Serve synthetic keys and keep logging out of the measurement
+    store.load_from_s3 = lambda: store.set_keys(KEYS)
+    structlog.configure(logger_factory=structlog.ReturnLoggerFactory())
+
+    uds_path = os.path.join(tempfile.mkdtemp(), "heare-auth.sock")
+    tcp_sock = bind_tcp_socket("127.0.0.1", 0)
+    port = tcp_sock.getsockname()[1]
+    uds_sock = bind_unix_socket(uds_path)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="error", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [tcp_sock, uds_sock]})
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        clients = {
+            "tcp": httpx.Client(base_url=f"http://127.0.0.1:{port}"),
+            "uds": httpx.Client(
+                transport=httpx.HTTPTransport(uds=uds_path), base_url="http://heare-auth"
+            ),
+        }
+        for name, client in clients.items():
+            with client:
+                measure(client, 500)  # warm up
+                report(name, measure(client, args.requests))
+    finally:
+        server.should_exit = True
+        thread.join()
+        os.unlink(uds_path)
+
+
+if __name__ == "__main__":
+    main()
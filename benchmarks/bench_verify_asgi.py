@@ -0,0 +1,112 @@
+"""
+Benchmark POST /verify through FastAPI routing vs the raw ASGI fast path.
+
+Calls each ASGI app in-process (no sockets) so the numbers isolate framework
+overhead from network cost.
+
+Usage:
+    python benchmarks/bench_verify_asgi.py [--requests 20000] [--keys 10000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from heare_auth.main import FastVerifyMiddleware, app, store
+
+
+def make_keys(count: int) -> list:
+    """Generate synthetic key records."""
+    return [
+        {
+            "id": f"key_{i:08d}",
+            "secret": f"sec_{i:060d}",
+            "name": f"Bench Key {i}",
+            "metadata": {"service": "bench", "environment": "production"},
+        }
+        for i in range(count)
+    ]
+
+
+async def call(asgi_app, body: bytes) -> int:
+    """Send one POST /verify to an ASGI app and return the status code."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/verify",
+        "raw_path": b"/verify",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"user-agent", b"bench/1.0"),
+        ],
+        "client": ("127.0.0.1", 12345),
+        "server": ("127.0.0.1", 8080),
+    }
+    status = 0
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asgi_app(scope, receive, send)
+    return status
+
+
+async def run(asgi_app, bodies: list) -> float:
+    """Send every body once and return requests per second."""
+    start = time.perf_counter()
+    for body in bodies:
+        await call(asgi_app, body)
+    return len(bodies) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=10000)
+    args = parser.parse_args()
+
+    keys = make_keys(args.keys)
+    store.set_keys(keys)
+    bodies = [
+        json.dumps({"api_key": keys[i % len(keys)]["secret"]}).encode()
+        for i in range(args.requests)
+    ]
+
+    # Silence per-request logging so it does not dominate the measurement
+    import structlog
+
+    structlog.configure(logger_factory=structlog.ReturnLoggerFactory())
+
+    paths = {
+        "fastapi": app,
+        "raw_asgi": FastVerifyMiddleware(app),
+    }
+    results = {}
+    for name, asgi_app in paths.items():
+        asyncio.run(run(asgi_app, bodies[:1000]))  # warm up
+        results[name] = asyncio.run(run(asgi_app, bodies))
+        print(f"{name:>10}: {results[name]:>10,.0f} req/s")
+
+    print(f"   speedup: {results['raw_asgi'] / results['fastapi']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 import json
 import sys
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 import boto3
 import click
@@ -31,7 +31,17 @@ def generate_key_pair() -> tuple[str, str]:
 class CLI:
     """CLI operations for managing API keys."""
 
-    def __init__(self, bucket: str, key: str, region: str, storage_secret: Optional[str] = None):
+    def __init__(
+        self,
+        bucket: str,
+        key: str,
+        region: str,
+        storage_secret: Optional[str] = None,
+        change_log: bool = False,
+        keyring_format: str = "json",
+        compression: Optional[str] = None,
+        encryption: str = "fernet",
+    ):
         """
         Initialize the CLI.
 
@@ -40,31 +50,50 @@ class CLI:
             key: S3 key (file path)
             region: AWS region
             storage_secret: Optional secret for encrypting data at rest
+            change_log: Append changes to the change log instead of rewriting the keyring
+            keyring_format: Format keyrings are written in ("json" or "binary")
+            compression: Codec to compress data with before encrypting it ("gzip" or "zstd")
+            encryption: Scheme to encrypt data with ("fernet" or "aead")
         """
         self.bucket = bucket
         self.key = key
         self.storage_secret = storage_secret
+        self.change_log = change_log
+        self.keyring_format = keyring_format
+        self.compression = compression
+        self.encryption = encryption
         self.s3 = boto3.client("s3", region_name=region)
 
-    def load_keys(self) -> list:
-        """
-        Load keys from S3 with encryption support.
-
-        Returns:
-            List of key dictionaries
-        """
+    def _store(self):
+        """Create a KeyStore for this CLI's keyring."""
         from .storage import KeyStore
         
-        store = KeyStore(
+        return KeyStore(
             bucket=self.bucket,
             key=self.key,
             region="us-east-1",
             storage_secret=self.storage_secret,
+            change_log=self.change_log,
+            keyring_format=self.keyring_format,
+            compression=self.compression,
+            encryption=self.encryption,
         )
-        
+
+    def _load(self):
+        """Create a KeyStore for this CLI's keyring and load it."""
+        store = self._store()
+        store.load_from_s3()
+        return store
+
+    def load_keys(self) -> list:
+        """
+        Load keys from S3 with encryption support.
+
+        Returns:
+            List of key dictionaries
+        """
         try:
-            store.load_from_s3()
-            return store.get_all_keys()
+            return self._load().get_all_keys()
         except ClientError as e:
             if e.response["Error"]["Code"] == "NoSuchKey":
                 return []
@@ -74,18 +103,91 @@ class CLI:
         """
         Save keys to S3 with encryption support.
 
+        The keyring's change log position is kept, so records already folded
+        in are not applied a second time.
+
         Args:
             keys: List of key dictionaries to save
         """
-        from .storage import KeyStore
+        store = self._store()
+        store.save_to_s3(keys, store.read_log_seq())
+
+    def update_keys(self, key_id: str, change) -> list:
+        """
+        Apply a change to the keys that share a storage object with key_id.
+
+        For a sharded keyring only the shard holding key_id is read and
+        rewritten; otherwise the whole single-file keyring is.
+
+        Args:
+            key_id: The key ID being created or changed
+            change: Callable taking the list of keys and returning the new list
+
+        Returns:
+            The list of keys before the change
+        """
+        from .storage import shard_index
         
-        store = KeyStore(
-            bucket=self.bucket,
-            key=self.key,
-            region="us-east-1",
-            storage_secret=self.storage_secret,
-        )
-        store.save_to_s3(keys)
+        store = self._store()
+        manifest = store.read_manifest()
+        if manifest is None:
+            keys = self.load_keys()
+            self.save_keys(change(keys))
+            return keys
+
+        index = shard_index(key_id, manifest["shard_count"])
+        keys = store.read_shard(manifest, index)
+        store.write_shard(manifest, index, change(keys))
+        return keys
+
+    def shard(self, shard_count: int) -> dict:
+        """
+        Rewrite the keyring as shard_count shards plus a manifest.
+
+        Works on single-file and already sharded keyrings alike.
+
+        Args:
+            shard_count: Number of shards
+
+        Returns:
+            The new manifest
+        """
+        store = self._load()
+        return store.save_sharded(store.get_all_keys(), shard_count, store.log_seq)
+
+    def compact(self) -> Tuple[int, int]:
+        """
+        Fold the change log into the keyring and delete the folded records.
+
+        The keyring is rewritten in its current layout (sharded or single
+        file) and records its new log position before any record is
+        deleted, so a reader never misses a change.
+
+        Returns:
+            Tuple of (keys in the keyring, change records deleted)
+        """
+        store = self._store()
+        store.change_log = True
+        store.load_from_s3()
+        keys = store.get_all_keys()
+
+        manifest = store.read_manifest()
+        if manifest is None:
+            store.save_to_s3(keys, store.log_seq)
+        else:
+            store.save_sharded(keys, manifest["shard_count"], store.log_seq)
+        return len(keys), store.delete_changes(store.log_seq)
+
+    def compile(self) -> Tuple[int, int]:
+        """
+        Compile the keyring into a perfect hash lookup file next to it.
+
+        Returns:
+            Tuple of (keys compiled, size of the compiled index in bytes)
+        """
+        store = self._load()
+        size = store.compile_index()
+        return store.snapshot.key_count, size
 
     def create(
         self,
@@ -108,8 +210,6 @@ class CLI:
         Returns:
             The created key dictionary
         """
-        keys = self.load_keys()
-
         key_id, secret = generate_key_pair()
         now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
@@ -124,8 +224,10 @@ class CLI:
             "metadata": metadata,
         }
 
-        keys.append(new_key)
-        self.save_keys(keys)
+        if self.change_log:
+            self._store().append_change("create", key_data=new_key)
+        else:
+            self.update_keys(key_id, lambda keys: keys + [new_key])
 
         # Trigger refresh if URL provided
         if refresh_url:
@@ -159,21 +261,21 @@ class CLI:
         Raises:
             ValueError: If the key is not found
         """
-        keys = self.load_keys()
-
-        # Find the key to delete
-        key_to_delete = None
-        for k in keys:
-            if k["id"] == key_id:
-                key_to_delete = k
-                break
-
-        if not key_to_delete:
-            raise ValueError(f"API key not found: {key_id}")
+        def remove(keys: list) -> list:
+            if not any(k["id"] == key_id for k in keys):
+                raise ValueError(f"API key not found: {key_id}")
+            return [k for k in keys if k["id"] != key_id]
 
         # Remove the key
-        keys = [k for k in keys if k["id"] != key_id]
-        self.save_keys(keys)
+        if self.change_log:
+            store = self._load()
+            key_to_delete = store.get_by_id(key_id)
+            if key_to_delete is None:
+                raise ValueError(f"API key not found: {key_id}")
+            store.append_change("delete", key_id=key_id)
+        else:
+            keys = self.update_keys(key_id, remove)
+            key_to_delete = next(k for k in keys if k["id"] == key_id)
 
         # Trigger refresh if URL provided
         if refresh_url:
@@ -200,14 +302,56 @@ def main():
     default=SecretType.SHARED_SECRET.value,
     help="Type of secret",
 )
-@click.option("--expires-at", help="Expiration date/time in ISO 8601 format (e.g., 2025-12-31T23:59:59Z)")
+@click.option(
+    "--expires-at",
+    help="Expiration date/time in ISO 8601 format (e.g., 2025-12-31T23:59:59Z)",
+)
 @click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
 @click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
 @click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
-@click.option("--storage-secret", envvar="STORAGE_SECRET", help="Secret for encrypting data at rest")
-@click.option("--refresh-url", envvar="REFRESH_URL", default="http://localhost:8080/refresh", help="URL to trigger refresh")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--change-log",
+    is_flag=True,
+    envvar="CHANGE_LOG",
+    help="Read and append to the change log",
+)
+@click.option(
+    "--format",
+    "keyring_format",
+    envvar="KEYRING_FORMAT",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+    help="Format to write the keyring in",
+)
+@click.option(
+    "--compression",
+    envvar="STORAGE_COMPRESSION",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Compress data before encrypting it (needs --storage-secret)",
+)
+@click.option(
+    "--encryption",
+    envvar="STORAGE_ENCRYPTION",
+    type=click.Choice(["fernet", "aead"]),
+    default="fernet",
+    help="Encryption scheme for written data (aead: chunked AES-256-GCM)",
+)
+@click.option(
+    "--refresh-url",
+    envvar="REFRESH_URL",
+    default="http://localhost:8080/refresh",
+    help="URL to trigger refresh",
+)
 @click.option("--no-refresh", is_flag=True, help="Skip automatic refresh")
-def create(name, metadata, secret_type, expires_at, bucket, key, region, storage_secret, refresh_url, no_refresh):
+def create(
+    name, metadata, secret_type, expires_at, bucket, key, region, storage_secret, change_log,
+    keyring_format, compression, encryption, refresh_url, no_refresh,
+):
     """Create a new API key."""
     try:
         metadata_dict = json.loads(metadata)
@@ -225,7 +369,9 @@ def create(name, metadata, secret_type, expires_at, bucket, key, region, storage
             sys.exit(1)
 
     try:
-        cli = CLI(bucket, key, region, storage_secret)
+        cli = CLI(
+            bucket, key, region, storage_secret, change_log, keyring_format, compression, encryption
+        )
         new_key = cli.create(
             name,
             metadata_dict,
@@ -269,12 +415,22 @@ def create(name, metadata, secret_type, expires_at, bucket, key, region, storage
 @click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
 @click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
 @click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
-@click.option("--storage-secret", envvar="STORAGE_SECRET", help="Secret for encrypting data at rest")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--change-log",
+    is_flag=True,
+    envvar="CHANGE_LOG",
+    help="Read and append to the change log",
+)
 @click.option("--detailed", "-d", is_flag=True, help="Show detailed information")
-def list(bucket, key, region, storage_secret, detailed):
+def list(bucket, key, region, storage_secret, change_log, detailed):
     """List all API keys."""
     try:
-        cli = CLI(bucket, key, region, storage_secret)
+        cli = CLI(bucket, key, region, storage_secret, change_log)
         keys = cli.list_keys()
 
         if not keys:
@@ -322,11 +478,21 @@ def list(bucket, key, region, storage_secret, detailed):
 @click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
 @click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
 @click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
-@click.option("--storage-secret", envvar="STORAGE_SECRET", help="Secret for encrypting data at rest")
-def show(key_id, bucket, key, region, storage_secret):
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--change-log",
+    is_flag=True,
+    envvar="CHANGE_LOG",
+    help="Read and append to the change log",
+)
+def show(key_id, bucket, key, region, storage_secret, change_log):
     """Show detailed information about a specific API key."""
     try:
-        cli = CLI(bucket, key, region, storage_secret)
+        cli = CLI(bucket, key, region, storage_secret, change_log)
         keys = cli.list_keys()
         
         key_data = next((k for k in keys if k["id"] == key_id), None)
@@ -358,14 +524,55 @@ def show(key_id, bucket, key, region, storage_secret):
 @click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
 @click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
 @click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
-@click.option("--storage-secret", envvar="STORAGE_SECRET", help="Secret for encrypting data at rest")
-@click.option("--refresh-url", envvar="REFRESH_URL", default="http://localhost:8080/refresh", help="URL to trigger refresh")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--change-log",
+    is_flag=True,
+    envvar="CHANGE_LOG",
+    help="Read and append to the change log",
+)
+@click.option(
+    "--format",
+    "keyring_format",
+    envvar="KEYRING_FORMAT",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+    help="Format to write the keyring in",
+)
+@click.option(
+    "--compression",
+    envvar="STORAGE_COMPRESSION",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Compress data before encrypting it (needs --storage-secret)",
+)
+@click.option(
+    "--encryption",
+    envvar="STORAGE_ENCRYPTION",
+    type=click.Choice(["fernet", "aead"]),
+    default="fernet",
+    help="Encryption scheme for written data (aead: chunked AES-256-GCM)",
+)
+@click.option(
+    "--refresh-url",
+    envvar="REFRESH_URL",
+    default="http://localhost:8080/refresh",
+    help="URL to trigger refresh",
+)
 @click.option("--no-refresh", is_flag=True, help="Skip automatic refresh")
 @click.option("--yes", "-y", is_flag=True, help="Skip confirmation")
-def delete(key_id, bucket, key, region, storage_secret, refresh_url, no_refresh, yes):
+def delete(
+    key_id, bucket, key, region, storage_secret, change_log, keyring_format, compression,
+    encryption, refresh_url, no_refresh, yes,
+):
     """Delete an API key by its ID."""
     try:
-        cli = CLI(bucket, key, region, storage_secret)
+        cli = CLI(
+            bucket, key, region, storage_secret, change_log, keyring_format, compression, encryption
+        )
 
         # Find the key to show name
         keys = cli.list_keys()
@@ -400,6 +607,180 @@ def delete(key_id, bucket, key, region, storage_secret, refresh_url, no_refresh,
         sys.exit(1)
 
 
+@main.command()
+@click.option("--count", required=True, type=click.IntRange(min=1), help="Number of shards")
+@click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
+@click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
+@click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--format",
+    "keyring_format",
+    envvar="KEYRING_FORMAT",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+    help="Format to write the keyring in",
+)
+@click.option(
+    "--compression",
+    envvar="STORAGE_COMPRESSION",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Compress data before encrypting it (needs --storage-secret)",
+)
+@click.option(
+    "--encryption",
+    envvar="STORAGE_ENCRYPTION",
+    type=click.Choice(["fernet", "aead"]),
+    default="fernet",
+    help="Encryption scheme for written data (aead: chunked AES-256-GCM)",
+)
+def shard(count, bucket, key, region, storage_secret, keyring_format, compression, encryption):
+    """Split the keyring into shards listed by a manifest at the S3 key."""
+    try:
+        cli = CLI(
+            bucket,
+            key,
+            region,
+            storage_secret,
+            keyring_format=keyring_format,
+            compression=compression,
+            encryption=encryption,
+        )
+        manifest = cli.shard(count)
+        click.echo(f"✓ Keyring written as {manifest['shard_count']} shards under {key}.shards/")
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+@main.command()
+@click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
+@click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
+@click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--format",
+    "keyring_format",
+    envvar="KEYRING_FORMAT",
+    type=click.Choice(["json", "binary"]),
+    default="json",
+    help="Format to write the keyring in",
+)
+@click.option(
+    "--compression",
+    envvar="STORAGE_COMPRESSION",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Compress data before encrypting it (needs --storage-secret)",
+)
+@click.option(
+    "--encryption",
+    envvar="STORAGE_ENCRYPTION",
+    type=click.Choice(["fernet", "aead"]),
+    default="fernet",
+    help="Encryption scheme for written data (aead: chunked AES-256-GCM)",
+)
+def compact(bucket, key, region, storage_secret, keyring_format, compression, encryption):
+    """Fold the change log into the keyring and delete the folded records."""
+    try:
+        cli = CLI(
+            bucket,
+            key,
+            region,
+            storage_secret,
+            keyring_format=keyring_format,
+            compression=compression,
+            encryption=encryption,
+        )
+        count, deleted = cli.compact()
+        click.echo(f"✓ Compacted {deleted} change records into {count} keys")
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+@main.command()
+@click.option("--bucket", envvar="S3_BUCKET", required=True, help="S3 bucket name")
+@click.option("--key", envvar="S3_KEY", default="keys.json", help="S3 key path")
+@click.option("--region", envvar="S3_REGION", default="us-east-1", help="AWS region")
+@click.option(
+    "--storage-secret",
+    envvar="STORAGE_SECRET",
+    help="Secret for encrypting data at rest",
+)
+@click.option(
+    "--change-log",
+    is_flag=True,
+    envvar="CHANGE_LOG",
+    help="Read and append to the change log",
+)
+@click.option(
+    "--compression",
+    envvar="STORAGE_COMPRESSION",
+    type=click.Choice(["gzip", "zstd"]),
+    help="Compress data before encrypting it (needs --storage-secret)",
+)
+@click.option(
+    "--encryption",
+    envvar="STORAGE_ENCRYPTION",
+    type=click.Choice(["fernet", "aead"]),
+    default="fernet",
+    help="Encryption scheme for written data (aead: chunked AES-256-GCM)",
+)
+def compile(bucket, key, region, storage_secret, change_log, compression, encryption):
+    """Compile the keyring into a lookup file the service maps without parsing."""
+    try:
+        cli = CLI(
+            bucket,
+            key,
+            region,
+            storage_secret,
+            change_log,
+            compression=compression,
+            encryption=encryption,
+        )
+        count, size = cli.compile()
+        click.echo(f"✓ Compiled {count} keys into {key}.index ({size / 1e6:.1f} MB)")
+    except Exception as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
+@main.command()
+@click.option("--host", envvar="HOST", default="0.0.0.0", help="TCP interface to listen on")
+@click.option("--port", envvar="PORT", default=8080, type=int, help="TCP port to listen on")
+@click.option("--uds", envvar="UDS_PATH", help="Unix domain socket path to listen on")
+@click.option(
+    "--uds-mode",
+    envvar="UDS_MODE",
+    default="660",
+    help="Octal permissions for the socket file",
+)
+@click.option("--no-tcp", is_flag=True, help="Listen only on the Unix domain socket")
+def serve(host, port, uds, uds_mode, no_tcp):
+    """Run the API server on TCP, a Unix domain socket, or both."""
+    from .server import serve as run_server
+
+    try:
+        mode = int(uds_mode, 8)
+    except ValueError:
+        click.echo(f"Error: Invalid --uds-mode (expected octal, e.g. 660): {uds_mode}", err=True)
+        sys.exit(1)
+
+    try:
+        run_server(host=None if no_tcp else host, port=port, uds=uds, uds_mode=mode)
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+
+
 @main.command()
 @click.option("--url", default="http://localhost:8080/refresh", help="Refresh endpoint URL")
 def refresh(url):
@@ -413,6 +794,15 @@ def refresh(url):
             click.echo(f"✓ Refresh successful - loaded {data.get('keys_loaded', 0)} keys")
         else:
             click.echo("✗ Refresh failed", err=True)
+        for worker in data.get("workers", []):
+            if worker["success"]:
+                click.echo(
+                    f"  worker {worker['pid']}: generation {worker['generation']}, "
+                    f"{worker['keys_loaded']} keys"
+                )
+            else:
+                click.echo(f"  worker {worker['pid']}: failed - {worker['error']}", err=True)
+        if not data.get("success"):
             sys.exit(1)
     except requests.exceptions.RequestException as e:
         click.echo(f"Error: Failed to refresh: {e}", err=True)
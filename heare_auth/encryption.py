@@ -0,0 +1,224 @@
+"""Compression and chunked AEAD encryption of data at rest."""
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .formats import ChunkReader
+
+try:
+    import zstandard
+except ImportError:  # Optional, install with heare-auth[zstd]
+    zstandard = None
+
+
+# Codecs for compressing plaintext inside a HEARE_ENCRYPTED_V2 envelope
+COMPRESSION_CODECS = ("gzip", "zstd")
+
+
+def require_codec(codec: str) -> None:
+    if codec not in COMPRESSION_CODECS:
+        raise ValueError(f"Unsupported compression codec: {codec}")
+    if codec == "zstd" and zstandard is None:
+        raise ValueError(
+            "zstd compression requires the zstandard package (pip install heare-auth[zstd])"
+        )
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """
+    Compress data with one of COMPRESSION_CODECS.
+
+    Args:
+        data: Data to compress
+        codec: "gzip" or "zstd"
+
+    Returns:
+        Compressed data
+
+    Raises:
+        ValueError: If the codec is unknown or unavailable
+    """
+    require_codec(codec)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    # zlib writes a zero mtime into the gzip header, so equal inputs compress equally
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_decompress(chunks: Iterable[bytes], codec: str) -> Iterator[bytes]:
+    """
+    Decompress a stream of chunks compressed with one of COMPRESSION_CODECS.
+
+    Args:
+        chunks: Compressed data, as an iterable of byte chunks
+        codec: "gzip" or "zstd"
+
+    Returns:
+        Iterator over decompressed chunks
+
+    Raises:
+        ValueError: If the codec is unknown or unavailable, or the data is
+            corrupt or truncated
+    """
+    require_codec(codec)
+    if codec == "zstd":
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        error = zstandard.ZstdError
+    else:
+        decompressor = zlib.decompressobj(31)
+        error = zlib.error
+    try:
+        for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        if codec == "gzip":
+            data = decompressor.flush()
+            if data:
+                yield data
+    except error as e:
+        raise ValueError(f"Failed to decompress {codec} data: {e}") from None
+    if not decompressor.eof or decompressor.unused_data:
+        raise ValueError(f"Compressed {codec} data is truncated or has trailing bytes")
+
+
+# Schemes KeyStore can write encrypted data with
+ENCRYPTION_SCHEMES = ("fernet", "aead")
+
+# Chunked AEAD layout (after the HEARE_ENCRYPTED_V3 header), integers little-endian:
+#   algorithm (u8, AEAD_AES_256_GCM), codec (u8, index into AEAD_CODECS),
+#   salt (16 bytes), segment size (u32), then the plaintext (compressed by
+#   the codec) in segment size pieces, each sealed with its 16 byte tag.
+# Each object gets its own key, HKDF(master key, salt). A segment's nonce is
+# its index (11 bytes big-endian) plus a final-segment flag, and the header is
+# authenticated with every segment, so segments cannot be reordered, dropped,
+# swapped between objects, or truncated at a boundary (the last one is always
+# flagged, and is empty if the plaintext fills the segments exactly).
+AEAD_AES_256_GCM = 1
+AEAD_CODECS = (None, "gzip", "zstd")
+AEAD_SEGMENT_SIZE = 1024 * 1024
+# Segments decrypted concurrently (and held in memory) while streaming
+AEAD_DECRYPT_WORKERS = min(4, os.cpu_count() or 1)
+
+_AEAD_HEADER = struct.Struct("<BB16sI")
+_AEAD_TAG_SIZE = 16
+
+
+def _aead_cipher(master_key: bytes, salt: bytes) -> AESGCM:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"heare-auth aead v3")
+    key = hkdf.derive(master_key)
+    return AESGCM(key)
+
+
+def _segment_nonce(index: int, last: bool) -> bytes:
+    return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+
+def aead_encrypt(
+    data: bytes,
+    master_key: bytes,
+    codec: Optional[str] = None,
+    segment_size: int = AEAD_SEGMENT_SIZE,
+) -> bytes:
+    """
+    Encrypt data as independently authenticated AES-256-GCM segments.
+
+    Args:
+        data: Plaintext
+        master_key: 32 byte key derived from the storage secret
+        codec: Optional codec from COMPRESSION_CODECS applied before encrypting
+        segment_size: Plaintext bytes per segment
+
+    Returns:
+        The header and sealed segments (without the HEARE_ENCRYPTED_V3 prefix)
+
+    Raises:
+        ValueError: If the codec is unknown or unavailable
+    """
+    if codec is not None:
+        data = compress(data, codec)
+    header = _AEAD_HEADER.pack(
+        AEAD_AES_256_GCM, AEAD_CODECS.index(codec), os.urandom(16), segment_size
+    )
+    cipher = _aead_cipher(master_key, header[2:18])
+
+    view = memoryview(data)
+    count = len(data) // segment_size + 1  # The last segment is never full
+    parts = [header]
+    for index in range(count):
+        segment = view[index * segment_size:(index + 1) * segment_size]
+        nonce = _segment_nonce(index, index == count - 1)
+        parts.append(cipher.encrypt(nonce, bytes(segment), header))
+    return b"".join(parts)
+
+
+def iter_aead_decrypt(
+    chunks: Iterable[bytes],
+    master_key: bytes,
+    workers: int = AEAD_DECRYPT_WORKERS,
+) -> Iterator[bytes]:
+    """
+    Decrypt a chunked AEAD payload into plaintext chunks as it is read.
+
+    Segments are authenticated and decrypted on a small thread pool, a few
+    at a time and yielded in order, so plaintext is available after the
+    first segment and memory stays bounded by the segments in flight.
+    Plaintext compressed by the header's codec is decompressed.
+
+    Args:
+        chunks: The payload after the HEARE_ENCRYPTED_V3 prefix, as byte chunks
+        master_key: 32 byte key derived from the storage secret
+        workers: Segments decrypted concurrently
+
+    Returns:
+        Iterator over plaintext chunks; each one is authenticated before it
+        is yielded, and a truncated or tampered payload raises before the end
+
+    Raises:
+        ValueError: If the payload is malformed, truncated, tampered with or
+            encrypted under another key
+    """
+    reader = ChunkReader(chunks)
+    header = reader.read(_AEAD_HEADER.size)
+    algorithm, codec_id, salt, segment_size = _AEAD_HEADER.unpack(header)
+    if algorithm != AEAD_AES_256_GCM or codec_id >= len(AEAD_CODECS) or not segment_size:
+        raise ValueError("Unsupported HEARE_ENCRYPTED_V3 header")
+    cipher = _aead_cipher(master_key, salt)
+    sealed_size = segment_size + _AEAD_TAG_SIZE
+
+    def open_segment(index: int, segment: bytes, last: bool) -> bytes:
+        try:
+            return cipher.decrypt(_segment_nonce(index, last), segment, header)
+        except InvalidTag:
+            raise ValueError(
+                "Failed to decrypt data - invalid STORAGE_SECRET, "
+                "or the data is corrupt or truncated"
+            ) from None
+
+    def segments() -> Iterator[bytes]:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending = deque()
+            index = 0
+            last = False
+            while not last:
+                segment = reader.read_up_to(sealed_size)
+                last = len(segment) < sealed_size or reader.at_eof()
+                pending.append(pool.submit(open_segment, index, segment, last))
+                index += 1
+                if len(pending) > workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    codec = AEAD_CODECS[codec_id]
+    yield from iter_decompress(segments(), codec) if codec else segments()
@@ -0,0 +1,41 @@
+"""JSON helpers that use orjson when it is installed."""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional, install with heare-auth[fast]
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """
+    Serialize an object to compact UTF-8 JSON.
+
+    Args:
+        obj: The object to serialize; unknown types are rendered with str()
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes):
+    """
+    Parse UTF-8 JSON.
+
+    Args:
+        data: JSON bytes
+
+    Returns:
+        The decoded object
+
+    Raises:
+        ValueError: If the data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
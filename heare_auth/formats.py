@@ -0,0 +1,344 @@
+"""Keyring formats: streamed JSON and the binary snapshot."""
+
+import codecs
+import json
+import re
+import struct
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List
+
+# Bytes read from S3 (and parsed) at a time when streaming a keyring
+READ_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SPACE = frozenset(" \t\n\r")
+
+
+class _ChunkScanner:
+    """
+    JSON tokenizer over a stream of byte chunks.
+
+    Only a window of the document is held in memory: text before the current
+    position is discarded whenever another chunk is read in. Object keys are
+    shared across values the way json.loads shares them within a document,
+    so a million records do not carry a million copies of "secret".
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        names: Dict[str, str] = {}
+        self._scan = json.JSONDecoder(
+            object_pairs_hook=lambda pairs: {names.setdefault(k, k): v for k, v in pairs}
+        ).scan_once
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._offset = 0  # Document position of the start of the buffer
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer. Returns False at end of input."""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"{message} at position {self._offset + self._pos} of keys document")
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or "" at end of input."""
+        while True:
+            buffer, pos = self._buffer, self._pos
+            if pos < len(buffer) and buffer[pos] not in _SPACE:
+                return buffer[pos]
+            self._pos = _WHITESPACE.match(buffer, pos).end()
+            if self._pos < len(buffer):
+                return buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be `char`."""
+        if self.peek() != char:
+            raise self._error(f"Expected {char!r}")
+        self._pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._scan(self._buffer, self._pos)
+            except (StopIteration, ValueError):
+                if self._fill():
+                    continue
+                raise self._error("Invalid JSON value") from None
+            # A value running to the end of the buffer may be cut short (e.g. a number)
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return value
+
+
+def iter_keys(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Stream the records of a {"keys": [...]} document one at a time.
+
+    The document is read chunk by chunk and each record is decoded by its own
+    call into the JSON scanner, so neither the whole document text nor the
+    keys list is ever materialized, and a worker thread running this releases
+    the GIL between records.
+
+    Args:
+        chunks: UTF-8 encoded document, as an iterable of byte chunks
+
+    Returns:
+        Iterator over key dictionaries
+
+    Raises:
+        ValueError: If the document is not a JSON object with a "keys" array
+    """
+    scanner = _ChunkScanner(chunks)
+    scanner.expect("{")
+    found_keys = False
+    if scanner.peek() != "}":
+        while True:
+            name = scanner.value()
+            scanner.expect(":")
+            if name == "keys":
+                found_keys = True
+                scanner.expect("[")
+                if scanner.peek() == "]":
+                    scanner.expect("]")
+                else:
+                    while True:
+                        yield scanner.value()
+                        if scanner.peek() == "]":
+                            scanner.expect("]")
+                            break
+                        scanner.expect(",")
+            else:
+                scanner.value()
+
+            if scanner.peek() == "}":
+                break
+            scanner.expect(",")
+    scanner.expect("}")
+
+    if scanner.peek() != "":
+        raise ValueError("Unexpected data after the keys document")
+    if not found_keys:
+        raise ValueError('Keys document has no "keys" array')
+
+
+def iter_chunks(data: bytes, size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """Split an in-memory document into chunks for iter_keys."""
+    view = memoryview(data)
+    for start in range(0, len(data), size):
+        yield bytes(view[start:start + size])
+
+
+# Binary snapshot layout (integers little-endian):
+#   SNAPSHOT_MAGIC, schema version (u16), key count (u32), extras count (u32)
+#   extras table: per entry a length (u32) and a compact JSON object holding
+#     the fields outside SNAPSHOT_FIELDS (metadata, unknown fields)
+#   per key: a length (u32), then a mask (u8) of the SNAPSHOT_FIELDS stored
+#     as strings, a mask (u8) of those that are null, an extras table index
+#     (u32, NO_EXTRAS if none), and the stored strings joined by NUL
+# Identical extras (most keys share their metadata) are stored and decoded
+# once, so decoding a record is a split and two dict updates.
+SNAPSHOT_MAGIC = b"HEARE_KEYS\x00"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FIELDS = ("id", "secret", "name", "secret_type", "created_at", "updated_at", "expires_at")
+KEYRING_FORMATS = ("json", "binary")
+
+_SNAPSHOT_HEADER = struct.Struct("<HII")
+_LENGTH = struct.Struct("<I")
+_RECORD_HEADER = struct.Struct("<BBI")
+_NO_EXTRAS = 0xFFFFFFFF
+# Fields named by each mask value, in SNAPSHOT_FIELDS order
+_MASK_FIELDS = tuple(
+    tuple(name for bit, name in enumerate(SNAPSHOT_FIELDS) if mask >> bit & 1)
+    for mask in range(1 << len(SNAPSHOT_FIELDS))
+)
+
+
+def serialize_snapshot(keys: List[dict]) -> bytes:
+    """
+    Serialize keys in the binary snapshot format.
+
+    Args:
+        keys: List of key dictionaries
+
+    Returns:
+        The binary snapshot
+    """
+    extras_index: Dict[bytes, int] = {}
+    records = []
+    for k in keys:
+        present = null = 0
+        strings = []
+        extra = dict(k)
+        for bit, name in enumerate(SNAPSHOT_FIELDS):
+            value = extra.get(name, ...)
+            if value is None:
+                null |= 1 << bit
+            elif isinstance(value, str) and "\x00" not in value:
+                present |= 1 << bit
+                strings.append(value)
+            else:
+                # Missing, or not representable: left to the extras
+                continue
+            del extra[name]
+
+        index = _NO_EXTRAS
+        if extra:
+            encoded = json.dumps(extra, separators=(",", ":")).encode("utf-8")
+            index = extras_index.setdefault(encoded, len(extras_index))
+        body = _RECORD_HEADER.pack(present, null, index) + "\x00".join(strings).encode("utf-8")
+        records.append(_LENGTH.pack(len(body)))
+        records.append(body)
+
+    parts = [SNAPSHOT_MAGIC, _SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, len(keys), len(extras_index))]
+    for encoded in extras_index:  # Insertion order is index order
+        parts.append(_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    return b"".join(parts + records)
+
+
+class ChunkReader:
+    """Reads exact byte counts from a stream of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._pos = 0
+
+    def read(self, size: int) -> bytes:
+        """Read exactly size bytes. Raises ValueError if the stream ends first."""
+        end = self._pos + size
+        while end > len(self._buffer):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise ValueError("Binary snapshot is truncated")
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos, end = 0, size
+        data = self._buffer[self._pos:end]
+        self._pos = end
+        return data
+
+    def read_up_to(self, size: int) -> bytes:
+        """Read size bytes, or fewer if the stream ends first."""
+        try:
+            return self.read(size)
+        except ValueError:
+            data = self._buffer[self._pos:]
+            self._buffer, self._pos = b"", 0
+            return data
+
+    def at_eof(self) -> bool:
+        """Check whether the stream has ended, without consuming data."""
+        while self._pos == len(self._buffer):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return True
+            self._buffer, self._pos = chunk, 0
+        return False
+
+    def read_sized(self) -> bytes:
+        """Read a u32 length and then that many bytes."""
+        (size,) = _LENGTH.unpack(self.read(_LENGTH.size))
+        return self.read(size)
+
+    def at_end(self) -> bool:
+        """Check that no data is left."""
+        return self._pos == len(self._buffer) and not any(self._chunks)
+
+
+def iter_snapshot_keys(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Stream the records of a binary snapshot one at a time.
+
+    Keys with identical extras share the decoded values (e.g. one metadata
+    dict for every key with the same metadata); keys are never mutated in
+    place, so this only saves time and memory.
+
+    Args:
+        chunks: The snapshot, as an iterable of byte chunks
+
+    Returns:
+        Iterator over key dictionaries
+
+    Raises:
+        ValueError: If the snapshot is malformed, truncated or from a newer version
+    """
+    reader = ChunkReader(chunks)
+    if reader.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("Not a binary snapshot")
+    version, count, extras_count = _SNAPSHOT_HEADER.unpack(reader.read(_SNAPSHOT_HEADER.size))
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported binary snapshot version: {version}")
+
+    try:
+        extras = [json.loads(reader.read_sized()) for _ in range(extras_count)]
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Invalid binary snapshot extras: {e}") from None
+    if not all(isinstance(extra, dict) for extra in extras):
+        raise ValueError("Invalid binary snapshot extras: expected JSON objects")
+
+    for _ in range(count):
+        record = reader.read_sized()
+        try:
+            present, null, index = _RECORD_HEADER.unpack_from(record)
+            fields = _MASK_FIELDS[present]
+            text = record[_RECORD_HEADER.size:].decode("utf-8")
+            strings = text.split("\x00") if fields else []
+            if len(strings) != len(fields) or (text and not fields) or present & null:
+                raise ValueError("fields do not match the record masks")
+            key = dict.fromkeys(_MASK_FIELDS[present | null])
+            key.update(zip(fields, strings))
+            if index != _NO_EXTRAS:
+                key.update(extras[index])
+        except (struct.error, UnicodeDecodeError, IndexError, ValueError) as e:
+            raise ValueError(f"Invalid binary snapshot record: {e}") from None
+        yield key
+
+    if not reader.at_end():
+        raise ValueError("Unexpected data after the binary snapshot")
+
+
+def iter_keyring(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Stream the keys of a keyring document in either format.
+
+    Binary snapshots are recognized by SNAPSHOT_MAGIC, the way encrypted
+    objects are recognized by their header; anything else is parsed as a
+    keys.json document.
+
+    Args:
+        chunks: The plaintext document, as an iterable of byte chunks
+
+    Returns:
+        Iterator over key dictionaries
+
+    Raises:
+        ValueError: If the document is malformed
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(SNAPSHOT_MAGIC):
+            break
+    chunks = chain([head], chunks)
+    if head.startswith(SNAPSHOT_MAGIC):
+        return iter_snapshot_keys(chunks)
+    return iter_keys(chunks)
@@ -0,0 +1,123 @@
+"""gRPC verification service backed by the same KeyStore as the HTTP API."""
+
+import time
+from typing import AsyncIterator
+
+import grpc
+import structlog
+from google.protobuf.message import DecodeError
+
+from .proto.verify_pb2 import VerifyRequest, VerifyResponse
+from .stats import get_metrics
+from .storage import KeyStore, serialize_metadata
+from .verification import record_verification
+
+logger = structlog.get_logger()
+
+SERVICE_NAME = "heare_auth.v1.KeyVerifier"
+
+
+async def parse_request(data: bytes, context: grpc.aio.ServicerContext) -> VerifyRequest:
+    """
+    Parse a VerifyRequest, failing the call with INVALID_ARGUMENT if it is malformed.
+
+    Requests are parsed here rather than by a request_deserializer, which
+    would fail the call with UNKNOWN and the parser's exception.
+
+    Args:
+        data: Serialized VerifyRequest
+        context: Context of the call, aborted on a malformed request
+
+    Returns:
+        The parsed request
+    """
+    try:
+        return VerifyRequest.FromString(data)
+    except DecodeError:
+        get_metrics().incr('verify.malformed')
+        await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Malformed VerifyRequest")
+
+
+class KeyVerifierService:
+    """Implements the KeyVerifier service from proto/verify.proto."""
+
+    def __init__(self, store: KeyStore):
+        """
+        Initialize the service.
+
+        Args:
+            store: Key store shared with the HTTP API
+        """
+        self.store = store
+
+    def check(self, api_key: str, request_id: str, peer: str) -> VerifyResponse:
+        """
+        Verify one API key and build the response.
+
+        Args:
+            api_key: The API secret to verify
+            request_id: Caller-chosen id to echo back
+            peer: The gRPC peer, logged in place of a user agent
+
+        Returns:
+            The VerifyResponse
+        """
+        start_time = time.time()
+        snapshot = self.store.snapshot
+        key_data = snapshot.get_by_secret(api_key)
+        record_verification(snapshot, api_key, key_data, start_time, peer=peer, transport="grpc")
+
+        if key_data is None:
+            return VerifyResponse(valid=False, error="Invalid API key", request_id=request_id)
+
+        return VerifyResponse(
+            valid=True,
+            key_id=key_data.id,
+            name=key_data.name,
+            metadata_json=serialize_metadata(key_data.metadata).decode("utf-8"),
+            request_id=request_id,
+        )
+
+    async def verify(self, data: bytes, context) -> VerifyResponse:
+        """Handle the unary Verify RPC."""
+        request = await parse_request(data, context)
+        return self.check(request.api_key, request.request_id, context.peer())
+
+    async def verify_stream(self, request_iterator, context) -> AsyncIterator[VerifyResponse]:
+        """Handle the bidirectional VerifyStream RPC; a malformed request ends the stream."""
+        peer = context.peer()
+        async for data in request_iterator:
+            request = await parse_request(data, context)
+            yield self.check(request.api_key, request.request_id, peer)
+
+
+def create_server(store: KeyStore, address: str) -> grpc.aio.Server:
+    """
+    Create (but do not start) a gRPC server for the KeyVerifier service.
+
+    Must be called from within the running event loop that will serve it.
+
+    Args:
+        store: Key store shared with the HTTP API
+        address: Listen address, e.g. "0.0.0.0:50051"
+
+    Returns:
+        The configured gRPC server
+    """
+    service = KeyVerifierService(store)
+    handler = grpc.method_handlers_generic_handler(
+        SERVICE_NAME,
+        {
+            "Verify": grpc.unary_unary_rpc_method_handler(
+                service.verify, response_serializer=VerifyResponse.SerializeToString
+            ),
+            "VerifyStream": grpc.stream_stream_rpc_method_handler(
+                service.verify_stream, response_serializer=VerifyResponse.SerializeToString
+            ),
+        },
+    )
+
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(address)
+    return server
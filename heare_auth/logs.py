@@ -0,0 +1,182 @@
+"""Structured logging setup, including an asynchronous queue-backed mode."""
+
+import atexit
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from typing import BinaryIO, Deque, Optional
+
+import structlog
+
+from .fastjson import dumps
+
+# Overflow policies for the async log queue
+DROP_OLDEST = "drop_oldest"
+DROP_NEW = "drop_new"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEW)
+
+
+class AsyncLogWriter:
+    """
+    Render and write log events from a background thread.
+
+    Events are appended to a bounded in-memory queue and a writer thread drains
+    it every flush_interval seconds, rendering each event with fastjson.dumps
+    (orjson when installed) and writing each batch with a single write and
+    flush. When the queue is full, the overflow policy decides whether the
+    oldest queued event or the new event is discarded; either way the loss is
+    counted and reported as a log_events_dropped event. Events that cannot be
+    rendered are dropped and counted the same way.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[BinaryIO] = None,
+        max_queue: int = 10000,
+        overflow: str = DROP_OLDEST,
+        flush_interval: float = 0.1,
+    ):
+        """
+        Initialize the writer and start its thread.
+
+        Args:
+            stream: Binary stream to write to (defaults to stdout)
+            max_queue: Maximum number of queued events
+            overflow: Overflow policy, one of OVERFLOW_POLICIES
+            flush_interval: Seconds between writes
+
+        Raises:
+            ValueError: If the overflow policy is unknown
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        # With drop_oldest the deque itself evicts from the left when full
+        self._queue: Deque[dict] = deque(maxlen=max_queue if overflow == DROP_OLDEST else None)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="heare-auth-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event_dict: dict) -> None:
+        """
+        Queue an event for writing. Never blocks.
+
+        Args:
+            event_dict: The structlog event dictionary
+        """
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if self.overflow == DROP_NEW:
+                return
+        self._queue.append(event_dict)
+
+    def _drain(self) -> None:
+        queue = self._queue
+        lines = []
+        for _ in range(len(queue)):
+            event_dict = queue.popleft()
+            try:
+                lines.append(dumps(event_dict))
+            except Exception:
+                # e.g. a key that is not a str; drop the event, not the thread
+                self.dropped += 1
+
+        dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(
+                dumps({"event": "log_events_dropped", "count": dropped, "level": "warning"})
+            )
+
+        if lines:
+            try:
+                self.stream.write(b"\n".join(lines) + b"\n")
+                self.stream.flush()
+            except Exception:
+                pass  # Nowhere left to report a logging failure
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            self._drain()
+        self._drain()
+
+    def close(self) -> None:
+        """Stop the writer thread after writing everything queued."""
+        self._stop.set()
+        self._thread.join()
+
+
+class QueueLogger:
+    """structlog logger that hands event dicts to an AsyncLogWriter."""
+
+    def __init__(self, writer: AsyncLogWriter):
+        self._writer = writer
+
+    def msg(self, event_dict: dict) -> None:
+        self._writer.submit(event_dict)
+
+    log = debug = info = warn = warning = err = error = critical = exception = fatal = msg
+
+
+class QueueLoggerFactory:
+    """Create QueueLoggers that share one writer."""
+
+    def __init__(self, writer: AsyncLogWriter):
+        self._writer = writer
+
+    def __call__(self, *args) -> QueueLogger:
+        return QueueLogger(self._writer)
+
+
+def _enqueue(logger, method_name: str, event_dict: dict):
+    """Final processor that passes the event dict to the logger unrendered."""
+    return (event_dict,), {}
+
+
+def configure_logging() -> Optional[AsyncLogWriter]:
+    """
+    Configure structlog for JSON output.
+
+    LOG_MODE=sync (default) renders and prints each event on the calling
+    thread. LOG_MODE=async queues events for a background writer thread,
+    configured by LOG_QUEUE_SIZE and LOG_OVERFLOW (drop_oldest or drop_new).
+
+    Returns:
+        The async writer, or None in sync mode
+    """
+    processors = [
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+    ]
+
+    if os.getenv("LOG_MODE", "sync").lower() == "async":
+        writer = AsyncLogWriter(
+            max_queue=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            overflow=os.getenv("LOG_OVERFLOW", DROP_OLDEST).lower(),
+        )
+        atexit.register(writer.close)
+        structlog.configure(
+            processors=processors + [_enqueue],
+            wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+            context_class=dict,
+            logger_factory=QueueLoggerFactory(writer),
+            cache_logger_on_first_use=True,
+        )
+        return writer
+
+    structlog.configure(
+        processors=processors + [structlog.processors.JSONRenderer()],
+        wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
+        context_class=dict,
+        logger_factory=structlog.PrintLoggerFactory(),
+        cache_logger_on_first_use=False,
+    )
+    return None
@@ -1,85 +1,468 @@
 """FastAPI server for API key verification."""
 
-import logging
+import asyncio
+import json
 import os
+import random
 import time
+import uuid
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import quote
 
 import structlog
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 
-from .models import RefreshResponse, VerifyRequest, VerifyResponse
-from .stats import get_stats_client
+from . import fastjson
+from .logs import configure_logging
+from .models import (
+    RefreshJobResponse,
+    RefreshResponse,
+    VerifyBatchRequest,
+    VerifyBatchResponse,
+    VerifyRequest,
+    VerifyResponse,
+)
+from .stats import get_metrics
 from .storage import KeyStore
+from .verification import record_verification
+from .workers import send_command, serve_control, stop_control, worker_pids
 
-# Configure structlog for JSON output
-structlog.configure(
-    processors=[
-        structlog.contextvars.merge_contextvars,
-        structlog.processors.add_log_level,
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer(),
-    ],
-    wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
-    context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    cache_logger_on_first_use=False,
-)
+# Configure structlog for JSON output (LOG_MODE=async moves writes off the event loop)
+configure_logging()
 
 logger = structlog.get_logger()
 
+# Pre-serialized batch result for an invalid key
+INVALID_KEY_RESULT = VerifyResponse(valid=False, error="Invalid API key").model_dump_json().encode()
+# Pre-serialized 403 body, matching HTTPException(detail=...) from /verify
+INVALID_KEY_ERROR = fastjson.dumps({"detail": {"valid": False, "error": "Invalid API key"}})
+
+# Header-based verification (/auth) for nginx auth_request and Envoy ext_authz
+AUTH_HEADER = os.getenv("AUTH_HEADER", "authorization").lower()
+AUTH_METADATA_HEADERS = [
+    field.strip() for field in os.getenv("AUTH_METADATA_HEADERS", "").split(",") if field.strip()
+]
+AUTH_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+# Printable ASCII other than "%" passes through; everything else is percent-encoded
+HEADER_SAFE_CHARS = "".join(chr(c) for c in range(0x20, 0x7F) if chr(c) != "%")
+
+# Serve POST /verify from a raw ASGI middleware instead of the FastAPI route
+FAST_VERIFY = os.getenv("FAST_VERIFY", "").lower() in ("1", "true", "yes")
+# Larger bodies are handed to FastAPI to produce its usual error responses
+FAST_VERIFY_MAX_BODY = 64 * 1024
+
+# Serve the gRPC KeyVerifier service on this port alongside HTTP (requires heare-auth[grpc])
+GRPC_PORT = os.getenv("GRPC_PORT")
+
+# Background S3 polling (seconds between polls, 0 disables it)
+REFRESH_POLL_INTERVAL = float(os.getenv("REFRESH_POLL_INTERVAL", "0"))
+REFRESH_POLL_JITTER = float(os.getenv("REFRESH_POLL_JITTER", "0.1"))
+REFRESH_POLL_MAX_BACKOFF = float(os.getenv("REFRESH_POLL_MAX_BACKOFF", "300"))
+
+# Seconds between attempts to revalidate a keyring served from the local cache
+CACHE_REVALIDATE_INTERVAL = float(os.getenv("CACHE_REVALIDATE_INTERVAL", "5"))
+
+# Minimum seconds between full rewrites of the local cache and the shared index
+# after keyring changes, so a stream of small changes does not rewrite them each time
+CACHE_WRITE_INTERVAL = float(os.getenv("CACHE_WRITE_INTERVAL", "30"))
+SHARED_INDEX_WRITE_INTERVAL = float(os.getenv("SHARED_INDEX_WRITE_INTERVAL", "1"))
+
+# Seconds between checks for a new shared index (SHARED_INDEX_PATH) by workers that
+# do not load from S3
+SHARED_INDEX_POLL_INTERVAL = float(os.getenv("SHARED_INDEX_POLL_INTERVAL", "1"))
+
+# Control sockets through which a refresh on one worker reaches its siblings
+WORKER_CONTROL_DIR = os.getenv("WORKER_CONTROL_DIR") or None
+WORKER_REFRESH_TIMEOUT = float(os.getenv("WORKER_REFRESH_TIMEOUT", "60"))
+
 # Initialize key store
 store = KeyStore(
     bucket=os.getenv("S3_BUCKET", ""),
     key=os.getenv("S3_KEY", "keys.json"),
     region=os.getenv("S3_REGION", "us-east-1"),
     storage_secret=os.getenv("STORAGE_SECRET"),
+    fetch_workers=int(os.getenv("SHARD_FETCH_WORKERS", "8")),
+    change_log=os.getenv("CHANGE_LOG", "").lower() in ("1", "true", "yes"),
+    cache_path=os.getenv("CACHE_PATH") or None,
+    compression=os.getenv("STORAGE_COMPRESSION") or None,
+    encryption=os.getenv("STORAGE_ENCRYPTION", "fernet"),
+    index_path=os.getenv("SHARED_INDEX_PATH") or None,
+    compiled_index=os.getenv("COMPILED_INDEX", "").lower() in ("1", "true", "yes"),
+    cache_write_interval=CACHE_WRITE_INTERVAL,
+    index_write_interval=SHARED_INDEX_WRITE_INTERVAL,
 )
 
+# Upper bound on how long the expiry task sleeps, so keys loaded by a refresh
+# with an earlier deadline are still removed promptly
+EXPIRY_SWEEP_MAX_INTERVAL = 60.0
+
+# Seconds the expiry task waits past the next deadline, so keys expiring within
+# this window are removed by one sweep instead of one sweep each
+EXPIRY_SWEEP_WINDOW = 5.0
+
+
+def expiry_sweep_delay(next_expiry: Optional[float]) -> float:
+    """
+    Compute the wait before the next expiry sweep.
+
+    Each sweep copies the indexes, so sweeps are at least EXPIRY_SWEEP_WINDOW
+    apart (unless that exceeds EXPIRY_SWEEP_MAX_INTERVAL) however close
+    together the deadlines are. Lookups reject expired keys in the meantime.
+
+    Args:
+        next_expiry: Earliest expiry still in the indexes, or None
+
+    Returns:
+        Seconds to wait
+    """
+    if next_expiry is None:
+        return EXPIRY_SWEEP_MAX_INTERVAL
+    delay = max(next_expiry - time.time(), 0.0) + EXPIRY_SWEEP_WINDOW
+    return min(delay, EXPIRY_SWEEP_MAX_INTERVAL)
+
+
+async def expire_keys_loop():
+    """
+    Remove expired keys from the in-memory indexes as their deadlines pass.
+
+    A failed sweep is logged and counted, and retried after the longest
+    sweep interval; lookups reject expired keys in the meantime.
+    """
+    metrics = get_metrics()
+    while True:
+        delay = EXPIRY_SWEEP_MAX_INTERVAL
+        try:
+            removed = await asyncio.to_thread(store.remove_expired)
+            if removed:
+                logger.info("keys_expired", keys_removed=removed)
+            delay = expiry_sweep_delay(store.next_expiry())
+        except Exception as e:
+            logger.error("expiry_sweep_failed", error=str(e))
+            metrics.incr('expiry.failed')
+        await asyncio.sleep(delay)
+
+
+def poll_delay(
+    interval: float,
+    failures: int = 0,
+    jitter: float = REFRESH_POLL_JITTER,
+    max_backoff: float = REFRESH_POLL_MAX_BACKOFF,
+) -> float:
+    """
+    Compute the wait before the next S3 poll.
+
+    The interval doubles with each consecutive failure, capped at max_backoff,
+    and is spread by +/- jitter (a fraction) so replicas do not poll in step.
+
+    Args:
+        interval: Base seconds between polls
+        failures: Number of consecutive failed polls
+        jitter: Fraction of the delay to randomize by
+        max_backoff: Upper bound on the backed-off delay
+
+    Returns:
+        Seconds to wait
+    """
+    delay = interval
+    if failures:
+        delay = max(interval, min(interval * 2 ** failures, max_backoff))
+    return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+async def poll_s3_loop(interval: float):
+    """
+    Poll S3 for keyring changes and reload when the object changed.
+
+    Each poll is a conditional GET (see KeyStore.load_from_s3), so an
+    unchanged keyring costs one 304 response and no parsing.
+    """
+    metrics = get_metrics()
+    failures = 0
+    while True:
+        await asyncio.sleep(poll_delay(interval, failures))
+
+        start_time = time.time()
+        try:
+            count = await asyncio.to_thread(store.load_from_s3)
+        except Exception as e:
+            failures += 1
+            logger.error("poll_failed", error=str(e), consecutive_failures=failures)
+            metrics.incr('poll.failed')
+        else:
+            failures = 0
+            metrics.incr('poll.success')
+            if store.last_load_changed:
+                logger.info("poll_reloaded", keys_loaded=count)
+                metrics.incr('poll.changed')
+                metrics.gauge('keys.count', count)
+            _check_local_writes()
+        metrics.time('poll.duration', (time.time() - start_time) * 1000)
+
+        # Seconds since S3 was last successfully checked
+        if store.last_synced_at is not None:
+            metrics.gauge('snapshot.staleness', time.time() - store.last_synced_at)
+
+
+def _check_local_writes() -> None:
+    """Report a failed cache or shared index write from the last load; the load itself succeeded."""
+    if store.cache_error:
+        logger.warning("cache_write_failed", error=store.cache_error)
+        get_metrics().incr('cache.write_failed')
+    if store.index_error:
+        logger.warning("index_write_failed", error=store.index_error)
+        get_metrics().incr('index.write_failed')
+
+
+async def revalidate_cache_loop(interval: float = CACHE_REVALIDATE_INTERVAL):
+    """
+    Check a keyring served from the local cache against S3 until S3 answers.
+
+    The cached ETag makes the first attempt a conditional GET, so an
+    unchanged keyring costs one 304. Failed attempts back off like polls
+    while the cached keyring keeps serving. A keyring served from the
+    shared index is checked the same way, with a full GET.
+    """
+    metrics = get_metrics()
+    failures = 0
+    while True:
+        try:
+            count = await asyncio.to_thread(store.load_from_s3)
+        except Exception as e:
+            failures += 1
+            logger.error("cache_revalidate_failed", error=str(e), consecutive_failures=failures)
+            metrics.incr('cache.revalidate_failed')
+            metrics.gauge('cache.age', time.time() - store.last_synced_at)
+            await asyncio.sleep(poll_delay(interval, failures))
+            continue
+
+        logger.info("cache_revalidated", keys_loaded=count, changed=store.last_load_changed)
+        metrics.incr('cache.revalidated')
+        metrics.gauge('keys.count', count)
+        _check_local_writes()
+        return
+
+
+async def flush_local_copies_loop():
+    """
+    Write the local cache and shared index once changes deferred by their
+    write intervals are due (see KeyStore.flush_local_copies).
+    """
+    intervals = []
+    if store.cache_path:
+        intervals.append(store.cache_write_interval)
+    if store.index_path:
+        intervals.append(store.index_write_interval)
+    interval = max(min(intervals), 0.1)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(store.flush_local_copies)
+        except Exception as e:
+            logger.error("local_copies_flush_failed", error=str(e))
+        else:
+            _check_local_writes()
+
+
+def is_index_follower() -> bool:
+    """Whether another worker loads from S3 and this one serves the shared index it writes."""
+    return store.index_path is not None and not store.index_leader
+
+
+def reload_keys() -> int:
+    """
+    Reload the keyring: from S3, or from the shared index if another worker loads it.
+
+    Blocking; run it in a worker thread.
+
+    Returns:
+        Number of keys loaded
+
+    Raises:
+        ValueError: If a follower finds no shared index
+    """
+    if is_index_follower():
+        count = store.load_index()
+        if count is None:
+            raise ValueError(f"No shared index at {store.index_path}")
+        return count
+    return store.load_from_s3()
+
+
+# Tasks started by the lifespan, or by a follower that takes over loading
+background_tasks = []
+
+
+def _start_loading_tasks(revalidate: bool) -> None:
+    """Start the tasks of the worker that loads from S3."""
+    if revalidate:
+        background_tasks.append(asyncio.create_task(revalidate_cache_loop()))
+    if REFRESH_POLL_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(poll_s3_loop(REFRESH_POLL_INTERVAL)))
+    if store.cache_path or store.index_path:
+        background_tasks.append(asyncio.create_task(flush_local_copies_loop()))
+
+
+async def _wait_for_index(interval: float = 0.1):
+    """
+    Wait for the worker holding the index lock to write the shared index.
+
+    Returns:
+        Number of keys in the index, or None if this worker took the lock
+        over (the holder exited) and should load from S3 itself
+    """
+    while True:
+        try:
+            count = await asyncio.to_thread(store.load_index)
+        except ValueError as e:
+            # e.g. written by an older version; the holder will replace it
+            logger.error("index_load_failed", error=str(e))
+            get_metrics().incr('index.load_failed')
+        else:
+            if count is not None:
+                return count
+        if store.acquire_index_lock():
+            return None
+        await asyncio.sleep(interval)
+
+
+async def follow_index_loop(interval: float = SHARED_INDEX_POLL_INTERVAL):
+    """
+    Serve each new shared index as it is written, and take over loading if
+    the worker holding the index lock exits.
+
+    Checking for a new index costs one stat; a new one is mapped, not parsed.
+    """
+    metrics = get_metrics()
+    while True:
+        await asyncio.sleep(interval)
+
+        if store.acquire_index_lock():
+            logger.info("index_lock_acquired", generation=store.generation)
+            metrics.incr('index.lock_acquired')
+            _start_loading_tasks(revalidate=True)
+            return
+
+        try:
+            count = await asyncio.to_thread(store.load_index)
+        except Exception as e:
+            logger.error("index_load_failed", error=str(e))
+            metrics.incr('index.load_failed')
+            continue
+        if store.last_load_changed:
+            logger.info("index_loaded", keys_loaded=count, generation=store.generation)
+            metrics.incr('index.loaded')
+            metrics.gauge('keys.count', count)
+
+
+async def _load_last_known():
+    """
+    Publish the shared index or local cache, whichever is available, without contacting S3.
+
+    Returns:
+        Number of keys loaded, or None if neither is available
+    """
+    metrics = get_metrics()
+    if store.index_path:
+        try:
+            count = await asyncio.to_thread(store.load_index)
+        except Exception as e:
+            logger.error("index_load_failed", error=str(e))
+            metrics.incr('index.load_failed')
+        else:
+            if count is not None:
+                return count
+    try:
+        return await asyncio.to_thread(store.load_cache)
+    except Exception as e:
+        logger.error("cache_load_failed", error=str(e))
+        metrics.incr('cache.load_failed')
+        return None
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown."""
     # Startup
     start_time = time.time()
-    stats_client = get_stats_client()
-    
-    try:
-        count = store.load_from_s3()
-        logger.info("startup", keys_loaded=count)
-        
-        # Track startup metrics
-        if stats_client:
-            try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('startup.success')
-                    pipe.gauge('keys.count', count)
-                    pipe.time('startup.duration', (time.time() - start_time) * 1000)
-            except Exception:
-                pass
-    except Exception as e:
-        logger.error("startup_failed", error=str(e))
-        
-        # Track startup failure
-        if stats_client:
+    metrics = get_metrics()
+
+    # With a shared index only the worker holding its lock loads from S3
+    follower = False
+    if store.index_path and not store.acquire_index_lock():
+        count = await _wait_for_index()
+        follower = count is not None
+        if follower:
+            logger.info("startup_from_index", keys_loaded=count, generation=store.generation)
+            metrics.incr('startup.index')
+            metrics.gauge('keys.count', count)
+            metrics.time('startup.duration', (time.time() - start_time) * 1000)
+
+    # Serve the last known good keyring right away, then check S3 in the background
+    cached = None
+    if not follower:
+        cached = await _load_last_known()
+        if cached is not None:
+            cache_age = time.time() - store.last_synced_at
+            logger.info("startup_from_cache", keys_loaded=cached, cache_age=round(cache_age, 1))
+            metrics.incr('startup.cache')
+            metrics.gauge('keys.count', cached)
+            metrics.gauge('cache.age', cache_age)
+            metrics.time('startup.duration', (time.time() - start_time) * 1000)
+            _check_local_writes()
+        else:
             try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('startup.failed')
-            except Exception:
-                pass
-        
-        raise
+                count = store.load_from_s3()
+                logger.info("startup", keys_loaded=count)
+
+                # Track startup metrics
+                metrics.incr('startup.success')
+                metrics.gauge('keys.count', count)
+                metrics.time('startup.duration', (time.time() - start_time) * 1000)
+            except Exception as e:
+                logger.error("startup_failed", error=str(e))
+
+                # Track startup failure
+                metrics.incr('startup.failed')
+                await metrics.flush()
+
+                raise
+            _check_local_writes()
+
+    metrics.start()
+    if follower:
+        background_tasks.append(asyncio.create_task(follow_index_loop()))
+    else:
+        _start_loading_tasks(revalidate=cached is not None)
+    background_tasks.append(asyncio.create_task(expire_keys_loop()))
+
+    control_server = None
+    if WORKER_CONTROL_DIR:
+        control_server = await serve_control(WORKER_CONTROL_DIR, handle_control)
+
+    grpc_server = None
+    if GRPC_PORT:
+        from .grpc_server import create_server
+
+        grpc_server = create_server(store, f"[::]:{GRPC_PORT}")
+        await grpc_server.start()
+        logger.info("grpc_started", port=int(GRPC_PORT))
 
     yield
 
     # Shutdown
-    if stats_client:
-        try:
-            with stats_client.pipeline() as pipe:
-                pipe.incr('shutdown')
-        except Exception:
-            pass
+    if grpc_server is not None:
+        await grpc_server.stop(grace=5)
+    if control_server is not None:
+        await stop_control(control_server, WORKER_CONTROL_DIR)
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    metrics.incr('shutdown')
+    await metrics.stop()
 
 
 # Initialize FastAPI app
@@ -109,80 +492,178 @@ async def verify(request: VerifyRequest, http_request: Request):
     """
     start_time = time.time()
     user_agent = http_request.headers.get("user-agent", "unknown")
-    
-    # Get stats client
-    stats_client = get_stats_client()
 
-    # Look up by secret
-    key_data = store.get_by_secret(request.api_key)
+    # Look up by secret, using one snapshot for the whole request
+    snapshot = store.snapshot
+    key_data = snapshot.get_by_secret(request.api_key)
+    record_verification(snapshot, request.api_key, key_data, start_time, user_agent=user_agent)
 
     if key_data is None:
-        logger.warning(
-            "verification_failed",
-            secret_prefix=request.api_key[:4] if len(request.api_key) >= 4 else "***",
-            user_agent=user_agent,
-        )
-        
-        # Track failed verification
-        if stats_client:
-            try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('verify.requests')
-                    pipe.incr('verify.failed')
-                    pipe.time('verify.duration', (time.time() - start_time) * 1000)
-            except Exception:
-                pass  # Don't let metrics failures affect the API
-        
         raise HTTPException(status_code=403, detail={"valid": False, "error": "Invalid API key"})
 
-    # Log successful verification with key_id (NOT secret)
+    # Body was serialized at load time; VerifyResponse documents its schema
+    return Response(
+        content=snapshot.get_verify_response(request.api_key, key_data),
+        media_type="application/json",
+    )
+
+
+def _secret_from_headers(http_request: Request) -> str:
+    """
+    Extract the API secret from request headers.
+
+    Reads AUTH_HEADER if it is set to a custom header, then falls back to
+    "Authorization: Bearer <secret>".
+
+    Args:
+        http_request: The HTTP request object
+
+    Returns:
+        The secret, or an empty string if none was sent
+    """
+    if AUTH_HEADER != "authorization":
+        secret = http_request.headers.get(AUTH_HEADER, "").strip()
+        if secret:
+            return secret
+
+    scheme, _, secret = http_request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return ""
+    return secret.strip()
+
+
+def _header_value(value) -> str:
+    """Render a value as a single-line, latin-1 safe header value."""
+    if not isinstance(value, str):
+        value = json.dumps(value, separators=(",", ":"))
+    return quote(value, safe=HEADER_SAFE_CHARS)
+
+
+@app.api_route("/auth", methods=AUTH_METHODS, include_in_schema=False)
+@app.api_route("/auth/{path:path}", methods=AUTH_METHODS, include_in_schema=False)
+async def auth(http_request: Request):
+    """
+    Verify an API key sent in request headers, for use as a proxy subrequest.
+
+    Works as an nginx auth_request target or an Envoy ext_authz HTTP service:
+    any method and any path under /auth is accepted and the body is ignored.
+
+    Args:
+        http_request: The HTTP request object
+
+    Returns:
+        Empty 200 response with X-Auth-Key-Id, X-Auth-Key-Name and one
+        X-Auth-Meta-<field> header per AUTH_METADATA_HEADERS entry, or an
+        empty 403 response if the API key is missing or invalid
+    """
+    start_time = time.time()
+    user_agent = http_request.headers.get("user-agent", "unknown")
+
+    secret = _secret_from_headers(http_request)
+    snapshot = store.snapshot
+    key_data = snapshot.get_by_secret(secret) if secret else None
+    record_verification(snapshot, secret, key_data, start_time, user_agent=user_agent)
+
+    if key_data is None:
+        return Response(status_code=403)
+
+    headers = {
+        "X-Auth-Key-Id": key_data.id,
+        "X-Auth-Key-Name": _header_value(key_data.name),
+    }
+    metadata = key_data.metadata or {}
+    for field in AUTH_METADATA_HEADERS:
+        if field in metadata:
+            headers[f"X-Auth-Meta-{field}"] = _header_value(metadata[field])
+
+    return Response(status_code=200, headers=headers)
+
+
+@app.post("/verify/batch", response_model=VerifyBatchResponse)
+async def verify_batch(request: VerifyBatchRequest, http_request: Request):
+    """
+    Verify many API keys in one request.
+
+    Invalid keys do not fail the request; each gets its own result.
+
+    Args:
+        request: The batch request containing the API keys
+        http_request: The HTTP request object
+
+    Returns:
+        One verification response per API key, in request order
+    """
+    start_time = time.time()
+    user_agent = http_request.headers.get("user-agent", "unknown")
+
+    metrics = get_metrics()
+
+    results = []
+    key_ids = []
+    snapshot = store.snapshot
+    for api_key in request.api_keys:
+        key_data = snapshot.get_by_secret(api_key)
+        if key_data is None:
+            results.append(INVALID_KEY_RESULT)
+            continue
+
+        key_ids.append(key_data.id)
+        results.append(snapshot.get_verify_response(api_key, key_data))
+
+    succeeded = len(key_ids)
+    failed = len(results) - succeeded
+
+    # Log one summary per batch with key_ids (NOT secrets)
     logger.info(
-        "verification_success",
-        key_id=key_data["id"],
-        key_name=key_data["name"],
+        "verification_batch",
+        keys_checked=len(results),
+        keys_valid=succeeded,
+        keys_invalid=failed,
+        key_ids=key_ids,
         user_agent=user_agent,
+        generation=snapshot.generation,
     )
     
-    # Track successful verification
-    if stats_client:
-        try:
-            with stats_client.pipeline() as pipe:
-                pipe.incr('verify.requests')
-                pipe.incr('verify.success')
-                pipe.time('verify.duration', (time.time() - start_time) * 1000)
-        except Exception:
-            pass  # Don't let metrics failures affect the API
-
-    return VerifyResponse(
-        valid=True,
-        key_id=key_data["id"],
-        name=key_data["name"],
-        metadata=key_data.get("metadata", {}),
+    # Track the whole batch
+    metrics.incr('verify.batch.requests')
+    metrics.incr('verify.batch.keys', len(results))
+    metrics.incr('verify.success', succeeded)
+    metrics.incr('verify.failed', failed)
+    metrics.time('verify.batch.duration', (time.time() - start_time) * 1000)
+
+    # Join the pre-serialized results; VerifyBatchResponse documents the schema
+    return Response(
+        content=b'{"results":[' + b",".join(results) + b"]}",
+        media_type="application/json",
     )
 
 
-@app.post("/refresh", response_model=RefreshResponse)
-async def refresh(request: Request):
+def _is_unix_socket_request(request: Request) -> bool:
+    """Check whether a request arrived over a Unix domain socket listener."""
+    # uvicorn reports a UDS listener as (path, None) instead of (host, port)
+    server = request.scope.get("server")
+    return server is not None and server[1] is None
+
+
+def _check_localhost(request: Request) -> None:
     """
-    Refresh keys from S3. Only accessible from localhost.
+    Reject requests that did not come from localhost.
 
     Args:
         request: The HTTP request object
 
-    Returns:
-        Refresh response with number of keys loaded
-
     Raises:
         HTTPException: 403 if not accessed from localhost
     """
-    start_time = time.time()
-    stats_client = get_stats_client()
-    
-    # Check if request is from localhost
+    # Check if request is from localhost (a Unix domain socket peer always is)
     client_host = request.client.host if request.client else None
     forwarded_for = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
 
-    if client_host not in ("127.0.0.1", "localhost", None) and forwarded_for not in (
+    if not _is_unix_socket_request(request) and client_host not in (
+        "127.0.0.1",
+        "localhost",
+        None,
+    ) and forwarded_for not in (
         "127.0.0.1",
         "localhost",
         "",
@@ -190,51 +671,307 @@ async def refresh(request: Request):
         logger.warning("refresh_rejected", client_host=client_host, forwarded_for=forwarded_for)
         
         # Track rejected refresh
-        if stats_client:
-            try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('refresh.requests')
-                    pipe.incr('refresh.rejected')
-            except Exception:
-                pass
+        metrics = get_metrics()
+        metrics.incr('refresh.requests')
+        metrics.incr('refresh.rejected')
         
         raise HTTPException(
             status_code=403, detail={"error": "Refresh endpoint only accessible from localhost"}
         )
 
-    try:
-        count = store.load_from_s3()
-        logger.info("refresh_success", keys_loaded=count)
-        
-        # Track successful refresh
-        if stats_client:
-            try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('refresh.requests')
-                    pipe.incr('refresh.success')
-                    pipe.gauge('keys.count', count)
-                    pipe.time('refresh.duration', (time.time() - start_time) * 1000)
-            except Exception:
-                pass
-
-        return RefreshResponse(
-            success=True,
-            keys_loaded=count,
-            timestamp=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+
+def _utc_timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+# Finished refresh jobs kept for GET /refresh/{job_id}; the oldest are forgotten first
+MAX_REFRESH_JOBS = 100
+
+
+class RefreshJob:
+    """A reload of the keyring from S3 running in a worker thread."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "running"
+        self.started_at = _utc_timestamp()
+        self.finished_at = None
+        self.keys_loaded = None
+        self.changed = None
+        self.generation = None
+        self.error = None
+        self.workers = []  # Per-worker outcomes of a fan-out job
+        self.task = None
+
+    def to_response(self) -> RefreshJobResponse:
+        return RefreshJobResponse(
+            job_id=self.id,
+            status=self.status,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            keys_loaded=self.keys_loaded,
+            changed=self.changed,
+            generation=self.generation,
+            error=self.error,
+            workers=self.workers,
         )
+
+    def worker_result(self) -> dict:
+        """This worker's outcome, as reported to the worker running a fan-out job."""
+        return {
+            "pid": os.getpid(),
+            "success": self.status == "succeeded",
+            "keys_loaded": self.keys_loaded,
+            "changed": self.changed,
+            "generation": self.generation,
+            "error": self.error,
+        }
+
+
+refresh_jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+# Running job of each kind, keyed by whether it fans out to sibling workers
+_current_refresh = {}
+
+
+async def _run_refresh(job: RefreshJob) -> None:
+    """
+    Load the keyring from S3 off the event loop and record the outcome on the job.
+
+    Download, decryption, parsing and indexing all happen in a worker thread
+    and the new snapshot is published with one reference swap, so /verify
+    keeps answering from the previous snapshot while the refresh runs.
+    """
+    start_time = time.time()
+    metrics = get_metrics()
+    metrics.incr('refresh.requests')
+
+    try:
+        count = await asyncio.to_thread(reload_keys)
     except Exception as e:
-        logger.error("refresh_failed", error=str(e))
+        job.status = "failed"
+        job.error = str(e)
+        logger.error("refresh_failed", error=str(e), job_id=job.id)
         
         # Track failed refresh
-        if stats_client:
-            try:
-                with stats_client.pipeline() as pipe:
-                    pipe.incr('refresh.requests')
-                    pipe.incr('refresh.failed')
-            except Exception:
-                pass
+        metrics.incr('refresh.failed')
+    else:
+        job.status = "succeeded"
+        job.keys_loaded = count
+        job.changed = store.last_load_changed
+        job.generation = store.generation
+        logger.info(
+            "refresh_success",
+            keys_loaded=count,
+            changed=job.changed,
+            generation=job.generation,
+            job_id=job.id,
+        )
         
-        raise HTTPException(status_code=500, detail={"error": f"Failed to refresh keys: {str(e)}"})
+        # Track successful refresh
+        metrics.incr('refresh.success')
+        if not job.changed:
+            metrics.incr('refresh.unchanged')
+        metrics.gauge('keys.count', count)
+        metrics.time('refresh.duration', (time.time() - start_time) * 1000)
+        _check_local_writes()
+    finally:
+        job.finished_at = _utc_timestamp()
+
+
+async def _refresh_worker(pid: int):
+    """
+    Have a sibling worker reload through its control socket.
+
+    Returns:
+        The worker's outcome, or None if it has exited
+    """
+    try:
+        return await send_command(WORKER_CONTROL_DIR, pid, "refresh", WORKER_REFRESH_TIMEOUT)
+    except Exception as e:
+        return {"pid": pid, "success": False, "error": str(e) or type(e).__name__}
+
+
+async def _run_fan_out(job: RefreshJob) -> None:
+    """
+    Reload this worker and every sibling worker, recording each outcome on the job.
+
+    With a shared index the worker holding its lock reloads first, so the
+    others then map the index it wrote; otherwise every worker loads from
+    S3 at once. The job's own outcome is this worker's.
+    """
+    pid = os.getpid()
+    loader = store.index_lock_holder()
+    siblings = [p for p in worker_pids(WORKER_CONTROL_DIR) if p not in (pid, loader)]
+
+    local = None
+
+    async def refresh_self() -> dict:
+        nonlocal local
+        local = start_refresh()
+        await asyncio.shield(local.task)
+        return local.worker_result()
+
+    try:
+        results = []
+        if loader == pid:
+            results.append(await refresh_self())
+        elif loader is not None:
+            results.append(await _refresh_worker(loader))
+        rest = [_refresh_worker(p) for p in siblings]
+        if loader != pid:
+            rest.append(refresh_self())
+        results.extend(await asyncio.gather(*rest))
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        logger.error("refresh_fan_out_failed", error=str(e), job_id=job.id)
+    else:
+        for field in ("status", "keys_loaded", "changed", "generation", "error"):
+            setattr(job, field, getattr(local, field))
+        job.workers = sorted((r for r in results if r is not None), key=lambda r: r["pid"])
+        failed = [r["pid"] for r in job.workers if not r["success"]]
+        logger.info(
+            "refresh_fan_out", workers=len(job.workers), failed_workers=failed, job_id=job.id
+        )
+        if failed:
+            get_metrics().incr('refresh.workers_failed', len(failed))
+    finally:
+        job.finished_at = _utc_timestamp()
+
+
+def start_refresh(fan_out: bool = False) -> RefreshJob:
+    """
+    Start a refresh job, or return the one of the same kind already running.
+
+    Concurrent refresh requests share a single in-flight job instead of
+    downloading and parsing the keyring several times over. A fan-out job
+    also has every sibling worker with a socket in WORKER_CONTROL_DIR
+    reload; this worker's own reload is a local job, so a sibling's
+    fan-out never waits on this one.
+
+    Args:
+        fan_out: Reload every worker, not just this one
+
+    Returns:
+        The running refresh job
+    """
+    current = _current_refresh.get(fan_out)
+    if current is not None and current.status == "running":
+        return current
+
+    job = RefreshJob()
+    job.task = asyncio.create_task(_run_fan_out(job) if fan_out else _run_refresh(job))
+    _current_refresh[fan_out] = job
+
+    refresh_jobs[job.id] = job
+    while len(refresh_jobs) > MAX_REFRESH_JOBS:
+        refresh_jobs.popitem(last=False)
+    return job
+
+
+async def handle_control(command: str) -> dict:
+    """
+    Run a command sent by a sibling worker over this worker's control socket.
+
+    Args:
+        command: "refresh" to reload this worker
+
+    Returns:
+        This worker's outcome
+    """
+    if command != "refresh":
+        return {"pid": os.getpid(), "success": False, "error": f"Unknown command: {command}"}
+    job = start_refresh()
+    await asyncio.shield(job.task)
+    return job.worker_result()
+
+
+@app.post(
+    "/refresh",
+    response_model=RefreshResponse,
+    responses={202: {"model": RefreshJobResponse}},
+)
+async def refresh(request: Request, wait: bool = True):
+    """
+    Refresh keys from S3. Only accessible from localhost.
+
+    The reload runs in a worker thread either way. With wait=false the job is
+    started and 202 Accepted is returned immediately with its job ID and a
+    Location header for GET /refresh/{job_id}. With WORKER_CONTROL_DIR every
+    worker process reloads, and success is false unless all of them did.
+    Without it, a worker serving the shared index cannot reach the worker
+    that loads from S3, so the refresh is refused rather than reported as
+    done.
+
+    Args:
+        request: The HTTP request object
+        wait: Whether to wait for the refresh to finish
+
+    Returns:
+        Refresh response with number of keys loaded, or the job if not waiting
+
+    Raises:
+        HTTPException: 403 if not accessed from localhost
+        HTTPException: 409 if this worker does not load from S3 and cannot
+            reach the one that does
+        HTTPException: 500 if the refresh failed on this worker
+    """
+    _check_localhost(request)
+    if WORKER_CONTROL_DIR is None and is_index_follower():
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "error": "Refresh must reach the worker loading from S3; set WORKER_CONTROL_DIR"
+            },
+        )
+
+    job = start_refresh(fan_out=WORKER_CONTROL_DIR is not None)
+    if not wait:
+        return JSONResponse(
+            status_code=202,
+            content=job.to_response().model_dump(),
+            headers={"Location": f"/refresh/{job.id}"},
+        )
+
+    # Shield the job so a client disconnect does not cancel the load
+    await asyncio.shield(job.task)
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=500, detail={"error": f"Failed to refresh keys: {job.error}"}
+        )
+
+    return RefreshResponse(
+        success=all(worker["success"] for worker in job.workers),
+        keys_loaded=job.keys_loaded,
+        changed=job.changed,
+        generation=job.generation,
+        timestamp=job.finished_at,
+        workers=job.workers,
+    )
+
+
+@app.get("/refresh/{job_id}", response_model=RefreshJobResponse)
+async def refresh_status(job_id: str, request: Request):
+    """
+    Report the status of a refresh job. Only accessible from localhost.
+
+    Args:
+        job_id: ID returned by POST /refresh?wait=false
+        request: The HTTP request object
+
+    Returns:
+        The refresh job's status and, once finished, its outcome
+
+    Raises:
+        HTTPException: 403 if not accessed from localhost
+        HTTPException: 404 if the job is unknown or has been forgotten
+    """
+    _check_localhost(request)
+
+    job = refresh_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Unknown refresh job"})
+    return job.to_response()
 
 
 @app.get("/health")
@@ -245,17 +982,114 @@ async def health():
     Returns:
         Minimal health response without revealing service details
     """
-    stats_client = get_stats_client()
-    keys_count = len(store.keys_by_secret)
+    metrics = get_metrics()
+    keys_count = store.snapshot.key_count
     
     # Track health check
-    if stats_client:
-        try:
-            with stats_client.pipeline() as pipe:
-                pipe.incr('health.requests')
-                pipe.gauge('keys.count', keys_count)
-        except Exception:
-            pass
+    metrics.incr('health.requests')
+    metrics.gauge('keys.count', keys_count)
     
     # Return minimal response - just "ok" without revealing it's an auth service
     return {"status": "ok"}
+
+
+class FastVerifyMiddleware:
+    """
+    Raw ASGI middleware that answers POST /verify without FastAPI routing.
+
+    Reads the body, decodes it with fastjson, looks the secret up in the store
+    and writes the pre-serialized response. Anything it cannot handle exactly
+    like the /verify route (other paths, malformed or oversized bodies) is
+    passed to the wrapped app with the body replayed, so error responses stay
+    identical. Enabled with FAST_VERIFY=true.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] == "/verify"
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+
+        # Read the whole body
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            size += len(chunk)
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        api_key = None
+        if size <= FAST_VERIFY_MAX_BODY:
+            try:
+                data = fastjson.loads(body)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and isinstance(data.get("api_key"), str):
+                api_key = data["api_key"]
+
+        if api_key is None:
+            await self.app(scope, _replay_body(body, receive), send)
+            return
+
+        user_agent = "unknown"
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+                break
+
+        snapshot = store.snapshot
+        key_data = snapshot.get_by_secret(api_key)
+        record_verification(snapshot, api_key, key_data, start_time, user_agent=user_agent)
+
+        if key_data is None:
+            await _send_json(send, 403, INVALID_KEY_ERROR)
+            return
+
+        await _send_json(send, 200, snapshot.get_verify_response(api_key, key_data))
+
+
+def _replay_body(body: bytes, receive):
+    """Build an ASGI receive callable that yields an already-read body first."""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return replay
+
+
+async def _send_json(send, status: int, body: bytes) -> None:
+    """Send a complete JSON response over raw ASGI."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+if FAST_VERIFY:
+    app.add_middleware(FastVerifyMiddleware)
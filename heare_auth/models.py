@@ -1,10 +1,13 @@
 """Pydantic models for API requests and responses."""
 
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
+# Maximum number of secrets accepted by a single /verify/batch request
+MAX_BATCH_SIZE = 1000
+
 
 class SecretType(str, Enum):
     """Enum for secret types."""
@@ -28,12 +31,67 @@ class VerifyResponse(BaseModel):
     error: Optional[str] = Field(None, description="Error message (if invalid)")
 
 
+class VerifyBatchRequest(BaseModel):
+    """Request model for the /verify/batch endpoint."""
+
+    api_keys: List[str] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_SIZE, description="The API secrets to verify"
+    )
+
+
+class VerifyBatchResponse(BaseModel):
+    """Response model for the /verify/batch endpoint."""
+
+    results: List[VerifyResponse] = Field(
+        ..., description="One verification result per secret, in request order"
+    )
+
+
+class WorkerRefreshResponse(BaseModel):
+    """Outcome of a refresh on one worker process."""
+
+    pid: int = Field(..., description="Worker process ID")
+    success: bool = Field(..., description="Whether the worker reloaded its keys")
+    keys_loaded: Optional[int] = Field(
+        None, description="Number of keys the worker serves (if successful)"
+    )
+    changed: Optional[bool] = Field(
+        None, description="Whether the worker's keys changed (if successful)"
+    )
+    generation: Optional[int] = Field(
+        None, description="Generation the worker now serves (if successful)"
+    )
+    error: Optional[str] = Field(None, description="Error message (if failed)")
+
+
 class RefreshResponse(BaseModel):
     """Response model for the /refresh endpoint."""
 
-    success: bool = Field(..., description="Whether the refresh was successful")
+    success: bool = Field(..., description="Whether the refresh was successful on every worker")
     keys_loaded: int = Field(..., description="Number of keys loaded from S3")
+    changed: bool = Field(True, description="Whether the keys changed since the last load")
+    generation: int = Field(0, description="Generation of the key snapshot now being served")
     timestamp: str = Field(..., description="Timestamp of the refresh operation")
+    workers: List[WorkerRefreshResponse] = Field(
+        default_factory=list, description="Outcome on each worker process (with WORKER_CONTROL_DIR)"
+    )
+
+
+class RefreshJobResponse(BaseModel):
+    """Response model for an asynchronous /refresh job."""
+
+    job_id: str = Field(..., description="Refresh job ID, polled at /refresh/{job_id}")
+    status: str = Field(..., description="Job status: running, succeeded or failed")
+    started_at: str = Field(..., description="Timestamp the job started")
+    finished_at: Optional[str] = Field(None, description="Timestamp the job finished")
+    keys_loaded: Optional[int] = Field(None, description="Number of keys loaded (once succeeded)")
+    changed: Optional[bool] = Field(None, description="Whether the keys changed (once succeeded)")
+    generation: Optional[int] = Field(None, description="Generation published (once succeeded)")
+    error: Optional[str] = Field(None, description="Error message (if failed)")
+    workers: List[WorkerRefreshResponse] = Field(
+        default_factory=list,
+        description="Outcome on each worker process (once finished, with WORKER_CONTROL_DIR)",
+    )
 
 
 class HealthResponse(BaseModel):
@@ -0,0 +1 @@
+"""Protobuf messages of the gRPC KeyVerifier service."""
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: heare_auth/proto/verify.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'heare_auth/proto/verify.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1dheare_auth/proto/verify.proto\x12\rheare_auth.v1\"4\n\rVerifyRequest\x12\x0f\n\x07\x61pi_key\x18\x01 \x01(\t\x12\x12\n\nrequest_id\x18\x02 \x01(\t\"w\n\x0eVerifyResponse\x12\r\n\x05valid\x18\x01 \x01(\x08\x12\x0e\n\x06key_id\x18\x02 \x01(\t\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x15\n\rmetadata_json\x18\x04 \x01(\t\x12\r\n\x05\x65rror\x18\x05 \x01(\t\x12\x12\n\nrequest_id\x18\x06 \x01(\t2\xa5\x01\n\x0bKeyVerifier\x12\x45\n\x06Verify\x12\x1c.heare_auth.v1.VerifyRequest\x1a\x1d.heare_auth.v1.VerifyResponse\x12O\n\x0cVerifyStream\x12\x1c.heare_auth.v1.VerifyRequest\x1a\x1d.heare_auth.v1.VerifyResponse(\x01\x30\x01\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'heare_auth.proto.verify_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_VERIFYREQUEST']._serialized_start=48
+  _globals['_VERIFYREQUEST']._serialized_end=100
+  _globals['_VERIFYRESPONSE']._serialized_start=102
+  _globals['_VERIFYRESPONSE']._serialized_end=221
+  _globals['_KEYVERIFIER']._serialized_start=224
+  _globals['_KEYVERIFIER']._serialized_end=389
+# @@protoc_insertion_point(module_scope)
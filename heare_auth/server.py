@@ -0,0 +1,92 @@
+"""Run the API server on TCP, a Unix domain socket, or both."""
+
+import os
+import socket
+import stat
+from typing import List, Optional
+
+import uvicorn
+
+
+def bind_unix_socket(path: str, mode: int = 0o660) -> socket.socket:
+    """
+    Create a listening-ready Unix domain socket.
+
+    A stale socket file left by a previous run is replaced; any other kind of
+    file at the path is an error.
+
+    Args:
+        path: Filesystem path for the socket
+        mode: Permissions for the socket file
+
+    Returns:
+        The bound socket
+
+    Raises:
+        ValueError: If a non-socket file exists at the path
+    """
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise ValueError(f"Refusing to replace non-socket file: {path}")
+        os.unlink(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, mode)
+    return sock
+
+
+def bind_tcp_socket(host: str, port: int) -> socket.socket:
+    """
+    Create a TCP socket bound to host and port.
+
+    Args:
+        host: Interface to listen on (IPv4 or IPv6)
+        port: Port to listen on
+
+    Returns:
+        The bound socket
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def serve(
+    host: Optional[str] = "0.0.0.0",
+    port: int = 8080,
+    uds: Optional[str] = None,
+    uds_mode: int = 0o660,
+    app="heare_auth.main:app",
+) -> None:
+    """
+    Serve the API on a TCP port, a Unix domain socket, or both at once.
+
+    Args:
+        host: TCP interface to listen on, or None to skip TCP
+        port: TCP port
+        uds: Unix domain socket path, or None to skip UDS
+        uds_mode: Permissions for the socket file
+        app: ASGI app or import string
+
+    Raises:
+        ValueError: If neither TCP nor UDS is requested
+    """
+    sockets: List[socket.socket] = []
+    if uds:
+        sockets.append(bind_unix_socket(uds, uds_mode))
+    if host:
+        sockets.append(bind_tcp_socket(host, port))
+    if not sockets:
+        raise ValueError("Nothing to listen on: set a TCP host and/or a UDS path")
+
+    server = uvicorn.Server(uvicorn.Config(app, proxy_headers=True))
+    try:
+        server.run(sockets=sockets)
+    finally:
+        for sock in sockets:
+            sock.close()
+        if uds and os.path.lexists(uds):
+            os.unlink(uds)
@@ -0,0 +1,418 @@
+"""Memory-mapped key index shared by the worker processes of one host."""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import time
+import uuid
+from array import array
+from typing import List, Optional, Tuple
+
+# Index file layout (integers little-endian):
+#   INDEX_MAGIC, then the header: format version (u16), table kind (u8,
+#     TABLE_PROBE or TABLE_PERFECT), snapshot generation (u64), key count
+#     (u64), slot count (u64), bucket count (u64, perfect tables only),
+#     loaded_at (f64), change log position (u64) and the ETag length (u16)
+#     and bytes
+#   TABLE_PROBE, at the next multiple of 8: an open-addressing table of a
+#     power-of-two number of slots, each the first 8 bytes of the secret's
+#     SHA-256 (u64) and the offset of its record (u64, 0 for an empty slot)
+#   TABLE_PERFECT, at the next multiple of 8: a minimal perfect hash, i.e.
+#     one displacement (u32) per bucket, then one record offset (u64) per
+#     key (see perfect_hash)
+#   records: the secret's full SHA-256, expiry epoch (f64, NaN if none), the
+#     lengths of the key ID (u16), JSON name (u16) and /verify body (u32),
+#     followed by those three
+# The file holds no secrets, only their digests, and is never modified
+# after it is written: a new generation is a new file renamed over the old.
+INDEX_MAGIC = b"HEARE_IDX\x00"
+INDEX_VERSION = 2
+TABLE_PROBE = 0
+TABLE_PERFECT = 1
+
+_INDEX_HEADER = struct.Struct("<HBQQQQdQH")
+_GENERATION_OFFSET = len(INDEX_MAGIC) + 3
+_SLOT = struct.Struct("<QQ")
+_OFFSET = struct.Struct("<Q")
+_DISPLACEMENT = struct.Struct("<I")
+_RECORD = struct.Struct("<32sdHHI")
+_DIGEST_HASHES = struct.Struct("<QQ")
+_MIN_SLOTS = 8
+
+# Perfect hash buckets hold one key on average; a displacement with this bit
+# set is the slot itself, used for the buckets of one key
+_KEYS_PER_BUCKET = 1
+_DIRECT = 1 << 31
+_MAX_DISPLACEMENT = 1 << 20
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+def secret_digest(secret: str) -> bytes:
+    """
+    Hash a secret the way the index stores it.
+
+    Args:
+        secret: The secret
+
+    Returns:
+        32-byte SHA-256 digest
+    """
+    return hashlib.sha256(secret.encode("utf-8")).digest()
+
+
+def _slot_count(count: int) -> int:
+    """Power-of-two table size that keeps the load factor at or below 1/2."""
+    slots = _MIN_SLOTS
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+
+def _perfect_slot(position: int, displacement: int, count: int) -> int:
+    """Slot of a key with the given position hash in a bucket with the given displacement."""
+    if displacement & _DIRECT:
+        return displacement & ~_DIRECT
+    # splitmix64 finalizer, so that every bit of the mixed value reaches the remainder
+    z = position ^ (displacement * _MIX & _MASK64)
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & _MASK64
+    return (z ^ (z >> 31)) % count
+
+
+def perfect_hash(digests: List[bytes]) -> Tuple[array, List[int]]:
+    """
+    Build a minimal perfect hash over distinct digests (hash and displace).
+
+    Each digest falls into a bucket by its first 8 bytes and is positioned by
+    the next 8. Buckets are placed largest first: a bucket's keys go to
+    mix(position, d) % count for the smallest displacement d at which
+    all of them land in free slots. Once only one-key buckets are left, each
+    takes a free slot directly.
+
+    Args:
+        digests: Distinct SHA-256 digests
+
+    Returns:
+        Tuple of (displacement per bucket, key index per slot)
+
+    Raises:
+        ValueError: If a bucket cannot be placed (vanishingly unlikely)
+    """
+    count = len(digests)
+    bucket_count = max(1, -(-count // _KEYS_PER_BUCKET))
+    hashes = [_DIGEST_HASHES.unpack_from(digest) for digest in digests]
+    buckets: List[List[int]] = [[] for _ in range(bucket_count)]
+    for index, (bucket, _) in enumerate(hashes):
+        buckets[bucket % bucket_count].append(index)
+
+    displacements = array("I", bytes(4 * bucket_count))
+    key_at_slot = [-1] * count
+    order = sorted(range(bucket_count), key=lambda b: len(buckets[b]), reverse=True)
+    singles = len(order)
+    for position, bucket in enumerate(order):
+        members = buckets[bucket]
+        if len(members) < 2:
+            singles = position
+            break
+        for displacement in range(_MAX_DISPLACEMENT):
+            slots = {_perfect_slot(hashes[i][1], displacement, count) for i in members}
+            if len(slots) == len(members) and all(key_at_slot[slot] < 0 for slot in slots):
+                break
+        else:
+            raise ValueError("Could not build a perfect hash for the keyring")
+        displacements[bucket] = displacement
+        for index in members:
+            key_at_slot[_perfect_slot(hashes[index][1], displacement, count)] = index
+
+    free = (slot for slot in range(count) if key_at_slot[slot] < 0)
+    for bucket in order[singles:]:
+        members = buckets[bucket]
+        if not members:
+            break
+        slot = next(free)
+        displacements[bucket] = _DIRECT | slot
+        key_at_slot[slot] = members[0]
+    return displacements, key_at_slot
+
+
+def write_index(path: str, snapshot, perfect: bool = False) -> None:
+    """
+    Write a snapshot's secret index to path.
+
+    The file is written to a temporary file and renamed into place, so
+    processes that map the previous file keep a consistent view of it and a
+    crash never leaves a torn index.
+
+    Args:
+        path: Index file path
+        snapshot: The KeySnapshot to index
+        perfect: Use a minimal perfect hash (slower to build, one slot per
+            key and no probing) instead of an open-addressing table
+
+    Raises:
+        OSError: If the file cannot be written
+    """
+    etag = (snapshot.etag or "").encode("utf-8")
+    entries = [
+        (secret_digest(secret), secret, record)
+        for secret, record in snapshot.keys_by_secret.items()
+    ]
+    count = len(entries)
+    table_offset = len(INDEX_MAGIC) + _INDEX_HEADER.size + len(etag)
+    table_offset += -table_offset % 8
+    if perfect:
+        displacements, key_at_slot = perfect_hash([digest for digest, _, _ in entries])
+        slots, bucket_count = count, len(displacements)
+        slots_offset = table_offset + _DISPLACEMENT.size * bucket_count
+        slots_offset += -slots_offset % 8
+        table_size = slots_offset - table_offset + _OFFSET.size * count
+    else:
+        slots, bucket_count = _slot_count(count), 0
+        table_size = slots * _SLOT.size
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.seek(table_offset + table_size)
+            offsets = []
+            offset = f.tell()
+            for digest, secret, record in entries:
+                key_id = record.id.encode("utf-8")
+                name = json.dumps(record.name).encode("utf-8")
+                body = snapshot.get_verify_response(secret, record)
+                expiry = record.expiry if record.expiry is not None else math.nan
+                f.write(_RECORD.pack(digest, expiry, len(key_id), len(name), len(body)))
+                f.write(key_id)
+                f.write(name)
+                f.write(body)
+                offsets.append(offset)
+                offset += _RECORD.size + len(key_id) + len(name) + len(body)
+
+            if perfect:
+                table = bytearray(table_size)
+                table[:len(displacements) * _DISPLACEMENT.size] = displacements.tobytes()
+                slot_offsets = array("Q", (offsets[index] for index in key_at_slot))
+                start = slots_offset - table_offset
+                table[start:] = slot_offsets.tobytes()
+            else:
+                table = bytearray(table_size)
+                mask = slots - 1
+                for (digest, _, _), record_offset in zip(entries, offsets):
+                    (tag,) = _OFFSET.unpack_from(digest)
+                    slot = tag & mask
+                    while _SLOT.unpack_from(table, slot * _SLOT.size)[1]:
+                        slot = (slot + 1) & mask
+                    _SLOT.pack_into(table, slot * _SLOT.size, tag, record_offset)
+
+            f.seek(0)
+            f.write(INDEX_MAGIC)
+            f.write(_INDEX_HEADER.pack(
+                INDEX_VERSION,
+                TABLE_PERFECT if perfect else TABLE_PROBE,
+                snapshot.generation,
+                count,
+                slots,
+                bucket_count,
+                snapshot.loaded_at,
+                snapshot.log_seq,
+                len(etag),
+            ))
+            f.write(etag)
+            f.seek(table_offset)
+            f.write(table)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def set_index_generation(path: str, generation: int) -> None:
+    """
+    Stamp the generation into an index file that is not yet in use.
+
+    Args:
+        path: Index file path, e.g. a downloaded compiled index
+        generation: Generation of the snapshot it becomes
+    """
+    with open(path, "r+b") as f:
+        f.seek(_GENERATION_OFFSET)
+        f.write(_OFFSET.pack(generation))
+
+
+class MappedKey:
+    """
+    A key found in a MappedSnapshot.
+
+    Carries what the verify paths read from a KeyRecord; the metadata is
+    decoded from the /verify body on first use.
+    """
+
+    __slots__ = ("id", "secret", "expiry", "_name", "_body", "_metadata")
+
+    def __init__(self, id: str, secret: str, expiry: Optional[float], name: bytes, body: bytes):
+        self.id = id
+        self.secret = secret
+        self.expiry = expiry
+        self._name = name
+        self._body = body
+        self._metadata = None
+
+    @property
+    def name(self):
+        return json.loads(self._name)
+
+    @property
+    def metadata(self) -> dict:
+        if self._metadata is None:
+            self._metadata = json.loads(self._body)["metadata"]
+        return self._metadata
+
+    def __repr__(self) -> str:
+        # Never include the secret
+        return f"MappedKey(id={self.id!r}, name={self.name!r})"
+
+
+class MappedSnapshot:
+    """
+    Read-only view of a keyring through a memory-mapped index file.
+
+    Answers the lookups the verify paths make on a KeySnapshot (by secret
+    only) without parsing or copying the keyring: pages are read from the
+    shared page cache as lookups touch them. Expired keys are skipped at
+    lookup time, so there is nothing to prune.
+    """
+
+    expiry_order: Tuple = ()
+    last_modified = None
+
+    def __init__(self, path: str):
+        """
+        Map an index file.
+
+        Args:
+            path: Index file path
+
+        Raises:
+            FileNotFoundError: If there is no index file
+            ValueError: If the file is not a valid index
+        """
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_dev, stat.st_ino)
+            if stat.st_size < len(INDEX_MAGIC) + _INDEX_HEADER.size:
+                raise ValueError(f"Truncated key index: {path}")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"Not a key index: {path}")
+        (
+            version,
+            table,
+            self.generation,
+            self.key_count,
+            slots,
+            buckets,
+            self.loaded_at,
+            self.log_seq,
+            etag_length,
+        ) = _INDEX_HEADER.unpack_from(self._map, len(INDEX_MAGIC))
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported key index version: {version}")
+        start = len(INDEX_MAGIC) + _INDEX_HEADER.size
+        self.etag = self._map[start:start + etag_length].decode("utf-8") or None
+        self._table_offset = start + etag_length + (-(start + etag_length) % 8)
+        self.perfect = table == TABLE_PERFECT
+        if self.perfect:
+            self._buckets = buckets
+            self._slots_offset = self._table_offset + _DISPLACEMENT.size * buckets
+            self._slots_offset += -self._slots_offset % 8
+            valid = slots == self.key_count and buckets > 0
+            end = self._slots_offset + slots * _OFFSET.size
+        else:
+            self._mask = slots - 1
+            valid = table == TABLE_PROBE and slots > 0 and not slots & self._mask
+            end = self._table_offset + slots * _SLOT.size
+        if not valid or end > len(self._map):
+            raise ValueError(f"Corrupt key index: {path}")
+
+    def _record_offset(self, digest: bytes) -> int:
+        """Offset of the only record that can hold digest, or 0 if there is none."""
+        data = self._map
+        if self.perfect:
+            if not self.key_count:
+                return 0
+            bucket, position = _DIGEST_HASHES.unpack_from(digest)
+            (displacement,) = _DISPLACEMENT.unpack_from(
+                data, self._table_offset + (bucket % self._buckets) * _DISPLACEMENT.size
+            )
+            slot = _perfect_slot(position, displacement, self.key_count)
+            return _OFFSET.unpack_from(data, self._slots_offset + slot * _OFFSET.size)[0]
+
+        (tag,) = _OFFSET.unpack_from(digest)
+        slot = tag & self._mask
+        while True:
+            slot_tag, offset = _SLOT.unpack_from(data, self._table_offset + slot * _SLOT.size)
+            if not offset or slot_tag == tag and data[offset:offset + 32] == digest:
+                return offset
+            slot = (slot + 1) & self._mask
+
+    def _find(self, secret: str) -> Optional[MappedKey]:
+        digest = secret_digest(secret)
+        offset = self._record_offset(digest)
+        if not offset:
+            return None
+        data = self._map
+        stored, expiry, id_length, name_length, body_length = _RECORD.unpack_from(data, offset)
+        if stored != digest:
+            return None
+        start = offset + _RECORD.size
+        name_start = start + id_length
+        body_start = name_start + name_length
+        return MappedKey(
+            data[start:name_start].decode("utf-8"),
+            secret,
+            None if math.isnan(expiry) else expiry,
+            data[name_start:body_start],
+            data[body_start:body_start + body_length],
+        )
+
+    def get_by_secret(self, secret: str) -> Optional[MappedKey]:
+        """
+        Get a key by secret (for authentication).
+
+        Args:
+            secret: The secret value to look up
+
+        Returns:
+            The key if found and not expired, None otherwise
+        """
+        key_data = self._find(secret)
+        if key_data is None:
+            return None
+        if key_data.expiry is not None and time.time() >= key_data.expiry:
+            return None  # Key has expired
+        return key_data
+
+    def get_verify_response(self, secret: str, key_data: MappedKey) -> bytes:
+        """
+        Get the /verify response body stored for a key.
+
+        Args:
+            secret: The secret the key was looked up by
+            key_data: Key returned by get_by_secret
+
+        Returns:
+            UTF-8 encoded JSON response body
+        """
+        return key_data._body
+
+    def without_expired(self, now: float) -> Tuple["MappedSnapshot", int]:
+        """Expired keys are skipped by lookups, so there is never anything to remove."""
+        return self, 0
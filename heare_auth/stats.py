@@ -1,12 +1,124 @@
 """
 Statistics/metrics client for heare-auth.
 """
+import asyncio
 import os
-from typing import Optional
-from heare.stats.client import HttpClient, BaseStatsClient
+from typing import Optional, Union
 
+from heare.stats.client import BaseStatsClient, HttpClient, PipelineAggregator
 
 _stats_client: Optional[BaseStatsClient] = None
+_metrics: Optional["MetricsAggregator"] = None
+
+class MetricsAggregator:
+    """
+    Aggregate metrics in memory and flush them to the stats client in the background.
+
+    Counters are summed and gauges overwritten in place, so memory grows with the
+    number of metric names rather than with traffic and no count is ever lost.
+    Recording a metric never performs I/O on the event loop: a background task
+    swaps the aggregate out every flush_interval seconds and sends it from a
+    worker thread. Timer samples are kept individually, up to max_buffer per
+    flush; beyond that new samples are dropped and counted in stats.dropped.
+    """
+
+    def __init__(
+        self,
+        client: Optional[BaseStatsClient],
+        flush_interval: float = 10.0,
+        max_buffer: int = 10000,
+    ):
+        """
+        Initialize the aggregator.
+
+        Args:
+            client: Stats client to flush to, or None to discard all metrics
+            flush_interval: Seconds between background flushes
+            max_buffer: Maximum number of unflushed timer samples
+        """
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._batch = PipelineAggregator()
+        self._samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def incr(self, metric_name: str, value: Union[int, float] = 1) -> None:
+        """Increment a counter."""
+        if self.client is not None:
+            self._batch.incr(metric_name, value)
+
+    def gauge(self, metric_name: str, value: Union[int, float]) -> None:
+        """Set a gauge; the last value before a flush wins."""
+        if self.client is not None:
+            self._batch.gauge(metric_name, value)
+
+    def time(self, metric_name: str, value: Union[int, float]) -> None:
+        """Record a timer sample in milliseconds."""
+        if self.client is None:
+            return
+        if self._samples >= self.max_buffer:
+            self.dropped += 1
+            return
+        self._samples += 1
+        self._batch.time(metric_name, value)
+
+    def drain(self) -> PipelineAggregator:
+        """
+        Take everything aggregated since the last drain.
+
+        Returns:
+            Aggregated counters, gauges and timers
+        """
+        batch, self._batch = self._batch, PipelineAggregator()
+        self._samples = 0
+
+        dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch.incr("stats.dropped", dropped)
+        return batch
+
+    def _send(self, batch: PipelineAggregator) -> None:
+        with self.client.pipeline() as pipe:
+            for metric_name, value in batch.counters.items():
+                pipe.incr(metric_name, value)
+            for metric_name, value in batch.gauges.items():
+                pipe.gauge(metric_name, value)
+            for metric_name, values in batch.timers.items():
+                for value in values:
+                    pipe.time(metric_name, value)
+
+    async def flush(self) -> None:
+        """Send everything buffered so far without blocking the event loop."""
+        if self.client is None:
+            return
+
+        batch = self.drain()
+        if not (batch.counters or batch.gauges or batch.timers):
+            return
+
+        try:
+            await asyncio.to_thread(self._send, batch)
+        except Exception:
+            pass  # Don't let metrics failures affect the API
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Start the background flush task."""
+        if self.client is not None and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background flush task and flush what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
 
 
 def get_stats_client() -> Optional[BaseStatsClient]:
@@ -23,6 +135,24 @@ def get_stats_client() -> Optional[BaseStatsClient]:
     return _stats_client
 
 
+def get_metrics() -> MetricsAggregator:
+    """
+    Get the shared metrics aggregator.
+
+    Metrics are discarded if no stats client is configured.
+    """
+    global _metrics
+
+    if _metrics is None:
+        _metrics = MetricsAggregator(
+            get_stats_client(),
+            flush_interval=float(os.environ.get('STATS_FLUSH_INTERVAL', '10')),
+            max_buffer=int(os.environ.get('STATS_BUFFER_SIZE', '10000')),
+        )
+
+    return _metrics
+
+
 def _initialize_stats_client() -> Optional[BaseStatsClient]:
     """Initialize the stats client from environment variables."""
     protocol = os.environ.get('PROTOCOL', '').lower()
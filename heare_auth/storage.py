@@ -1,46 +1,781 @@
 """S3 storage and in-memory key store."""
 
 import base64
+import bisect
+import dataclasses
+import fcntl
+import gc
 import hashlib
 import json
 import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import boto3
 from botocore.exceptions import ClientError
 from cryptography.fernet import Fernet, InvalidToken
 
+from .encryption import (
+    ENCRYPTION_SCHEMES,
+    aead_encrypt,
+    compress,
+    iter_aead_decrypt,
+    iter_decompress,
+    require_codec,
+)
+from .formats import (
+    KEYRING_FORMATS,
+    READ_CHUNK_SIZE,
+    iter_chunks,
+    iter_keyring,
+    serialize_snapshot,
+)
+from .shared_index import MappedSnapshot, set_index_generation, write_index
+
+# Expiry assigned to keys whose expires_at cannot be parsed, so they fail closed
+REJECTED_EXPIRY = 0.0
+
+# Layout version of the local snapshot cache file (see KeyStore.save_cache)
+CACHE_VERSION = 1
+
+
+# S3 object metadata marking the object at S3_KEY as a shard manifest
+FORMAT_METADATA = "heare-auth-format"
+MANIFEST_FORMAT = "manifest"
+MANIFEST_VERSION = 1
+# S3 object metadata recording the last change log record folded into a keyring
+LOG_SEQ_METADATA = "heare-auth-log-seq"
+CHANGE_OPS = ("create", "update", "delete")
+# A compiled index (see KeyStore.compile_index) is stored at "<key>.index" and
+# records the ETag of the keyring object it was compiled from
+COMPILED_INDEX_SUFFIX = ".index"
+SOURCE_ETAG_METADATA = "heare-auth-source-etag"
+
+
+def shard_index(key_id: str, shard_count: int) -> int:
+    """
+    Pick the shard a key lives in, by hash of its key ID.
+
+    Args:
+        key_id: The key ID
+        shard_count: Number of shards in the layout
+
+    Returns:
+        Shard index in range(shard_count)
+    """
+    digest = hashlib.sha256(key_id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def parse_manifest(data: bytes) -> dict:
+    """
+    Parse and validate a shard manifest.
+
+    Args:
+        data: The manifest object body
+
+    Returns:
+        Manifest dictionary with "version", "shard_count" and "shards"
+
+    Raises:
+        ValueError: If the manifest is malformed or from a newer version
+    """
+    manifest = json.loads(data)
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported shard manifest version: {manifest.get('version')!r}")
+    shards = manifest.get("shards")
+    if not isinstance(shards, list) or len(shards) != manifest.get("shard_count") or not shards:
+        raise ValueError("Shard manifest does not list shard_count shards")
+    return manifest
+
+
+def parse_expiry(expires_at: Optional[str]) -> Optional[float]:
+    """
+    Convert an ISO 8601 expires_at value into an epoch timestamp.
+
+    Naive timestamps are treated as UTC. Unparseable values are rejected by
+    returning REJECTED_EXPIRY, which is always in the past.
+
+    Args:
+        expires_at: ISO 8601 timestamp string, or None
+
+    Returns:
+        Epoch seconds, or None if the key never expires
+    """
+    if not expires_at:
+        return None
+
+    try:
+        expiry = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return REJECTED_EXPIRY
+
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("KeyMetadata is read-only; copy it with dict() to modify")
+
+
+class KeyMetadata(dict):
+    """
+    Read-only key metadata shared by every key with identical metadata.
+
+    A dict subclass, so it serializes and compares like the metadata dict it
+    replaces, but every mutating method raises TypeError. serialized holds
+    the compact JSON of the metadata, ready to splice into /verify responses.
+    """
+
+    __slots__ = ("serialized",)
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # dict's default would restore items through the read-only __setitem__,
+        # and no default restores the slot, so pass both explicitly
+        return KeyMetadata, (dict(self),), self.serialized
+
+    def __setstate__(self, serialized: bytes):
+        self.serialized = serialized
+
+
+# Compact JSON for the hot paths; json.dumps re-checks its options per call
+_encode_compact = json.JSONEncoder(separators=(",", ":")).encode
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def serialize_metadata(metadata: Optional[Mapping]) -> bytes:
+    """
+    Serialize metadata as compact JSON, {} for a key without metadata.
+
+    Args:
+        metadata: Metadata dictionary, or None
+
+    Returns:
+        UTF-8 encoded JSON object
+    """
+    if isinstance(metadata, KeyMetadata):
+        return metadata.serialized
+    return _encode_compact(metadata or {}).encode("utf-8")
+
+
+class MetadataTable:
+    """
+    Interns key metadata while a snapshot is built.
+
+    Keys usually share a handful of metadata dicts, e.g. {"service": "x",
+    "environment": "production"}, but each one is parsed into its own dict.
+    The table maps each distinct metadata (by its serialized JSON, so
+    ordering and value types are respected) to one shared KeyMetadata, and
+    interns the field names and string values of the ones it keeps, so
+    nearly identical metadata share their strings too.
+    """
+
+    def __init__(self):
+        """Create an empty table."""
+        self._shared: Dict[bytes, KeyMetadata] = {}
+
+    def __len__(self) -> int:
+        return len(self._shared)
+
+    def intern(self, metadata: Optional[Mapping]) -> Optional[KeyMetadata]:
+        """
+        Get the shared KeyMetadata for a metadata dictionary.
+
+        Args:
+            metadata: Metadata dictionary, or None
+
+        Returns:
+            The shared KeyMetadata, or None if metadata is None
+        """
+        if metadata is None or isinstance(metadata, KeyMetadata):
+            return metadata
+        serialized = _encode_compact(metadata).encode("utf-8")
+        shared = self._shared.get(serialized)
+        if shared is None:
+            shared = KeyMetadata(
+                (sys.intern(name), sys.intern(value) if type(value) is str else value)
+                for name, value in metadata.items()
+            )
+            shared.serialized = serialized
+            self._shared[serialized] = shared
+        return shared
+
+
+# Key fields stored in KeyRecord slots; anything else is kept in its extras
+RECORD_FIELDS = (
+    "id", "secret", "name", "secret_type", "created_at", "updated_at", "expires_at", "metadata"
+)
+_RECORD_BITS = {name: 1 << bit for bit, name in enumerate(RECORD_FIELDS)}
+_ALL_FIELDS = (1 << len(RECORD_FIELDS)) - 1
+_RECORD_FIELD_SET = frozenset(RECORD_FIELDS)
+
+
+class KeyRecord(Mapping):
+    """
+    One API key as held by the in-memory indexes.
+
+    A slotted object is well under half the size of the dict parsed from
+    JSON and does not carry its own hash table of field names. It is also
+    a read-only Mapping, so key["id"] and key.get("metadata") work as they
+    do on key dicts, and fields the key did not have stay absent (they read
+    as None through the attributes). The expiry epoch is parsed once, here.
+
+    Records are shared by every index and snapshot, so they must never be
+    modified; build a new record instead.
+    """
+
+    __slots__ = RECORD_FIELDS + ("expiry", "_present", "_extra")
+
+    def __init__(
+        self,
+        id: str,
+        secret: str,
+        name: Optional[str] = None,
+        secret_type: Optional[str] = None,
+        created_at: Optional[str] = None,
+        updated_at: Optional[str] = None,
+        expires_at: Optional[str] = None,
+        metadata: Optional[dict] = None,
+        present: int = _ALL_FIELDS,
+        extra: Optional[dict] = None,
+    ):
+        """
+        Create a record.
+
+        Args:
+            id: Key ID
+            secret: The secret
+            name: Human-readable name
+            secret_type: Type of secret
+            created_at: ISO 8601 creation time
+            updated_at: ISO 8601 update time
+            expires_at: ISO 8601 expiry time, parsed into expiry
+            metadata: Arbitrary metadata dictionary
+            present: Bit mask of the RECORD_FIELDS the key has
+            extra: Fields outside RECORD_FIELDS
+        """
+        self.id = id
+        self.secret = secret
+        self.name = name
+        self.secret_type = secret_type
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.expires_at = expires_at
+        self.metadata = metadata
+        self.expiry = parse_expiry(expires_at)
+        self._present = present
+        self._extra = extra
+
+    @classmethod
+    def from_dict(
+        cls, data: Mapping, metadata_table: Optional[MetadataTable] = None
+    ) -> "KeyRecord":
+        """
+        Convert a key dictionary, e.g. one parsed from a keyring, into a record.
+
+        Args:
+            data: Key dictionary; records are returned as they are
+            metadata_table: Table to intern the key's metadata in
+
+        Returns:
+            The record
+        """
+        if isinstance(data, KeyRecord):
+            return data
+        get = data.get
+        if data.keys() == _RECORD_FIELD_SET:
+            present, extra = _ALL_FIELDS, None
+        else:
+            present = 0
+            extra = {}
+            for name, value in data.items():
+                bit = _RECORD_BITS.get(name)
+                if bit is None:
+                    extra[name] = value
+                else:
+                    present |= bit
+        return cls(
+            data["id"],
+            data["secret"],
+            get("name"),
+            get("secret_type"),
+            get("created_at"),
+            get("updated_at"),
+            get("expires_at"),
+            (
+                metadata_table.intern(get("metadata"))
+                if metadata_table is not None
+                else get("metadata")
+            ),
+            present,
+            extra or None,
+        )
+
+    def __getitem__(self, name: str):
+        bit = _RECORD_BITS.get(name)
+        if bit is not None:
+            if self._present & bit:
+                return getattr(self, name)
+        elif self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise KeyError(name)
+
+    def __iter__(self) -> Iterator[str]:
+        present = self._present
+        for name in RECORD_FIELDS:
+            if present & _RECORD_BITS[name]:
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return self._present.bit_count() + (len(self._extra) if self._extra is not None else 0)
+
+    def __repr__(self) -> str:
+        # Never include the secret
+        return f"KeyRecord(id={self.id!r}, name={self.name!r})"
+
+
+def verify_response_body(key_data: Mapping) -> bytes:
+    """
+    Serialize the /verify success response for a key.
+
+    Matches the VerifyResponse schema so it can be returned as raw bytes.
+    Interned metadata is spliced in from its serialized JSON rather than
+    serialized again for every key.
+
+    Args:
+        key_data: Key record or dictionary
+
+    Returns:
+        UTF-8 encoded JSON response body
+    """
+    name = key_data.get("name")
+    return b'{"valid":true,"key_id":%s,"name":%s,"metadata":%s,"error":null}' % (
+        _encode_compact(key_data["id"]).encode("utf-8"),
+        (_encode_string(name) if type(name) is str else _encode_compact(name)).encode("utf-8"),
+        serialize_metadata(key_data.get("metadata")),
+    )
+
+
+@dataclass(frozen=True)
+class KeySnapshot:
+    """
+    Immutable view of one loaded keyring.
+
+    A snapshot and its indexes are never modified after it is published, so
+    readers that grab KeyStore.snapshot once see a consistent keyring for the
+    whole request, with no locking. Changes publish a new snapshot.
+    """
+
+    keys_by_secret: Dict[str, KeyRecord] = field(default_factory=dict)  # secret -> key
+    keys_by_id: Dict[str, KeyRecord] = field(default_factory=dict)  # id -> key
+    responses_by_secret: Dict[str, bytes] = field(default_factory=dict)  # secret -> /verify body
+    # (expiry epoch, secret) in ascending order, which is also a valid min-heap
+    expiry_order: Tuple[Tuple[float, str], ...] = ()
+    generation: int = 0
+    loaded_at: float = 0.0
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+    log_seq: int = 0  # Last change log record applied
+    # Shared metadata of the keys; changes intern into it too
+    metadata_table: MetadataTable = field(default_factory=MetadataTable, repr=False, compare=False)
+
+    @property
+    def key_count(self) -> int:
+        """Number of keys in the snapshot."""
+        return len(self.keys_by_secret)
+
+    @classmethod
+    def build(
+        cls,
+        keys: Iterable[dict],
+        etag: Optional[str] = None,
+        last_modified: Optional[datetime] = None,
+        log_seq: int = 0,
+    ) -> "KeySnapshot":
+        """
+        Index keys into a new, unpublished snapshot.
+
+        Keys become KeyRecords, whose expiry timestamps are parsed once so
+        lookups only compare floats, identical metadata is shared (see
+        MetadataTable), and each key's /verify response body is serialized
+        ahead of time. The generation is assigned when KeyStore
+        publishes the snapshot.
+
+        Args:
+            keys: Key dictionaries or records, e.g. a list or iter_keys()
+            etag: ETag of the S3 object the keys came from
+            last_modified: LastModified of the S3 object the keys came from
+            log_seq: Last change log record already folded into the keys
+
+        Returns:
+            The new snapshot
+        """
+        keys_by_secret = {}
+        keys_by_id = {}
+        responses_by_secret = {}
+        metadata_table = MetadataTable()
+        from_dict = KeyRecord.from_dict
+        for k in keys:
+            record = from_dict(k, metadata_table)
+            keys_by_secret[record.secret] = record
+            keys_by_id[record.id] = record
+            responses_by_secret[record.secret] = verify_response_body(record)
+
+        # From the final index, so a secret listed twice is scheduled once
+        expiring = [
+            (record.expiry, secret)
+            for secret, record in keys_by_secret.items()
+            if record.expiry is not None
+        ]
+        return cls(
+            keys_by_secret=keys_by_secret,
+            keys_by_id=keys_by_id,
+            responses_by_secret=responses_by_secret,
+            expiry_order=tuple(sorted(expiring)),
+            loaded_at=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+            log_seq=log_seq,
+            metadata_table=metadata_table,
+        )
+
+    def with_changes(self, changes: List[dict]) -> "KeySnapshot":
+        """
+        Build an unpublished snapshot with change log records applied in order.
+
+        create and update records carry the full key and replace any key with
+        the same ID; delete records carry only the key_id. The indexes are
+        copied once (a C-level copy, linear in the keyring size), then each
+        record costs a few dictionary operations.
+
+        Args:
+            changes: Change records sorted by seq
+
+        Returns:
+            The new snapshot, or self if there are no changes
+
+        Raises:
+            ValueError: If a record has an unknown op
+        """
+        if not changes:
+            return self
+
+        keys_by_secret = dict(self.keys_by_secret)
+        keys_by_id = dict(self.keys_by_id)
+        responses_by_secret = dict(self.responses_by_secret)
+        expiry_order = list(self.expiry_order)
+
+        def discard(record: KeyRecord) -> None:
+            # Only while the record still owns its secret; another key may have taken it
+            if keys_by_secret.get(record.secret) is not record:
+                return
+            del keys_by_secret[record.secret]
+            responses_by_secret.pop(record.secret, None)
+            if record.expiry is not None:
+                del expiry_order[bisect.bisect_left(expiry_order, (record.expiry, record.secret))]
+
+        def remove(key_id: str) -> None:
+            old = keys_by_id.pop(key_id, None)
+            if old is not None:
+                discard(old)
+
+        log_seq = self.log_seq
+        for change in changes:
+            op = change.get("op")
+            if op == "delete":
+                remove(change["key_id"])
+            elif op in ("create", "update"):
+                record = KeyRecord.from_dict(change["key"], self.metadata_table)
+                remove(record.id)
+                displaced = keys_by_secret.get(record.secret)
+                if displaced is not None:
+                    discard(displaced)
+                keys_by_secret[record.secret] = record
+                keys_by_id[record.id] = record
+                responses_by_secret[record.secret] = verify_response_body(record)
+                if record.expiry is not None:
+                    bisect.insort(expiry_order, (record.expiry, record.secret))
+            else:
+                raise ValueError(f"Unknown change log op {op!r} in record {change.get('seq')}")
+            log_seq = change["seq"]
+
+        return KeySnapshot(
+            keys_by_secret=keys_by_secret,
+            keys_by_id=keys_by_id,
+            responses_by_secret=responses_by_secret,
+            expiry_order=tuple(expiry_order),
+            loaded_at=time.time(),
+            etag=self.etag,
+            last_modified=self.last_modified,
+            log_seq=log_seq,
+            metadata_table=self.metadata_table,
+        )
+
+    def without_expired(self, now: float) -> Tuple["KeySnapshot", int]:
+        """
+        Build an unpublished snapshot with every key expired at `now` removed.
+
+        Args:
+            now: Current epoch time
+
+        Returns:
+            Tuple of (new snapshot, or self if nothing expired; number of keys removed)
+        """
+        cutoff = bisect.bisect_right(self.expiry_order, now, key=lambda entry: entry[0])
+        if cutoff == 0:
+            return self, 0
+
+        keys_by_secret = dict(self.keys_by_secret)
+        keys_by_id = dict(self.keys_by_id)
+        responses_by_secret = dict(self.responses_by_secret)
+        removed = 0
+        for _, secret in self.expiry_order[:cutoff]:
+            record = keys_by_secret.pop(secret, None)
+            if record is None:
+                continue
+            responses_by_secret.pop(secret, None)
+            # The ID may belong to another, live key with a different secret
+            if keys_by_id.get(record.id) is record:
+                del keys_by_id[record.id]
+            removed += 1
+
+        snapshot = KeySnapshot(
+            keys_by_secret=keys_by_secret,
+            keys_by_id=keys_by_id,
+            responses_by_secret=responses_by_secret,
+            expiry_order=self.expiry_order[cutoff:],
+            loaded_at=self.loaded_at,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            log_seq=self.log_seq,
+            metadata_table=self.metadata_table,
+        )
+        return snapshot, removed
+
+    def get_by_secret(self, secret: str) -> Optional[KeyRecord]:
+        """
+        Get key metadata by secret (for authentication).
+
+        Checks expiration and returns None if expired.
+
+        Args:
+            secret: The secret value to look up
+
+        Returns:
+            Key record if found and not expired, None otherwise
+        """
+        key_data = self.keys_by_secret.get(secret)
+
+        if key_data is None:
+            return None
+
+        # Check if expired (expiry was parsed to an epoch at load time)
+        expiry = key_data.expiry
+        if expiry is not None and time.time() >= expiry:
+            return None  # Key has expired
+
+        return key_data
+
+    def get_verify_response(self, secret: str, key_data: KeyRecord) -> bytes:
+        """
+        Get the pre-serialized /verify response body for a key.
+
+        Args:
+            secret: The secret the key was looked up by
+            key_data: Key record returned by get_by_secret
+
+        Returns:
+            UTF-8 encoded JSON response body
+        """
+        body = self.responses_by_secret.get(secret)
+        if body is None:
+            body = verify_response_body(key_data)
+        return body
+
 
 class KeyStore:
     """Manage API keys in S3 and memory with optional encryption."""
     
     ENCRYPTION_HEADER = b"HEARE_ENCRYPTED_V1:"
+    # Followed by "<codec>:" and a Fernet token of the compressed plaintext
+    ENCRYPTION_HEADER_V2 = b"HEARE_ENCRYPTED_V2:"
+    # Followed by a chunked AEAD payload (see aead_encrypt)
+    ENCRYPTION_HEADER_V3 = b"HEARE_ENCRYPTED_V3:"
 
-    def __init__(self, bucket: str, key: str, region: str = "us-east-1", storage_secret: Optional[str] = None):
+    def __init__(
+        self,
+        bucket: str,
+        key: str,
+        region: str = "us-east-1",
+        storage_secret: Optional[str] = None,
+        fetch_workers: int = 8,
+        change_log: bool = False,
+        keyring_format: str = "json",
+        cache_path: Optional[str] = None,
+        compression: Optional[str] = None,
+        encryption: str = "fernet",
+        index_path: Optional[str] = None,
+        compiled_index: bool = False,
+        cache_write_interval: float = 0.0,
+        index_write_interval: float = 0.0,
+    ):
         """
         Initialize the key store.
 
         Args:
             bucket: S3 bucket name
-            key: S3 key (file path)
+            key: S3 key (file path), holding either the keyring or a shard manifest
             region: AWS region
             storage_secret: Optional secret for encrypting data at rest
+            fetch_workers: Maximum number of shards or change records fetched concurrently
+            change_log: Apply change records under <key>.log/ on top of the keyring
+            keyring_format: Format keyrings and shards are written in, one of
+                KEYRING_FORMATS; both are always readable
+            cache_path: Local file the last keyring loaded from S3 is saved
+                to, encrypted; needs a storage_secret
+            compression: Codec from COMPRESSION_CODECS to compress data with
+                before encrypting it; None writes uncompressed data
+            encryption: Scheme from ENCRYPTION_SCHEMES used for writing:
+                "fernet" (HEARE_ENCRYPTED_V1, or V2 when compressed) or
+                "aead" (HEARE_ENCRYPTED_V3); every scheme is readable
+            index_path: Shared index file; the store holding its lock writes
+                each loaded keyring there, others map it (see load_index)
+            compiled_index: Load the compiled index at <key>.index into
+                index_path and map it, instead of parsing the keyring, while
+                it is up to date (see compile_index)
+            cache_write_interval: Minimum seconds between rewrites of
+                cache_path after changes (see flush_local_copies)
+            index_write_interval: Minimum seconds between rewrites of
+                index_path after changes (see flush_local_copies)
+
+        Raises:
+            ValueError: If keyring_format, compression or encryption is
+                unknown or unavailable, compression, aead or cache_path is set
+                without a storage_secret, or compiled_index is set without an
+                index_path
         """
+        if keyring_format not in KEYRING_FORMATS:
+            raise ValueError(f"Unknown keyring format: {keyring_format}")
+        if compression is not None:
+            require_codec(compression)
+            if storage_secret is None:
+                raise ValueError(
+                    "Compression is applied inside encryption and needs a STORAGE_SECRET"
+                )
+        if encryption not in ENCRYPTION_SCHEMES:
+            raise ValueError(f"Unknown encryption scheme: {encryption}")
+        if encryption != "fernet" and storage_secret is None:
+            raise ValueError(f"{encryption} encryption needs a STORAGE_SECRET")
+        if cache_path and storage_secret is None:
+            # An unencrypted cache would put every secret in a local file
+            raise ValueError("The local cache is encrypted and needs a STORAGE_SECRET")
+        if compiled_index and not index_path:
+            raise ValueError(
+                "A compiled index is mapped from the index path; set SHARED_INDEX_PATH"
+            )
+        self.compression = compression
+        self.encryption = encryption
+        self.keyring_format = keyring_format
         self.bucket = bucket
         self.key = key
+        self.fetch_workers = fetch_workers
+        self.change_log = change_log
+        self.log_prefix = f"{key}.log/"
+        self.cache_path = cache_path
+        self.index_path = index_path
+        self.compiled_index = compiled_index
+        self.compiled_key = f"{key}{COMPILED_INDEX_SUFFIX}"
+        self._index_lock: Optional[int] = None  # Descriptor holding the index lock
+        self.cache_write_interval = cache_write_interval
+        self.index_write_interval = index_write_interval
+        # Whether cache_path / index_path lag the published keyring, and when
+        # (time.monotonic) each was last written
+        self._cache_stale = self._index_stale = False
+        self._cache_written_at = self._index_written_at = float("-inf")
         self.s3 = boto3.client("s3", region_name=region)
-        self.keys_by_secret: Dict[str, dict] = {}  # secret -> full key data
-        self.keys_by_id: Dict[str, dict] = {}  # id -> full key data
+
+        # Current keyring; replaced as a whole, never modified in place
+        self.snapshot = KeySnapshot()
+        self._publish_lock = threading.Lock()  # Held only for the reference swap
+        self._load_lock = threading.Lock()  # Serializes S3 loads from threads
+
+        self.last_load_changed = False  # Whether the last load replaced the indexes
+        self.last_synced_at: Optional[float] = None  # Epoch of the last successful S3 check
+        self.cache_error: Optional[str] = None  # Why the last cache write failed, if it did
+        self.index_error: Optional[str] = None  # Why the last index write failed, if it did
         
         # Set up encryption if storage_secret is provided
         self.encryption_enabled = storage_secret is not None
         self.fernet = None
+        self._fernet_key = None
         if self.encryption_enabled:
             # Derive a Fernet key from the storage secret
             key_bytes = hashlib.sha256(storage_secret.encode()).digest()
             fernet_key = base64.urlsafe_b64encode(key_bytes)
             self.fernet = Fernet(fernet_key)
+            self._fernet_key = key_bytes
+
+    def _parsed_snapshot(self) -> KeySnapshot:
+        """
+        Get the current snapshot, which must be a parsed keyring.
+
+        A mapped index (on a shared index follower, or a compiled index)
+        holds secret digests and /verify bodies, not the keys themselves, so
+        it only answers lookups by secret.
+
+        Raises:
+            ValueError: If the current snapshot is a mapped index
+        """
+        snapshot = self.snapshot
+        if not isinstance(snapshot, KeySnapshot):
+            raise ValueError(
+                "Only lookups by secret are available while serving a mapped key index"
+            )
+        return snapshot
+
+    @property
+    def keys_by_secret(self) -> Dict[str, KeyRecord]:
+        """Secret index of the current snapshot (not available on a mapped index)."""
+        return self._parsed_snapshot().keys_by_secret
+
+    @property
+    def keys_by_id(self) -> Dict[str, KeyRecord]:
+        """ID index of the current snapshot (not available on a mapped index)."""
+        return self._parsed_snapshot().keys_by_id
+
+    @property
+    def generation(self) -> int:
+        """Generation number of the current snapshot."""
+        return self.snapshot.generation
+
+    @property
+    def etag(self) -> Optional[str]:
+        """ETag of the S3 object behind the current snapshot, for conditional GETs."""
+        return self.snapshot.etag
+
+    @property
+    def log_seq(self) -> int:
+        return self.snapshot.log_seq
+
+    @property
+    def last_modified(self) -> Optional[datetime]:
+        """LastModified of the S3 object behind the current snapshot."""
+        return self.snapshot.last_modified
 
     def _decrypt_data(self, raw_data: bytes) -> bytes:
         """
@@ -53,20 +788,125 @@ class KeyStore:
             Decrypted or original data
         """
         # Check if data is encrypted
-        if raw_data.startswith(self.ENCRYPTION_HEADER):
-            if not self.fernet:
-                raise ValueError("Data is encrypted but no STORAGE_SECRET provided")
-            
-            # Remove header and decrypt
-            encrypted_payload = raw_data[len(self.ENCRYPTION_HEADER):]
-            try:
-                return self.fernet.decrypt(encrypted_payload)
-            except InvalidToken:
-                raise ValueError("Failed to decrypt data - invalid STORAGE_SECRET")
+        envelope = self._parse_envelope(raw_data)
+        if envelope is not None:
+            # Remove header, decrypt and decompress
+            codec, start = envelope
+            if codec == "aead":
+                return b"".join(self._iter_aead_decrypt([raw_data[start:]]))
+            data = self._decrypt_token(raw_data[start:])
+            return b"".join(iter_decompress([data], codec)) if codec else data
         
         # Data is not encrypted
         return raw_data
+
+    def _parse_envelope(self, data: bytes) -> Optional[Tuple[Optional[str], int]]:
+        """
+        Recognize the encryption header at the start of data.
+
+        Args:
+            data: Raw bytes from S3, at least the first 64 if there are that many
+
+        Returns:
+            None if the data is not encrypted, else a tuple of the compression
+            codec (None for V1, "aead" for V3, whose header carries its own)
+            and the offset of the payload
+
+        Raises:
+            ValueError: If a V2 header names an unknown or unavailable codec
+        """
+        if data.startswith(self.ENCRYPTION_HEADER):
+            return None, len(self.ENCRYPTION_HEADER)
+        if data.startswith(self.ENCRYPTION_HEADER_V3):
+            return "aead", len(self.ENCRYPTION_HEADER_V3)
+        if not data.startswith(self.ENCRYPTION_HEADER_V2):
+            return None
+        start = len(self.ENCRYPTION_HEADER_V2)
+        end = data.find(b":", start, start + 16)
+        if end < 0:
+            raise ValueError("Malformed HEARE_ENCRYPTED_V2 header")
+        codec = data[start:end].decode("ascii", "replace")
+        require_codec(codec)
+        return codec, end + 1
+
+    def _decrypt_token(self, token: bytes) -> bytes:
+        """
+        Decrypt a Fernet token (an encrypted payload without its header).
+
+        Args:
+            token: The Fernet token
+
+        Returns:
+            Decrypted data
+
+        Raises:
+            ValueError: If no STORAGE_SECRET is set or it does not match
+        """
+        if not self.fernet:
+            raise ValueError("Data is encrypted but no STORAGE_SECRET provided")
+        try:
+            return self.fernet.decrypt(token)
+        except InvalidToken:
+            raise ValueError("Failed to decrypt data - invalid STORAGE_SECRET")
     
+    def _read_body(self, body) -> Iterator[bytes]:
+        """
+        Stream the plaintext of an S3 object body in chunks.
+
+        Unencrypted bodies are passed through as they are read. V3 (AEAD)
+        bodies are decrypted segment by segment as they are read. Fernet
+        bodies are read whole, since a Fernet token can only be authenticated
+        as a unit, and decrypted with Fernet.decrypt; the plaintext is then
+        handed on in chunks, decompressed first for V2 payloads.
+
+        Args:
+            body: S3 response body (anything with read(size))
+
+        Returns:
+            Iterator over plaintext byte chunks
+        """
+        # Enough for either encryption header, including a V2 codec name
+        head = b""
+        while len(head) < 64:
+            chunk = body.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            head += chunk
+
+        envelope = self._parse_envelope(head)
+        if envelope is not None and envelope[0] == "aead":
+            # Segments are authenticated on their own, so decrypt as they arrive
+            rest = iter(lambda: body.read(READ_CHUNK_SIZE), b"")
+            yield from self._iter_aead_decrypt(chain([head[envelope[1]:]], rest))
+            return
+        if envelope is not None:
+            # Collect the token without the header so it is copied only once
+            codec, start = envelope
+            parts = [head[start:]]
+            del head
+            while chunk := body.read(READ_CHUNK_SIZE):
+                parts.append(chunk)
+            token = b"".join(parts)
+            del parts
+            plaintext = iter_chunks(self._decrypt_token(token))
+            del token
+            if codec:
+                plaintext = iter_decompress(plaintext, codec)
+            yield from plaintext
+            return
+
+        if head:
+            yield head
+        del head
+        while chunk := body.read(READ_CHUNK_SIZE):
+            yield chunk
+
+    def _iter_aead_decrypt(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Decrypt a V3 payload (without its header) into plaintext chunks."""
+        if not self.fernet:
+            raise ValueError("Data is encrypted but no STORAGE_SECRET provided")
+        return iter_aead_decrypt(chunks, self._fernet_key)
+
     def _encrypt_data(self, data: bytes) -> bytes:
         """
         Encrypt data if encryption is enabled.
@@ -74,100 +914,932 @@ class KeyStore:
         Args:
             data: Data to encrypt
             
+        Compresses first if compression is set. Fernet payloads use the V1
+        header, or V2 (which names the codec) when compressed; aead payloads
+        use V3 and record the codec in their own header.
+
         Returns:
             Encrypted data with header, or original data
         """
         if self.encryption_enabled and self.fernet:
+            if self.encryption == "aead":
+                sealed = aead_encrypt(data, self._fernet_key, self.compression)
+                return self.ENCRYPTION_HEADER_V3 + sealed
+            if self.compression:
+                encrypted = self.fernet.encrypt(compress(data, self.compression))
+                return self.ENCRYPTION_HEADER_V2 + self.compression.encode() + b":" + encrypted
             encrypted = self.fernet.encrypt(data)
             return self.ENCRYPTION_HEADER + encrypted
         
         # No encryption
         return data
 
-    def load_from_s3(self) -> int:
+    def load_from_s3(self, force: bool = False) -> int:
         """
         Load keys from S3 into memory.
         
         Supports both encrypted and unencrypted data for transition.
+        Sends the ETag of the last loaded object as IfNoneMatch, so an
+        unchanged object is not downloaded, decrypted or re-indexed.
+        last_load_changed records whether the indexes were replaced.
+
+        Blocking, but safe to run in a worker thread: loads are serialized,
+        the new snapshot is built without holding any lock readers need, and
+        records are parsed one at a time so the GIL is released regularly.
+
+        With a cache_path, a changed keyring is saved to the cache (at most
+        once per cache_write_interval, see flush_local_copies) and an
+        unchanged one marks the cache as revalidated. Cache errors never fail
+        the load; they are recorded in cache_error. Likewise, while this
+        store holds the index lock a changed keyring is written to
+        index_path (at most once per index_write_interval), and failures are
+        recorded in index_error.
+
+        With compiled_index, an up-to-date compiled index replaces the
+        keyring download and parse (see _load_compiled); otherwise the
+        keyring is loaded as usual.
+
+        Args:
+            force: Skip the conditional request and always reload
 
         Returns:
             Number of keys loaded
         """
+        with self._load_lock:
+            count = self._load_compiled(force) if self.compiled_index else None
+            if count is None:
+                count = self._load_from_s3(force)
+            if self.last_load_changed:
+                self._cache_stale = self._index_stale = True
+            self._write_local_copies(synced=True)
+            return count
+
+    def flush_local_copies(self) -> None:
+        """
+        Write cache_path and index_path if they lag the published keyring.
+
+        Both are rewritten in full, so after changes each is written at most
+        once per cache_write_interval / index_write_interval seconds. A load
+        that lands inside the interval leaves the file behind; call this
+        periodically to write it once the interval has passed. Failures are
+        recorded in cache_error and index_error.
+        """
+        with self._load_lock:
+            self._write_local_copies()
+
+    def _write_local_copies(self, synced: bool = False) -> None:
+        # A compiled index is already in index_path, and is its own cache
+        if not isinstance(self.snapshot, KeySnapshot):
+            return
+        now = time.monotonic()
+        if self.cache_path:
+            try:
+                if not os.path.exists(self.cache_path) or (
+                    self._cache_stale and now - self._cache_written_at >= self.cache_write_interval
+                ):
+                    self.save_cache()
+                    self._cache_stale = False
+                    self._cache_written_at = now
+                elif synced and not self._cache_stale:
+                    os.utime(self.cache_path)  # S3 just confirmed the cached keyring
+                self.cache_error = None
+            except OSError as e:
+                self.cache_error = str(e)
+        if self.index_leader:
+            try:
+                if not os.path.exists(self.index_path) or (
+                    self._index_stale and now - self._index_written_at >= self.index_write_interval
+                ):
+                    self.save_index()
+                    self._index_stale = False
+                    self._index_written_at = now
+                self.index_error = None
+            except OSError as e:
+                self.index_error = str(e)
+
+    def _cache_source(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+    def save_cache(self) -> None:
+        """
+        Save the current keyring to cache_path, encrypted like the S3 object.
+
+        The file is a one-line JSON header (cache version, source, ETag,
+        LastModified and log position, none of them secret) followed by the
+        keys as an encrypted binary snapshot. It is created readable by this
+        user only, written to a temporary file and renamed into place, so a
+        crash never leaves a torn cache. The file's mtime records when S3
+        last confirmed its contents.
+
+        Raises:
+            OSError: If the cache cannot be written
+            ValueError: If the current snapshot is a mapped index
+        """
+        snapshot = self._parsed_snapshot()
+        header = {
+            "version": CACHE_VERSION,
+            "source": self._cache_source(),
+            "etag": snapshot.etag,
+            "last_modified": snapshot.last_modified.isoformat() if snapshot.last_modified else None,
+            "log_seq": snapshot.log_seq,
+        }
+        body = self._encrypt_data(serialize_snapshot(list(snapshot.keys_by_id.values())))
+
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.cache_path}.{uuid.uuid4().hex}.tmp"
         try:
-            response = self.s3.get_object(Bucket=self.bucket, Key=self.key)
-            raw_data = response["Body"].read()
-            
-            # Decrypt if needed
-            decrypted_data = self._decrypt_data(raw_data)
-            
-            # Parse JSON
-            data = json.loads(decrypted_data)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                f.write(body)
+            os.replace(temp_path, self.cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def load_cache(self) -> Optional[int]:
+        """
+        Publish the keyring saved in cache_path, without contacting S3.
+
+        The cached ETag is kept, so the next load_from_s3 is a conditional
+        request that costs one 304 if the keyring has not changed since.
+        last_synced_at is set to the cache's mtime, when S3 last confirmed it.
+        The index lock holder also writes index_path, so the other workers
+        can serve the cached keyring while S3 is unreachable; a failed write
+        is recorded in index_error.
+
+        Returns:
+            Number of keys loaded, or None if there is no usable cache (no
+            cache_path, no file, or a file for another version or keyring)
+
+        Raises:
+            ValueError: If the cache is corrupt or cannot be decrypted
+        """
+        if not self.cache_path:
+            return None
+        try:
+            f = open(self.cache_path, "rb")
+        except FileNotFoundError:
+            return None
+
+        with self._load_lock, f:
+            synced_at = os.fstat(f.fileno()).st_mtime
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                raise ValueError(f"Corrupt keyring cache header in {self.cache_path}") from None
+            if (
+                header.get("version") != CACHE_VERSION
+                or header.get("source") != self._cache_source()
+            ):
+                return None
+
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                snapshot = KeySnapshot.build(
+                    iter_keyring(self._read_body(f)),
+                    etag=header.get("etag"),
+                    last_modified=(
+                        datetime.fromisoformat(header["last_modified"])
+                        if header.get("last_modified")
+                        else None
+                    ),
+                    log_seq=header.get("log_seq", 0),
+                )
+                self._publish(snapshot)
+                gc.freeze()
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            # Written now however recently it was, so followers can start
+            self._index_stale = True
+            self._index_written_at = float("-inf")
+            self._write_local_copies()
+
+        self.last_synced_at = synced_at
+        return len(snapshot.keys_by_secret)
 
-            # Build both indices for fast lookup
-            self.keys_by_secret = {k["secret"]: k for k in data["keys"]}
-            self.keys_by_id = {k["id"]: k for k in data["keys"]}
+    @property
+    def index_leader(self) -> bool:
+        """Whether this store holds the index lock, and so writes index_path."""
+        return self._index_lock is not None
+
+    def acquire_index_lock(self) -> bool:
+        """
+        Try to become the one store that loads from S3 and writes index_path.
 
-            return len(self.keys_by_secret)
+        Takes an exclusive flock on "<index_path>.lock" without waiting and
+        writes this process's PID into it (see index_lock_holder). The lock
+        is held until the process exits, so when the holder dies another
+        store can take over.
+
+        Returns:
+            Whether this store now holds the lock
+        """
+        if self._index_lock is not None:
+            return True
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(f"{self.index_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(os.getpid()).encode("ascii"), 0)
+        self._index_lock = fd
+        return True
+
+    def index_lock_holder(self) -> Optional[int]:
+        """
+        Get the PID of the process holding the index lock.
+
+        Returns:
+            The PID, or None if there is no index_path or no holder has
+            recorded itself yet
+        """
+        if not self.index_path:
+            return None
+        if self._index_lock is not None:
+            return os.getpid()
+        try:
+            with open(f"{self.index_path}.lock", "rb") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def save_index(self) -> None:
+        """
+        Write the current keyring to index_path for other processes to map.
+
+        Raises:
+            OSError: If the index cannot be written
+            ValueError: If the current snapshot is a mapped index
+        """
+        write_index(self.index_path, self._parsed_snapshot())
+
+    def load_index(self) -> Optional[int]:
+        """
+        Publish the keyring in index_path, mapped rather than parsed.
+
+        The file is only mapped again once it has been replaced, so calling
+        this often costs one stat. The mapped snapshot keeps the generation
+        the writer gave it. last_load_changed records whether it was replaced,
+        and last_synced_at is set to the file's mtime, when it was written.
+
+        Returns:
+            Number of keys in the index, or None if there is no index file
+
+        Raises:
+            ValueError: If the index file is invalid
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            self.last_load_changed = False
+            return None
+
+        current = self.snapshot
+        if isinstance(current, MappedSnapshot) and current.file_id == (stat.st_dev, stat.st_ino):
+            self.last_load_changed = False
+            return current.key_count
+
+        try:
+            snapshot = MappedSnapshot(self.index_path)
+        except FileNotFoundError:
+            self.last_load_changed = False
+            return None
+        with self._publish_lock:
+            self.snapshot = snapshot
+        self.last_load_changed = True
+        self.last_synced_at = stat.st_mtime
+        return snapshot.key_count
+
+    def compile_index(self) -> int:
+        """
+        Compile the current keyring into a lookup file at <key>.index.
+
+        The file is an index file (see write_index) built on a minimal
+        perfect hash, encrypted like the keyring. It records the ETag of the
+        keyring it was compiled from, so it goes stale as soon as the keyring
+        is written again; compile again after changing keys.
+
+        Returns:
+            Size of the compiled index in bytes, before encryption
+        """
+        fd, path = tempfile.mkstemp(suffix=COMPILED_INDEX_SUFFIX)
+        os.close(fd)
+        try:
+            write_index(path, self.snapshot, perfect=True)
+            with open(path, "rb") as f:
+                data = f.read()
+        finally:
+            os.remove(path)
+
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self.compiled_key,
+            Body=self._encrypt_data(data),
+            ContentType="application/octet-stream",
+            Metadata={SOURCE_ETAG_METADATA: self.etag or "", LOG_SEQ_METADATA: str(self.log_seq)},
+        )
+        return len(data)
+
+    def _load_compiled(self, force: bool) -> Optional[int]:
+        """
+        Map the compiled index if it matches the keyring object in S3.
+
+        One HEAD request checks the keyring's ETag. If the current snapshot
+        is a mapped index of that same keyring, nothing else is fetched
+        (with change_log, the log is listed for newer records). Otherwise a
+        HEAD of the compiled index checks which keyring and log position it
+        was compiled from. Only if it is this keyring and no newer change
+        records exist is it streamed (and decrypted) into index_path, where
+        the other workers map it too, and mapped: no key is parsed, and
+        pages are read as lookups touch them.
+
+        Returns:
+            Number of keys, or None if the keyring has to be loaded instead:
+            there is no keyring or compiled index, the compiled index is for
+            another version of the keyring, or change records are newer
+            than it
+        """
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        source_etag = head.get("ETag")
+
+        current = self.snapshot
+        if not force and current.etag == source_etag and isinstance(current, MappedSnapshot):
+            if self._has_changes(after=current.log_seq):
+                return None
+            self.last_load_changed = False
+            self.last_synced_at = time.time()
+            return current.key_count
+
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=self.compiled_key)
+            metadata = head.get("Metadata", {})
+            if metadata.get(SOURCE_ETAG_METADATA) != source_etag:
+                return None
+            # Records appended since the compile make it stale; don't download it
+            if self._has_changes(after=int(metadata.get(LOG_SEQ_METADATA, 0))):
+                return None
+            response = self.s3.get_object(Bucket=self.bucket, Key=self.compiled_key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        if response.get("Metadata", {}).get(SOURCE_ETAG_METADATA) != source_etag:
+            # Compiled again, for a newer keyring, since the HEAD
+            response["Body"].close()
+            return None
+
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in self._read_body(response["Body"]):
+                    f.write(chunk)
+            set_index_generation(temp_path, self.generation + 1)
+            snapshot = MappedSnapshot(temp_path)
+            os.replace(temp_path, self.index_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        with self._publish_lock:
+            self.snapshot = snapshot
+        self.last_load_changed = True
+        self.last_synced_at = time.time()
+        return snapshot.key_count
+
+    def _load_from_s3(self, force: bool) -> int:
+        request = {"Bucket": self.bucket, "Key": self.key}
+        # A mapped index cannot be the base for a reload, so fetch it all
+        if self.etag and not force and isinstance(self.snapshot, KeySnapshot):
+            request["IfNoneMatch"] = self.etag
+
+        response = None
+        try:
+            response = self.s3.get_object(**request)
         except ClientError as e:
-            if e.response["Error"]["Code"] == "NoSuchKey":
+            error_code = e.response["Error"]["Code"]
+            status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if status == 304 or error_code in ("304", "NotModified"):
+                # Unchanged since the last load, keep the current indexes
+                base = self.snapshot
+            elif error_code == "NoSuchKey":
                 # File doesn't exist yet, start with empty store
-                self.keys_by_secret = {}
-                self.keys_by_id = {}
+                base = KeySnapshot(loaded_at=time.time())
+            else:
+                raise
+
+        # Parse JSON record by record straight into the new indexes.
+        # Building millions of dicts would otherwise trigger ever longer
+        # full GC passes, each one stalling every thread; pausing the
+        # collector and freezing the published keyring avoids both.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if response is not None:
+                metadata = response.get("Metadata", {})
+                if metadata.get(FORMAT_METADATA) == MANIFEST_FORMAT:
+                    manifest = parse_manifest(b"".join(self._read_body(response["Body"])))
+                    keys = self._iter_shards(manifest)
+                else:
+                    keys = iter_keyring(self._read_body(response["Body"]))
+                base = KeySnapshot.build(
+                    keys,
+                    etag=response.get("ETag"),
+                    last_modified=response.get("LastModified"),
+                    log_seq=int(metadata.get(LOG_SEQ_METADATA, 0)),
+                )
+
+            snapshot = base
+            if self.change_log:
+                snapshot = base.with_changes(self.read_changes(after=base.log_seq))
+
+            changed = snapshot is not self.snapshot
+            if changed:
+                self._publish(snapshot)
+                gc.freeze()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        self.last_load_changed = changed
+        self.last_synced_at = time.time()
+        return len(snapshot.keys_by_secret)
+
+    def set_keys(
+        self,
+        keys: Iterable[dict],
+        etag: Optional[str] = None,
+        last_modified: Optional[datetime] = None,
+    ) -> int:
+        """
+        Replace the in-memory keyring with the given keys.
+
+        Builds a new KeySnapshot off to the side and publishes it with a single
+        reference swap, so concurrent readers see either the old or the new
+        keyring, never a mix.
+
+        Args:
+            keys: Key dictionaries
+            etag: ETag of the S3 object the keys came from
+            last_modified: LastModified of the S3 object the keys came from
+
+        Returns:
+            Number of keys indexed
+        """
+        snapshot = KeySnapshot.build(keys, etag=etag, last_modified=last_modified)
+        self._publish(snapshot)
+        return len(snapshot.keys_by_secret)
+
+    def _publish(self, snapshot: KeySnapshot, base: Optional[KeySnapshot] = None) -> bool:
+        """
+        Make a snapshot current, assigning it the next generation number.
+
+        Args:
+            snapshot: The unpublished snapshot
+            base: If given, only publish if this is still the current snapshot
+
+        Returns:
+            Whether the snapshot was published
+        """
+        with self._publish_lock:
+            if base is not None and self.snapshot is not base:
+                return False
+            self.snapshot = dataclasses.replace(snapshot, generation=self.snapshot.generation + 1)
+            return True
+
+    def remove_expired(self, now: Optional[float] = None) -> int:
+        """
+        Drop keys whose expiry has passed by publishing a snapshot without them.
+
+        If a load publishes a new snapshot in the meantime, the pruned one is
+        discarded; the next sweep prunes the new keyring instead.
+
+        Args:
+            now: Current epoch time (defaults to time.time())
+
+        Returns:
+            Number of keys removed
+        """
+        if now is None:
+            now = time.time()
+
+        base = self.snapshot
+        snapshot, removed = base.without_expired(now)
+        if removed and self._publish(snapshot, base=base):
+            return removed
+        return 0
+
+    def next_expiry(self) -> Optional[float]:
+        """
+        Get the earliest upcoming expiry.
+
+        Returns:
+            Epoch timestamp of the next key to expire, or None if none expire
+        """
+        expiry_order = self.snapshot.expiry_order
+        return expiry_order[0][0] if expiry_order else None
+
+    def _log_key(self, seq: int) -> str:
+        """S3 key of a change log record; zero padding makes listing order seq order."""
+        return f"{self.log_prefix}{seq:020d}.json"
+
+    def _list_log(self, after: int = 0) -> Iterator[Tuple[int, str]]:
+        """
+        List change log records with a sequence number above `after`.
+
+        Args:
+            after: Sequence number already applied
+
+        Returns:
+            Iterator over (seq, S3 key) in sequence order
+        """
+        request = {"Bucket": self.bucket, "Prefix": self.log_prefix}
+        if after:
+            request["StartAfter"] = self._log_key(after)
+        while True:
+            page = self.s3.list_objects_v2(**request)
+            for obj in page.get("Contents", []):
+                name = obj["Key"][len(self.log_prefix):]
+                if name.endswith(".json") and name[:-5].isdigit():
+                    yield int(name[:-5]), obj["Key"]
+            if not page.get("IsTruncated"):
+                return
+            request["ContinuationToken"] = page["NextContinuationToken"]
+
+    def _has_changes(self, after: int) -> bool:
+        """Whether change_log is on and lists a record above `after`, without fetching any."""
+        return self.change_log and next(self._list_log(after), None) is not None
+
+    def _fetch_change(self, log_key: str) -> dict:
+        """Fetch and decrypt one change log record."""
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=log_key)
+        except ClientError as e:
+            raise ValueError(f"Failed to fetch change log record {log_key}: {e}") from e
+        return json.loads(self._decrypt_data(response["Body"].read()))
+
+    def read_changes(self, after: int = 0) -> List[dict]:
+        """
+        Fetch the change log records newer than a sequence number.
+
+        Only the records after `after` are listed and downloaded, so the S3
+        traffic of a refresh is proportional to the number of new changes
+        (applying them copies the indexes, see KeySnapshot.with_changes).
+
+        Args:
+            after: Sequence number already applied
+
+        Returns:
+            Change records in sequence order
+        """
+        log_keys = [log_key for _, log_key in self._list_log(after)]
+        if not log_keys:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, len(log_keys)))) as pool:
+            return list(pool.map(self._fetch_change, log_keys))
+
+    def read_log_seq(self) -> int:
+        """
+        Read the last change log record folded into the keyring at S3_KEY.
+
+        Returns:
+            The sequence number, or 0 if the keyring is missing or has none
+        """
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
                 return 0
             raise
+        return int(head.get("Metadata", {}).get(LOG_SEQ_METADATA, 0))
 
-    def save_to_s3(self, keys: List[dict]) -> None:
+    def append_change(
+        self, op: str, key_data: Optional[dict] = None, key_id: Optional[str] = None
+    ) -> int:
         """
-        Save keys to S3 with optional encryption.
+        Append an individually encrypted record to the change log.
+
+        The record takes the next sequence number and is written with
+        If-None-Match: *, so two writers can never claim the same number;
+        the loser retries with the following one. A compact may fold and
+        delete records while this runs; a record written at or below the
+        position it folded would be ignored by services, so it is written
+        again above that position.
 
         Args:
-            keys: List of key dictionaries to save
+            op: One of CHANGE_OPS
+            key_data: The full key, for create and update
+            key_id: The key ID, for delete
+
+        Returns:
+            The record's sequence number
+
+        Raises:
+            ValueError: If the op or its arguments are invalid
+        """
+        if op not in CHANGE_OPS:
+            raise ValueError(f"Unknown change log op: {op}")
+        if op == "delete":
+            if not key_id:
+                raise ValueError("delete records need a key_id")
+            record = {"op": op, "key_id": key_id}
+        else:
+            if not key_data:
+                raise ValueError(f"{op} records need the key data")
+            record = {"op": op, "key": key_data}
+
+        # List before reading the folded position: a compact in between
+        # deletes records, but only after recording a position covering them
+        last = 0
+        for last, _ in self._list_log():
+            pass
+        seq = max(last, self.read_log_seq())
+
+        while True:
+            seq += 1
+            record["seq"] = seq
+            record["created_at"] = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+            try:
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=self._log_key(seq),
+                    Body=self._encrypt_data(json.dumps(record).encode('utf-8')),
+                    ContentType=(
+                        "application/octet-stream"
+                        if self.encryption_enabled
+                        else "application/json"
+                    ),
+                    IfNoneMatch="*",
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("PreconditionFailed", "412"):
+                    raise
+                continue
+            folded = self.read_log_seq()
+            if seq > folded:
+                return seq
+            seq = folded
+
+    def delete_changes(self, through: int) -> int:
         """
-        data = {"keys": keys}
-        json_data = json.dumps(data, indent=2).encode('utf-8')
+        Delete change log records up to and including a sequence number.
+
+        Args:
+            through: Last sequence number to delete
+
+        Returns:
+            Number of records deleted
+        """
+        deleted = 0
+        for seq, log_key in self._list_log():
+            if seq > through:
+                break
+            self.s3.delete_object(Bucket=self.bucket, Key=log_key)
+            deleted += 1
+        return deleted
+
+    def _iter_shards(self, manifest: dict) -> Iterator[dict]:
+        """
+        Fetch, decrypt and parse every shard in a manifest concurrently.
+
+        Shards are yielded in manifest order, so the snapshot build overlaps
+        with the downloads still in flight.
+
+        Args:
+            manifest: The shard manifest
+
+        Returns:
+            Iterator over the key dictionaries of all shards
+        """
+        shards = manifest["shards"]
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, min(self.fetch_workers, len(shards))),
+            thread_name_prefix="heare-auth-shard",
+        )
+        try:
+            futures = [pool.submit(self._fetch_shard, shard_key) for shard_key in shards]
+            for future in futures:
+                yield from future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch_shard(self, shard_key: str) -> List[dict]:
+        """
+        Fetch, decrypt and parse one shard object.
+
+        Args:
+            shard_key: S3 key of the shard
+
+        Returns:
+            The shard's key dictionaries
+
+        Raises:
+            ValueError: If the shard is missing, so a load never mistakes it for an empty keyring
+        """
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=shard_key)
+        except ClientError as e:
+            raise ValueError(f"Failed to fetch keyring shard {shard_key}: {e}") from e
+        return list(iter_keyring(self._read_body(response["Body"])))
+
+    def _serialize_keys(self, keys: List[dict]) -> bytes:
+        """Serialize keys in keyring_format, encrypted if enabled."""
+        if self.keyring_format == "binary":
+            data = serialize_snapshot(keys)
+        else:
+            data = json.dumps({"keys": keys}, indent=2, default=dict).encode('utf-8')
         
         # Encrypt if enabled
-        body_data = self._encrypt_data(json_data)
-        
+        return self._encrypt_data(data)
+
+    def _put(self, key: str, body: bytes, metadata: Optional[Dict[str, str]] = None) -> None:
+        """Write a keyring object (a single-file keyring or a shard)."""
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType=(
+                "application/octet-stream"
+                if self.encryption_enabled or self.keyring_format == "binary"
+                else "application/json"
+            ),
+            Metadata=metadata or {},
+        )
+
+    def read_manifest(self) -> Optional[dict]:
+        """
+        Fetch the shard manifest, if the keyring is sharded.
+
+        Returns:
+            The manifest, or None if S3_KEY holds a single-file keyring or nothing
+        """
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        metadata = head.get("Metadata", {})
+        if metadata.get(FORMAT_METADATA) != MANIFEST_FORMAT:
+            return None
+
+        response = self.s3.get_object(Bucket=self.bucket, Key=self.key)
+        manifest = parse_manifest(b"".join(self._read_body(response["Body"])))
+        manifest["log_seq"] = int(metadata.get(LOG_SEQ_METADATA, 0))
+        return manifest
+
+    def read_shard(self, manifest: dict, index: int) -> List[dict]:
+        """
+        Load the keys of one shard.
+
+        Args:
+            manifest: The shard manifest
+            index: Shard index
+
+        Returns:
+            List of key dictionaries in the shard
+        """
+        return self._fetch_shard(manifest["shards"][index])
+
+    def _put_shard(self, index: int, keys: List[dict]) -> str:
+        """Write a shard to a new, never overwritten object and return its S3 key."""
+        shard_key = f"{self.key}.shards/{index:04d}-{uuid.uuid4().hex}.json"
+        self._put(shard_key, self._serialize_keys(keys))
+        return shard_key
+
+    def _put_manifest(self, shards: List[str], log_seq: int = 0) -> dict:
+        """Write the manifest at S3_KEY and return it."""
+        manifest = {"version": MANIFEST_VERSION, "shard_count": len(shards), "shards": shards}
+        metadata = {FORMAT_METADATA: MANIFEST_FORMAT}
+        if log_seq:
+            metadata[LOG_SEQ_METADATA] = str(log_seq)
         self.s3.put_object(
             Bucket=self.bucket,
             Key=self.key,
-            Body=body_data,
-            ContentType="application/octet-stream" if self.encryption_enabled else "application/json",
+            Body=json.dumps(manifest, indent=2).encode('utf-8'),
+            ContentType="application/json",
+            Metadata=metadata,
         )
+        return {**manifest, "log_seq": log_seq}
 
-    def get_by_secret(self, secret: str) -> Optional[dict]:
+    def _delete_shards(self, shard_keys: List[str]) -> None:
+        """Delete shard objects no longer referenced by the manifest."""
+        for shard_key in shard_keys:
+            self.s3.delete_object(Bucket=self.bucket, Key=shard_key)
+
+    def write_shard(self, manifest: dict, index: int, keys: List[dict]) -> dict:
         """
-        Get key metadata by secret (for authentication).
-        
-        Checks expiration and returns None if expired.
+        Replace the keys of one shard, leaving the other shards untouched.
+
+        The shard is written to a new object and the manifest is then pointed
+        at it, so a concurrent load sees either the old or the new shard.
+
+        Args:
+            manifest: The current shard manifest
+            index: Shard index
+            keys: The shard's complete new list of keys
+
+        Returns:
+            The new manifest
+        """
+        shards = list(manifest["shards"])
+        old_shard = shards[index]
+        shards[index] = self._put_shard(index, keys)
+        new_manifest = self._put_manifest(shards, manifest.get("log_seq", 0))
+        self._delete_shards([old_shard])
+        return new_manifest
+
+    def save_sharded(self, keys: List[dict], shard_count: int, log_seq: int = 0) -> dict:
+        """
+        Save keys as shard_count shards plus a manifest, replacing any existing layout.
+
+        Args:
+            keys: List of key dictionaries to save
+            shard_count: Number of shards
+            log_seq: Last change log record folded into the keys
+
+        Returns:
+            The new manifest
+
+        Raises:
+            ValueError: If shard_count is less than 1
+        """
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+
+        old_manifest = self.read_manifest()
+        partitions = [[] for _ in range(shard_count)]
+        for k in keys:
+            partitions[shard_index(k["id"], shard_count)].append(k)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.fetch_workers, shard_count))) as pool:
+            shards = list(pool.map(self._put_shard, range(shard_count), partitions))
+        manifest = self._put_manifest(shards, log_seq)
+
+        if old_manifest is not None:
+            self._delete_shards(old_manifest["shards"])
+        return manifest
+
+    def save_to_s3(self, keys: List[dict], log_seq: int = 0) -> None:
+        """
+        Save keys to S3 with optional encryption, as a single-file keyring.
+
+        If the keyring was sharded, the manifest is replaced and its shards
+        are deleted.
+
+        Args:
+            keys: List of key dictionaries to save
+            log_seq: Last change log record folded into the keys
+        """
+        old_manifest = self.read_manifest()
+        metadata = {LOG_SEQ_METADATA: str(log_seq)} if log_seq else None
+        self._put(self.key, self._serialize_keys(keys), metadata)
+        if old_manifest is not None:
+            self._delete_shards(old_manifest["shards"])
+
+    def get_by_secret(self, secret: str) -> Optional[KeyRecord]:
+        """
+        Get key metadata by secret from the current snapshot.
+
+        Callers that make several lookups for one request should hold
+        self.snapshot and query it directly so they all agree.
 
         Args:
             secret: The secret value to look up
 
         Returns:
-            Key data dictionary if found and not expired, None otherwise
+            Key record if found and not expired, None otherwise
         """
-        key_data = self.keys_by_secret.get(secret)
-        
-        if key_data is None:
-            return None
-        
-        # Check if expired
-        expires_at = key_data.get("expires_at")
-        if expires_at:
-            try:
-                expiry = datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
-                now = datetime.now(timezone.utc)
-                if now > expiry:
-                    return None  # Key has expired
-            except (ValueError, AttributeError):
-                # Invalid expiry format, treat as not expired
-                pass
-        
-        return key_data
+        return self.snapshot.get_by_secret(secret)
+
+    def get_verify_response(self, secret: str, key_data: KeyRecord) -> bytes:
+        """
+        Get the pre-serialized /verify response body from the current snapshot.
 
-    def get_by_id(self, key_id: str) -> Optional[dict]:
+        Args:
+            secret: The secret the key was looked up by
+            key_data: Key record returned by get_by_secret
+
+        Returns:
+            UTF-8 encoded JSON response body
+        """
+        return self.snapshot.get_verify_response(secret, key_data)
+
+    def get_by_id(self, key_id: str) -> Optional[KeyRecord]:
         """
         Get key metadata by ID (for lookup).
 
@@ -175,15 +1847,22 @@ class KeyStore:
             key_id: The key ID to look up
 
         Returns:
-            Key data dictionary if found, None otherwise
+            Key record if found, None otherwise
+
+        Raises:
+            ValueError: If the current snapshot is a mapped index
         """
         return self.keys_by_id.get(key_id)
 
-    def get_all_keys(self) -> List[dict]:
+    def get_all_keys(self) -> List[KeyRecord]:
         """
         Get all keys.
 
         Returns:
-            List of all key dictionaries
+            List of all key records; they are read-only Mappings, so use
+            dict(record) for a copy to modify
+
+        Raises:
+            ValueError: If the current snapshot is a mapped index
         """
         return list(self.keys_by_id.values())
@@ -0,0 +1,59 @@
+"""Logging and metrics shared by every endpoint that verifies a key."""
+
+import time
+from typing import Optional, Union
+
+import structlog
+
+from .shared_index import MappedKey, MappedSnapshot
+from .stats import get_metrics
+from .storage import KeyRecord, KeySnapshot
+
+logger = structlog.get_logger()
+
+
+def record_verification(
+    snapshot: Union[KeySnapshot, MappedSnapshot],
+    secret: str,
+    key_data: Optional[Union[KeyRecord, MappedKey]],
+    start_time: float,
+    **log_fields,
+) -> None:
+    """
+    Log and count one verification.
+
+    /verify (and its fast path), /auth and the gRPC service all record
+    verifications here, so their log events and metrics stay the same.
+
+    Args:
+        snapshot: Snapshot the secret was looked up in
+        secret: The secret that was checked; only a prefix of it is logged,
+            and only if it matched no key
+        key_data: The key the secret matched, or None
+        start_time: time.time() when the request started
+        **log_fields: Transport details to log, e.g. user_agent or peer
+    """
+    metrics = get_metrics()
+
+    if key_data is None:
+        logger.warning(
+            "verification_failed",
+            secret_prefix=secret[:4] if len(secret) >= 4 else "***",
+            **log_fields,
+            generation=snapshot.generation,
+        )
+        metrics.incr('verify.requests')
+        metrics.incr('verify.failed')
+    else:
+        # Log successful verification with key_id (NOT secret)
+        logger.info(
+            "verification_success",
+            key_id=key_data.id,
+            key_name=key_data.name,
+            **log_fields,
+            generation=snapshot.generation,
+        )
+        metrics.incr('verify.requests')
+        metrics.incr('verify.success')
+
+    metrics.time('verify.duration', (time.time() - start_time) * 1000)
@@ -0,0 +1,128 @@
+"""Control sockets that let the worker processes of one host reach each other."""
+
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+SOCKET_SUFFIX = ".sock"
+
+
+def socket_path(directory: str, pid: int) -> str:
+    """Control socket path of the worker with the given PID."""
+    return os.path.join(directory, f"{pid}{SOCKET_SUFFIX}")
+
+
+def worker_pids(directory: str) -> List[int]:
+    """
+    List the PIDs of the workers with a control socket in directory.
+
+    Sockets left by workers that exited are included until a command to
+    them fails and removes them.
+
+    Args:
+        directory: Control socket directory
+
+    Returns:
+        Sorted PIDs
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    pids = []
+    for name in names:
+        stem, suffix = os.path.splitext(name)
+        if suffix == SOCKET_SUFFIX and stem.isdigit():
+            pids.append(int(stem))
+    return sorted(pids)
+
+
+async def serve_control(
+    directory: str, handler: Callable[[str], Awaitable[dict]]
+) -> asyncio.AbstractServer:
+    """
+    Listen for commands on this worker's control socket.
+
+    Each connection carries one command line and gets one JSON line back,
+    the handler's result.
+
+    Args:
+        directory: Control socket directory, created if needed
+        handler: Coroutine function called with the command
+
+    Returns:
+        The listening server; stop it with stop_control
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = socket_path(directory, os.getpid())
+    if os.path.lexists(path):
+        os.unlink(path)
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            command = (await reader.readline()).decode("utf-8", "replace").strip()
+            result = await handler(command)
+            writer.write(json.dumps(result).encode("utf-8") + b"\n")
+            await writer.drain()
+        except Exception as e:
+            logger.error("control_command_failed", error=str(e))
+        finally:
+            writer.close()
+
+    return await asyncio.start_unix_server(on_connection, path=path)
+
+
+async def stop_control(server: asyncio.AbstractServer, directory: str) -> None:
+    """Close this worker's control socket and remove its file."""
+    server.close()
+    await server.wait_closed()
+    path = socket_path(directory, os.getpid())
+    if os.path.lexists(path):
+        os.unlink(path)
+
+
+async def send_command(directory: str, pid: int, command: str, timeout: float) -> Optional[dict]:
+    """
+    Send a command to another worker and wait for its result.
+
+    Args:
+        directory: Control socket directory
+        pid: The worker's PID
+        command: Command to send
+        timeout: Seconds to wait for the result
+
+    Returns:
+        The worker's result, or None if the worker is gone (its socket
+        file, if any, is removed)
+
+    Raises:
+        TimeoutError: If the worker did not answer in time
+        OSError: If the worker could not be reached
+        ValueError: If the worker's answer is not a JSON object
+    """
+    path = socket_path(directory, pid)
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(path), timeout)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Nobody listens on it any more, so its worker has exited
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return None
+
+    try:
+        writer.write(command.encode("utf-8") + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    finally:
+        writer.close()
+    result = json.loads(line) if line else None
+    if not isinstance(result, dict):
+        raise ValueError(f"Invalid answer from worker {pid}")
+    return result
@@ -0,0 +1,89 @@
+"""Shared test fixtures."""
+
+import hashlib
+import io
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+class MemoryS3:
+    """In-memory stand-in for the S3 client calls KeyStore makes."""
+
+    def __init__(self):
+        self.objects = {}  # key -> (body, metadata, etag)
+        self.puts = []
+        self.gets = []
+
+    def _missing(self, operation, code="NoSuchKey"):
+        return ClientError(
+            {
+                "Error": {"Code": code, "Message": "Not Found"},
+                "ResponseMetadata": {"HTTPStatusCode": 404},
+            },
+            operation,
+        )
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None, IfNoneMatch=None):  # noqa: N803
+        if IfNoneMatch == "*" and Key in self.objects:
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "PreconditionFailed",
+                        "Message": "At least one of the pre-conditions you specified did not hold",
+                    },
+                    "ResponseMetadata": {"HTTPStatusCode": 412},
+                },
+                "PutObject",
+            )
+        etag = '"' + hashlib.md5(Body).hexdigest() + '"'
+        self.objects[Key] = (Body, dict(Metadata or {}), etag)
+        self.puts.append(Key)
+        return {"ETag": etag}
+
+    def head_object(self, Bucket, Key):  # noqa: N803
+        if Key not in self.objects:
+            raise self._missing("HeadObject", "404")
+        _, metadata, etag = self.objects[Key]
+        return {"ETag": etag, "Metadata": metadata}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # noqa: N803
+        self.gets.append(Key)
+        if Key not in self.objects:
+            raise self._missing("GetObject")
+        body, metadata, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError(
+                {
+                    "Error": {"Code": "304", "Message": "Not Modified"},
+                    "ResponseMetadata": {"HTTPStatusCode": 304},
+                },
+                "GetObject",
+            )
+        return {
+            "Body": io.BytesIO(body),
+            "ETag": etag,
+            "LastModified": datetime(2025, 1, 1, tzinfo=timezone.utc),
+            "Metadata": metadata,
+        }
+
+    def delete_object(self, Bucket, Key):  # noqa: N803
+        self.objects.pop(Key, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", StartAfter="", ContinuationToken=None, MaxKeys=2):  # noqa: N803
+        # Small pages so callers have to follow continuation tokens
+        start = ContinuationToken or StartAfter
+        keys = sorted(k for k in self.objects if k.startswith(Prefix) and k > start)
+        page = keys[:MaxKeys]
+        response = {"Contents": [{"Key": k} for k in page], "IsTruncated": len(keys) > MaxKeys}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+
+@pytest.fixture
+def memory_s3():
+    """An empty in-memory S3 bucket."""
+    return MemoryS3()
@@ -1,9 +1,15 @@
 """Tests for FastAPI endpoints."""
 
+import asyncio
+import os
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 
+import heare_auth.main as main
 from heare_auth.main import app, store
+from heare_auth.storage import KeyStore
 
 client = TestClient(app)
 
@@ -11,26 +17,17 @@ client = TestClient(app)
 @pytest.fixture
 def setup_test_keys():
     """Setup test keys in the store."""
-    store.keys_by_secret = {
-        "sec_test123": {
-            "id": "key_test456",
-            "secret": "sec_test123",
-            "name": "Test Key",
-            "metadata": {"env": "test"},
-        }
-    }
-    store.keys_by_id = {
-        "key_test456": {
+    store.set_keys([
+        {
             "id": "key_test456",
             "secret": "sec_test123",
             "name": "Test Key",
             "metadata": {"env": "test"},
         }
-    }
+    ])
     yield
     # Cleanup
-    store.keys_by_secret = {}
-    store.keys_by_id = {}
+    store.set_keys([])
 
 
 def test_verify_valid_key(setup_test_keys):
@@ -49,7 +46,7 @@ def test_verify_valid_key(setup_test_keys):
 
 def test_verify_invalid_key():
     """Test verifying an invalid API key."""
-    store.keys_by_secret = {}
+    store.set_keys([])
 
     response = client.post("/verify", json={"api_key": "invalid_secret"})
 
@@ -62,6 +59,85 @@ def test_verify_missing_api_key():
     assert response.status_code == 422  # Validation error
 
 
+def test_verify_batch(setup_test_keys):
+    """Test verifying several API keys in one request."""
+    response = client.post(
+        "/verify/batch", json={"api_keys": ["sec_test123", "invalid_secret", "sec_test123"]}
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 3
+    assert results[0]["valid"] is True
+    assert results[0]["key_id"] == "key_test456"
+    assert results[0]["metadata"] == {"env": "test"}
+    assert results[1]["valid"] is False
+    assert results[1]["error"] == "Invalid API key"
+    assert results[2]["valid"] is True
+
+
+def test_verify_batch_empty():
+    """Test that an empty batch is rejected."""
+    response = client.post("/verify/batch", json={"api_keys": []})
+    assert response.status_code == 422
+
+
+def test_auth_bearer_header(setup_test_keys, monkeypatch):
+    """Test header-based verification with an Authorization bearer token."""
+    monkeypatch.setattr(main, "AUTH_METADATA_HEADERS", ["env", "missing"])
+
+    response = client.get("/auth", headers={"Authorization": "Bearer sec_test123"})
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-auth-key-id"] == "key_test456"
+    assert response.headers["x-auth-key-name"] == "Test Key"
+    assert response.headers["x-auth-meta-env"] == "test"
+    assert "x-auth-meta-missing" not in response.headers
+
+
+def test_auth_custom_header(setup_test_keys, monkeypatch):
+    """Test header-based verification with a configured header."""
+    monkeypatch.setattr(main, "AUTH_HEADER", "x-api-key")
+
+    response = client.get("/auth", headers={"X-API-Key": "sec_test123"})
+    assert response.status_code == 200
+
+    # Authorization: Bearer still works as a fallback
+    response = client.get("/auth", headers={"Authorization": "Bearer sec_test123"})
+    assert response.status_code == 200
+
+
+def test_auth_ext_authz_path(setup_test_keys):
+    """Test that any method and path under /auth is accepted, as Envoy sends them."""
+    response = client.post(
+        "/auth/api/v1/things", headers={"Authorization": "Bearer sec_test123"}
+    )
+    assert response.status_code == 200
+    assert response.headers["x-auth-key-id"] == "key_test456"
+
+
+def test_auth_invalid_or_missing(setup_test_keys):
+    """Test that missing or invalid credentials are rejected."""
+    assert client.get("/auth").status_code == 403
+    assert client.get("/auth", headers={"Authorization": "Basic sec_test123"}).status_code == 403
+    assert client.get("/auth", headers={"Authorization": "Bearer wrong"}).status_code == 403
+
+
+def test_fast_verify_matches_route(setup_test_keys):
+    """Test that the raw ASGI /verify fast path answers like the FastAPI route."""
+    fast_client = TestClient(main.FastVerifyMiddleware(app))
+
+    for body in ({"api_key": "sec_test123"}, {"api_key": "invalid_secret"}, {}):
+        fast = fast_client.post("/verify", json=body)
+        slow = client.post("/verify", json=body)
+        assert fast.status_code == slow.status_code
+        assert fast.json() == slow.json()
+
+    # Other routes are passed through
+    assert fast_client.get("/health").json() == {"status": "ok"}
+
+
 def test_health_endpoint(setup_test_keys):
     """Test the health check endpoint."""
     response = client.get("/health")
@@ -86,6 +162,191 @@ def test_refresh_endpoint():
         data = response.json()
         assert data["success"] is True
         assert data["keys_loaded"] == 5
+        assert "changed" in data
         assert "timestamp" in data
     finally:
         store.load_from_s3 = original_load
+
+
+def test_refresh_on_follower_needs_control_dir(tmp_path, monkeypatch):
+    """Test that a follower refuses a refresh it cannot pass on to the loading worker."""
+    path = str(tmp_path / "keys.index")
+    leader = KeyStore("test-bucket", "keys.json", index_path=path)
+    assert leader.acquire_index_lock()
+    leader.set_keys([{"id": "key_shared", "secret": "sec_shared", "name": "Shared"}])
+    leader.save_index()
+
+    monkeypatch.setattr(store, "index_path", path)
+    try:
+        response = client.post("/refresh")
+        assert response.status_code == 409
+        assert "WORKER_CONTROL_DIR" in response.json()["detail"]["error"]
+    finally:
+        os.close(leader._index_lock)
+        store.set_keys([])
+
+
+def test_poll_delay_backoff():
+    """Test exponential backoff and jitter bounds for S3 polling."""
+    assert main.poll_delay(10, jitter=0) == 10
+    assert main.poll_delay(10, failures=1, jitter=0) == 20
+    assert main.poll_delay(10, failures=3, jitter=0) == 80
+    assert main.poll_delay(10, failures=10, jitter=0, max_backoff=300) == 300
+
+    for _ in range(100):
+        assert 9 <= main.poll_delay(10, jitter=0.1) <= 11
+
+
+def test_poll_s3_loop_recovers_from_errors(monkeypatch):
+    """Test that polling keeps going after failures and resets its backoff."""
+    delays = []
+    outcomes = [RuntimeError("S3 down"), RuntimeError("S3 down"), 7]
+
+    def fake_poll_delay(interval, failures=0):
+        delays.append(failures)
+        return 0
+
+    def fake_load():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        store.last_load_changed = True
+        return outcome
+
+    monkeypatch.setattr(main, "poll_delay", fake_poll_delay)
+    monkeypatch.setattr(store, "load_from_s3", fake_load)
+
+    async def run():
+        task = asyncio.create_task(main.poll_s3_loop(1))
+        while outcomes:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+
+    # Backoff grows with each failure, then resets after the successful poll
+    assert delays[:4] == [0, 1, 2, 0]
+
+
+def test_expiry_sweep_delay():
+    """Test that expiry sweeps group close deadlines instead of running back to back."""
+    now = time.time()
+    assert main.expiry_sweep_delay(None) == main.EXPIRY_SWEEP_MAX_INTERVAL
+    assert main.expiry_sweep_delay(now - 10) == pytest.approx(main.EXPIRY_SWEEP_WINDOW)
+    assert main.expiry_sweep_delay(now + 0.001) >= main.EXPIRY_SWEEP_WINDOW
+    later = main.expiry_sweep_delay(now + 10)
+    assert later == pytest.approx(10 + main.EXPIRY_SWEEP_WINDOW, abs=0.5)
+    assert main.expiry_sweep_delay(now + 3600) == main.EXPIRY_SWEEP_MAX_INTERVAL
+
+
+def test_expire_keys_loop_survives_errors(monkeypatch):
+    """Test that a failed expiry sweep is logged and the sweeps go on."""
+    outcomes = [RuntimeError("boom"), 0, 0]
+
+    def fake_remove_expired():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(main, "EXPIRY_SWEEP_MAX_INTERVAL", 0.01)
+    monkeypatch.setattr(store, "remove_expired", fake_remove_expired)
+
+    async def run():
+        task = asyncio.create_task(main.expire_keys_loop())
+        for _ in range(100):
+            if not outcomes:
+                break
+            await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
+    assert outcomes == []
+
+
+def test_startup_from_cache_while_s3_down(tmp_path, monkeypatch):
+    """Test that startup serves the cached keyring and revalidates in the background."""
+    cache_path = str(tmp_path / "keys.cache")
+    store.set_keys([{"id": "key_cached", "secret": "sec_cached", "name": "Cached"}])
+    monkeypatch.setattr(store, "cache_path", cache_path)
+    store.save_cache()
+    store.set_keys([])
+
+    attempts = []
+
+    def failing_load():
+        attempts.append(1)
+        raise RuntimeError("S3 down")
+
+    monkeypatch.setattr(store, "load_from_s3", failing_load)
+    monkeypatch.setattr(main, "poll_delay", lambda interval, failures=0: 0.01)
+
+    with TestClient(app) as cached_client:
+        response = cached_client.post("/verify", json={"api_key": "sec_cached"})
+        assert response.status_code == 200
+        assert response.json()["key_id"] == "key_cached"
+
+        # Revalidation keeps retrying without taking the cached keyring down
+        time.sleep(0.1)
+        assert len(attempts) >= 2
+        assert cached_client.post("/verify", json={"api_key": "sec_cached"}).status_code == 200
+
+    store.set_keys([])
+
+
+def test_startup_from_cache_writes_shared_index(tmp_path, monkeypatch):
+    """Test that a leader booting from the cache writes the index for its followers."""
+    cache_path = str(tmp_path / "keys.cache")
+    index_path = str(tmp_path / "shm" / "keys.index")
+    store.set_keys([{"id": "key_cached", "secret": "sec_cached", "name": "Cached"}])
+    monkeypatch.setattr(store, "cache_path", cache_path)
+    store.save_cache()
+    store.set_keys([])
+
+    def failing_load():
+        raise RuntimeError("S3 down")
+
+    monkeypatch.setattr(store, "index_path", index_path)
+    monkeypatch.setattr(store, "load_from_s3", failing_load)
+    monkeypatch.setattr(main, "poll_delay", lambda interval, failures=0: 0.01)
+    try:
+        with TestClient(app):
+            assert store.index_leader
+            follower = KeyStore("test-bucket", "keys.json", index_path=index_path)
+            assert follower.load_index() == 1
+            assert follower.get_by_secret("sec_cached").id == "key_cached"
+    finally:
+        os.close(store._index_lock)
+        store._index_lock = None
+        store.set_keys([])
+
+
+def test_startup_follows_shared_index(tmp_path, monkeypatch):
+    """Test that a worker without the index lock serves the index another worker writes."""
+    path = str(tmp_path / "keys.index")
+    leader = KeyStore("test-bucket", "keys.json", index_path=path)
+    assert leader.acquire_index_lock()
+    leader.set_keys([
+        {"id": "key_shared", "secret": "sec_shared", "name": "Shared", "metadata": {"env": "test"}}
+    ])
+    leader.save_index()
+
+    def unexpected_load():
+        raise AssertionError("followers must not load from S3")
+
+    monkeypatch.setattr(store, "index_path", path)
+    monkeypatch.setattr(store, "load_from_s3", unexpected_load)
+    try:
+        with TestClient(app) as follower_client:
+            response = follower_client.post("/verify", json={"api_key": "sec_shared"})
+            assert response.status_code == 200
+            assert response.json()["key_id"] == "key_shared"
+            assert response.json()["metadata"] == {"env": "test"}
+            assert follower_client.post("/verify", json={"api_key": "sec_other"}).status_code == 403
+            assert store.generation == leader.generation
+            assert not store.index_leader
+    finally:
+        os.close(leader._index_lock)
+        store.set_keys([])
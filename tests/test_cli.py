@@ -1,6 +1,7 @@
 """Tests for CLI module."""
 
-from heare_auth.cli import generate_key_pair
+from heare_auth.cli import CLI, generate_key_pair
+from heare_auth.storage import KeyStore
 
 
 def test_generate_key_pair():
@@ -42,3 +43,80 @@ def test_secret_length():
     for _ in range(10):
         _, s = generate_key_pair()
         assert len(s) == 64
+
+
+def _memory_store(s3, change_log=False):
+    store = KeyStore("test-bucket", "keys.json", change_log=change_log)
+    store.s3 = s3
+    return store
+
+
+def test_cli_sharded_create_and_delete(memory_s3, monkeypatch):
+    """Test that create and delete rewrite only the affected shard."""
+    monkeypatch.setattr(CLI, "_store", lambda self: _memory_store(memory_s3, self.change_log))
+    cli = CLI("test-bucket", "keys.json", "us-east-1")
+    cli.save_keys([{"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}"} for i in range(10)])
+    manifest = cli.shard(4)
+
+    memory_s3.puts.clear()
+    new_key = cli.create("New", {}, "shared_secret", None, None)
+    assert len(memory_s3.puts) == 2  # One shard and the manifest
+    assert len(cli.list_keys()) == 11
+
+    deleted = cli.delete(new_key["id"], None)
+    assert deleted["name"] == "New"
+    assert len(cli.list_keys()) == 10
+    assert cli._store().read_manifest()["shard_count"] == manifest["shard_count"]
+
+
+def test_cli_change_log_create_delete_and_compact(memory_s3, monkeypatch):
+    """Test that change log mode appends records and compact folds them in."""
+    monkeypatch.setattr(CLI, "_store", lambda self: _memory_store(memory_s3, self.change_log))
+    plain = CLI("test-bucket", "keys.json", "us-east-1")
+    plain.save_keys([{"id": "key_0", "secret": "sec_0", "name": "Key 0"}])
+    cli = CLI("test-bucket", "keys.json", "us-east-1", change_log=True)
+
+    memory_s3.puts.clear()
+    new_key = cli.create("New", {}, "shared_secret", None, None)
+    cli.delete("key_0", None)
+    assert memory_s3.puts == [
+        "keys.json.log/00000000000000000001.json",
+        "keys.json.log/00000000000000000002.json",
+    ]
+    assert [k["id"] for k in cli.list_keys()] == [new_key["id"]]
+
+    count, deleted = cli.compact()
+    assert (count, deleted) == (1, 2)
+    assert not any(k.startswith("keys.json.log/") for k in memory_s3.objects)
+    assert [k["id"] for k in plain.list_keys()] == [new_key["id"]]
+
+    # Numbering continues after the compacted records
+    cli.create("Later", {}, "shared_secret", None, None)
+    assert "keys.json.log/00000000000000000003.json" in memory_s3.objects
+    assert len(cli.list_keys()) == 2
+
+
+def test_cli_compile(memory_s3, monkeypatch, tmp_path):
+    """Test that a compiled keyring answers every lookup like the keyring itself."""
+    monkeypatch.setattr(CLI, "_store", lambda self: _memory_store(memory_s3, self.change_log))
+    cli = CLI("test-bucket", "keys.json", "us-east-1")
+    cli.save_keys([
+        {"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}"} for i in range(100)
+    ])
+    count, size = cli.compile()
+    assert count == 100
+    assert len(memory_s3.objects["keys.json.index"][0]) == size
+
+    store = KeyStore(
+        "test-bucket", "keys.json", index_path=str(tmp_path / "keys.index"), compiled_index=True
+    )
+    store.s3 = memory_s3
+    assert store.load_from_s3() == 100
+    expected = cli._load()
+    for key_data in expected.get_all_keys():
+        mapped = store.get_by_secret(key_data["secret"])
+        assert mapped.id == key_data["id"]
+        secret = key_data["secret"]
+        assert store.snapshot.get_verify_response(secret, mapped) == expected.get_verify_response(
+            secret, expected.get_by_secret(secret)
+        )
@@ -0,0 +1,55 @@
+"""Tests for encryption module."""
+
+import json
+import os
+
+import pytest
+
+from heare_auth.encryption import aead_encrypt, compress, iter_aead_decrypt, iter_decompress
+from heare_auth.formats import iter_chunks
+
+
+def test_compress_roundtrip():
+    """Test that compressed data streams back regardless of chunking."""
+    data = json.dumps([{"id": f"key_{i}"} for i in range(500)]).encode()
+    compressed = compress(data, "gzip")
+    assert compressed == compress(data, "gzip")
+    assert len(compressed) < len(data)
+    for size in (1, 100, len(compressed)):
+        assert b"".join(iter_decompress(iter_chunks(compressed, size), "gzip")) == data
+    with pytest.raises(ValueError, match="truncated"):
+        list(iter_decompress([compressed[:-10]], "gzip"))
+    with pytest.raises(ValueError, match="codec"):
+        compress(data, "lz4")
+
+
+def test_aead_roundtrip_and_tampering():
+    """Test chunked AEAD payloads round trip and reject any tampering."""
+    key = os.urandom(32)
+    keys = [{"id": f"key_{i}", "secret": f"sec_{i}"} for i in range(300)]
+    data = json.dumps({"keys": keys}).encode()
+
+    for size in (1000, len(data), len(data) // 2 + 1, 1 << 20):
+        sealed = aead_encrypt(data, key, segment_size=size)
+        for workers in (1, 3):
+            assert b"".join(iter_aead_decrypt(iter_chunks(sealed, 777), key, workers)) == data
+    assert b"".join(iter_aead_decrypt([aead_encrypt(b"", key)], key)) == b""
+
+    sealed = aead_encrypt(data, key, segment_size=1000)
+    header, sealed_size = 22, 1016
+    segments = [
+        sealed[header + i:header + i + sealed_size]
+        for i in range(0, len(sealed) - header, sealed_size)
+    ]
+    tampered = bytearray(sealed)
+    tampered[header + 5] ^= 1
+    for bad in (
+        bytes(tampered),
+        sealed[:header + sealed_size * 3],  # Truncated at a segment boundary
+        sealed[:header] + b"".join(segments[:2] + segments[3:]),  # Segment dropped
+        sealed[:header] + b"".join([segments[1], segments[0]] + segments[2:]),  # Reordered
+        # Another object's header
+        aead_encrypt(data, key, segment_size=1000)[:header] + b"".join(segments),
+    ):
+        with pytest.raises(ValueError, match="decrypt"):
+            list(iter_aead_decrypt([bad], key))
@@ -0,0 +1,69 @@
+"""Tests for keyring formats."""
+
+import json
+
+import pytest
+
+from heare_auth.formats import iter_chunks, iter_keyring, iter_keys, serialize_snapshot
+
+
+def _keys(count):
+    return [{"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}"} for i in range(count)]
+
+
+def test_iter_keys_chunk_boundaries():
+    """Test that streamed parsing does not depend on where chunks split."""
+    document = json.dumps(
+        {
+            "version": 12345,
+            "keys": [{"id": "key_1", "name": "Caf\u00e9"}, {"id": "key_2"}],
+            "x": [1],
+        },
+        ensure_ascii=False,
+        indent=2,
+    ).encode()
+    expected = json.loads(document)["keys"]
+
+    for size in (1, 2, 3, 7, len(document)):
+        assert list(iter_keys(iter_chunks(document, size))) == expected
+
+    assert list(iter_keys([b'{"keys": []}'])) == []
+
+
+def test_iter_keys_invalid():
+    """Test that malformed keys documents are rejected."""
+    for document in (b"", b"[]", b"{}", b'{"other": 1}', b'{"keys": [{"id": 1} {"id": 2}]}',
+                     b'{"keys": [{"id": 1}', b'{"keys": []} trailing'):
+        with pytest.raises(ValueError):
+            list(iter_keys(iter_chunks(document, 4)))
+
+
+def test_binary_snapshot_roundtrip():
+    """Test that binary snapshots decode to the same keys as JSON."""
+    keys = [
+        {"id": "key_1", "secret": "sec_1", "name": "Full", "secret_type": "shared_secret",
+         "created_at": "2025-01-01T00:00:00Z", "updated_at": None, "expires_at": None,
+         "metadata": {"service": "api"}},
+        {"id": "key_2", "secret": "sec_2", "name": "Same metadata", "metadata": {"service": "api"}},
+        {"id": "key_3", "secret": "sec_3", "name": 7, "extra": [1, 2]},
+        {"id": "key_4", "secret": "sec_\u00e9\u4e2d", "name": "nul\x00inside"},
+        {"id": "key_5", "secret": "", "name": ""},
+        {},
+    ]
+    data = serialize_snapshot(keys)
+    assert len(data) < len(json.dumps({"keys": keys}, separators=(",", ":")))
+
+    for size in (1, 7, len(data)):
+        decoded = list(iter_keyring(iter_chunks(data, size)))
+        assert decoded == keys
+    assert list(decoded[0]) == list(keys[0])
+    assert list(iter_keyring([serialize_snapshot([])])) == []
+
+
+def test_binary_snapshot_invalid():
+    """Test that malformed binary snapshots are rejected."""
+    data = serialize_snapshot(_keys(3))
+    bad_version = data[:11] + b"\x02" + data[12:]
+    for document in (data[:-1], data + b"x", bad_version, data[:11]):
+        with pytest.raises(ValueError):
+            list(iter_keyring(iter_chunks(document, 5)))
@@ -0,0 +1,103 @@
+"""Tests for the gRPC verification service."""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+grpc = pytest.importorskip("grpc")
+pytest.importorskip("google.protobuf")
+
+from heare_auth.grpc_server import SERVICE_NAME, create_server  # noqa: E402
+from heare_auth.proto.verify_pb2 import VerifyRequest, VerifyResponse  # noqa: E402
+from heare_auth.storage import KeyStore  # noqa: E402
+
+
+def _make_store():
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {
+            "id": "key_test456",
+            "secret": "sec_test123",
+            "name": "Test Key",
+            "metadata": {"env": "test"},
+        },
+    ])
+    return store
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_verify_and_verify_stream():
+    """Test the unary and streaming RPCs against a live server."""
+
+    async def run():
+        port = _free_port()
+        server = create_server(_make_store(), f"127.0.0.1:{port}")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                verify = channel.unary_unary(
+                    f"/{SERVICE_NAME}/Verify",
+                    request_serializer=VerifyRequest.SerializeToString,
+                    response_deserializer=VerifyResponse.FromString,
+                )
+                unary = await verify(VerifyRequest(api_key="sec_test123"))
+
+                verify_stream = channel.stream_stream(
+                    f"/{SERVICE_NAME}/VerifyStream",
+                    request_serializer=VerifyRequest.SerializeToString,
+                    response_deserializer=VerifyResponse.FromString,
+                )
+                requests = [
+                    VerifyRequest(api_key="sec_test123", request_id="a"),
+                    VerifyRequest(api_key="wrong", request_id="b"),
+                ]
+                streamed = [r async for r in verify_stream(iter(requests))]
+        finally:
+            await server.stop(grace=None)
+        return unary, streamed
+
+    unary, streamed = asyncio.run(run())
+
+    assert unary.valid is True
+    assert unary.key_id == "key_test456"
+    assert json.loads(unary.metadata_json) == {"env": "test"}
+
+    assert [r.request_id for r in streamed] == ["a", "b"]
+    assert streamed[0].valid is True
+    assert streamed[1].valid is False
+    assert streamed[1].error == "Invalid API key"
+
+
+def test_malformed_request_invalid_argument():
+    """Test that an unparseable request fails with INVALID_ARGUMENT, not UNKNOWN."""
+    # Field 1 (api_key) holding bytes that are not UTF-8
+    malformed = b"\x0a\x02\xff\xfe"
+
+    async def run():
+        port = _free_port()
+        server = create_server(_make_store(), f"127.0.0.1:{port}")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+                verify = channel.unary_unary(f"/{SERVICE_NAME}/Verify")
+                with pytest.raises(grpc.aio.AioRpcError) as unary:
+                    await verify(malformed)
+
+                verify_stream = channel.stream_stream(f"/{SERVICE_NAME}/VerifyStream")
+                with pytest.raises(grpc.aio.AioRpcError) as streamed:
+                    requests = [VerifyRequest(api_key="sec_test123").SerializeToString(), malformed]
+                    [r async for r in verify_stream(iter(requests))]
+        finally:
+            await server.stop(grace=None)
+        return unary.value, streamed.value
+
+    for error in asyncio.run(run()):
+        assert error.code() == grpc.StatusCode.INVALID_ARGUMENT
+        assert error.details() == "Malformed VerifyRequest"
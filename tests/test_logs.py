@@ -0,0 +1,72 @@
+"""Tests for logs module."""
+
+import io
+import json
+import time
+
+import pytest
+
+from heare_auth.logs import DROP_NEW, DROP_OLDEST, AsyncLogWriter
+
+
+def _read_events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_async_writer_writes_events():
+    """Test that queued events are rendered as JSON lines."""
+    stream = io.BytesIO()
+    writer = AsyncLogWriter(stream=stream, flush_interval=0.01)
+
+    writer.submit({"event": "verification_success", "key_id": "key_1"})
+    writer.submit({"event": "verification_failed", "secret_prefix": "sec_"})
+    writer.close()
+
+    events = _read_events(stream)
+    assert [e["event"] for e in events] == ["verification_success", "verification_failed"]
+    assert events[0]["key_id"] == "key_1"
+
+
+def _fill_stopped_writer(overflow):
+    """Submit more events than fit while the writer thread is not draining."""
+    stream = io.BytesIO()
+    writer = AsyncLogWriter(stream=stream, max_queue=2, overflow=overflow, flush_interval=60)
+    for i in range(4):
+        writer.submit({"event": "e", "n": i})
+    writer.close()
+    return _read_events(stream)
+
+
+def test_async_writer_drop_oldest():
+    """Test that the oldest events are discarded when the queue is full."""
+    events = _fill_stopped_writer(DROP_OLDEST)
+    assert [e["n"] for e in events if e["event"] == "e"] == [2, 3]
+    assert events[-1] == {"event": "log_events_dropped", "count": 2, "level": "warning"}
+
+
+def test_async_writer_drop_new():
+    """Test that new events are discarded when the queue is full."""
+    events = _fill_stopped_writer(DROP_NEW)
+    assert [e["n"] for e in events if e["event"] == "e"] == [0, 1]
+    assert events[-1]["count"] == 2
+
+
+def test_async_writer_invalid_overflow():
+    """Test that an unknown overflow policy is rejected."""
+    with pytest.raises(ValueError):
+        AsyncLogWriter(stream=io.BytesIO(), overflow="block")
+
+
+def test_async_writer_survives_unrenderable_events():
+    """Test that an event that cannot be rendered is counted as dropped and writing goes on."""
+    stream = io.BytesIO()
+    writer = AsyncLogWriter(stream=stream, flush_interval=0.01)
+    writer.submit({"event": "bad", (1, 2): "tuple key"})
+    writer.submit({"event": "good"})
+    time.sleep(0.1)
+    writer.submit({"event": "later"})
+    writer.close()
+
+    events = _read_events(stream)
+    assert [e["event"] for e in events] == ["good", "log_events_dropped", "later"]
+    assert events[1]["count"] == 1
@@ -0,0 +1,225 @@
+"""Tests for refreshes running off the event loop."""
+
+import asyncio
+import io
+import json
+import os
+import time
+
+import httpx
+
+import heare_auth.main as main
+from heare_auth.main import app, store
+
+# Keyring size for the refresh test; set to 1000000 for the full-size check
+REFRESH_TEST_KEYS = int(os.getenv("HEARE_AUTH_REFRESH_TEST_KEYS", "50000"))
+# Wall-clock latency bounds depend on the machine, so they are opt-in
+LATENCY_ASSERTS = os.getenv("HEARE_AUTH_LATENCY_TESTS", "").lower() in ("1", "true", "yes")
+
+
+class FakeS3:
+    """S3 client serving one plaintext keyring object."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # noqa: N803
+        return {"Body": io.BytesIO(self.body), "ETag": '"big"'}
+
+
+def _keyring(count: int) -> bytes:
+    return json.dumps({
+        "keys": [
+            {"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}", "metadata": {"n": i}}
+            for i in range(count)
+        ]
+    }).encode()
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+async def _time_verify(client: httpx.AsyncClient) -> float:
+    start = time.perf_counter()
+    response = await client.post("/verify", json={"api_key": "sec_0"})
+    assert response.status_code in (200, 403)
+    return time.perf_counter() - start
+
+
+def test_verify_latency_flat_during_refresh():
+    """Test that /verify keeps being served while a large refresh runs."""
+    store.set_keys([{"id": "key_0", "secret": "sec_0", "name": "Key 0"}])
+    original_s3 = store.s3
+    store.s3 = FakeS3(_keyring(REFRESH_TEST_KEYS))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            baseline = [await _time_verify(client) for _ in range(200)]
+
+            response = await client.post("/refresh", params={"wait": "false"})
+            assert response.status_code == 202
+            job = main.refresh_jobs[response.json()["job_id"]]
+
+            during = []
+            while job.status == "running":
+                during.append(await _time_verify(client))
+                # In-process requests never block on I/O; let the job's task run
+                await asyncio.sleep(0)
+            await job.task
+            return baseline, during, job
+
+    try:
+        baseline, during, job = asyncio.run(scenario())
+    finally:
+        store.s3 = original_s3
+
+    assert job.status == "succeeded"
+    assert job.keys_loaded == REFRESH_TEST_KEYS
+
+    # A refresh that blocked the event loop would finish before the second
+    # verify could start; off the loop, verifies keep completing throughout
+    assert len(during) > 10
+
+    if LATENCY_ASSERTS:
+        assert _percentile(during, 0.99) < max(20 * _percentile(baseline, 0.99), 0.05)
+        assert max(during) < 0.25
+
+    store.set_keys([])
+
+
+def test_refresh_async_job():
+    """Test starting a refresh job with wait=false and polling its status."""
+    original_load = store.load_from_s3
+    store.load_from_s3 = lambda: 7
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 5000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/refresh", params={"wait": "false"})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert response.headers["location"] == f"/refresh/{job_id}"
+
+            await main.refresh_jobs[job_id].task
+            status = await client.get(f"/refresh/{job_id}")
+            missing = await client.get("/refresh/unknown")
+            return status, missing
+
+    try:
+        status, missing = asyncio.run(scenario())
+    finally:
+        store.load_from_s3 = original_load
+
+    assert status.status_code == 200
+    data = status.json()
+    assert data["status"] == "succeeded"
+    assert data["keys_loaded"] == 7
+    assert data["finished_at"] is not None
+    assert missing.status_code == 404
+
+
+def test_refresh_single_flight():
+    """Test that concurrent refresh requests share one load."""
+    calls = []
+    original_load = store.load_from_s3
+
+    def slow_load():
+        calls.append(1)
+        time.sleep(0.1)
+        return 3
+
+    store.load_from_s3 = slow_load
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/refresh") for _ in range(5)))
+
+    try:
+        responses = asyncio.run(scenario())
+    finally:
+        store.load_from_s3 = original_load
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert {r.json()["keys_loaded"] for r in responses} == {3}
+    assert len(calls) == 1
+
+
+def test_refresh_failure_reported():
+    """Test that a failed load is a 500 and a failed job."""
+    original_load = store.load_from_s3
+
+    def failing_load():
+        raise RuntimeError("boom")
+
+    store.load_from_s3 = failing_load
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/refresh")
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        store.load_from_s3 = original_load
+
+    assert response.status_code == 500
+    assert "boom" in response.json()["detail"]["error"]
+
+
+def test_refresh_fans_out_to_workers(tmp_path, monkeypatch):
+    """Test that a refresh reloads every worker, the index holder first, and reports each one."""
+    directory = str(tmp_path)
+    order = []
+
+    def local_load():
+        order.append("local")
+        return 4
+
+    monkeypatch.setattr(store, "load_from_s3", local_load)
+    monkeypatch.setattr(main, "WORKER_CONTROL_DIR", directory)
+    # Pretend the shared index lock is held by the sibling with PID 1001
+    monkeypatch.setattr(store, "index_lock_holder", lambda: 1001)
+
+    def sibling(pid, success):
+        async def on_connection(reader, writer):
+            await reader.readline()
+            order.append(pid)
+            result = {"pid": pid, "success": success, "keys_loaded": 4 if success else None,
+                      "changed": True if success else None, "generation": 9 if success else None,
+                      "error": None if success else "S3 down"}
+            writer.write(json.dumps(result).encode() + b"\n")
+            await writer.drain()
+            writer.close()
+        return asyncio.start_unix_server(on_connection, path=os.path.join(directory, f"{pid}.sock"))
+
+    async def scenario():
+        servers = [await sibling(1001, True), await sibling(1002, False)]
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/refresh")
+        finally:
+            for server in servers:
+                server.close()
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        store.set_keys([])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is False
+    assert data["keys_loaded"] == 4
+    workers = {worker["pid"]: worker for worker in data["workers"]}
+    assert set(workers) == {1001, 1002, os.getpid()}
+    assert workers[1001]["generation"] == 9
+    assert workers[1002]["error"] == "S3 down"
+    assert workers[os.getpid()]["success"] is True
+    # The index holder reloads before the workers that map its index
+    assert order[0] == 1001
@@ -0,0 +1,63 @@
+"""Tests for server module."""
+
+import os
+import stat
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+
+from heare_auth.main import app, store
+from heare_auth.server import bind_unix_socket
+
+
+def test_bind_unix_socket(tmp_path):
+    """Test binding a socket file with permissions, replacing a stale one."""
+    path = str(tmp_path / "auth.sock")
+
+    first = bind_unix_socket(path, 0o600)
+    first.close()
+    assert stat.S_ISSOCK(os.stat(path).st_mode)
+
+    # A stale socket file is replaced
+    sock = bind_unix_socket(path, 0o660)
+    sock.close()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+
+
+def test_bind_unix_socket_refuses_regular_file(tmp_path):
+    """Test that a regular file is never deleted to make room for the socket."""
+    path = tmp_path / "auth.sock"
+    path.write_text("data")
+
+    with pytest.raises(ValueError):
+        bind_unix_socket(str(path))
+    assert path.read_text() == "data"
+
+
+def test_refresh_over_unix_socket(tmp_path, monkeypatch):
+    """Test that /refresh accepts requests arriving over a Unix domain socket."""
+    monkeypatch.setattr(store, "load_from_s3", lambda: 3)
+    path = str(tmp_path / "auth.sock")
+    sock = bind_unix_socket(path)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="error"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+    thread.start()
+    try:
+        deadline = time.time() + 5
+        while not server.started and time.time() < deadline:
+            time.sleep(0.01)
+
+        transport = httpx.HTTPTransport(uds=path)
+        with httpx.Client(transport=transport, base_url="http://heare-auth") as http:
+            response = http.post("/refresh", headers={"X-Forwarded-For": "203.0.113.7"})
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+    assert response.status_code == 200
+    assert response.json()["keys_loaded"] == 3
@@ -0,0 +1,185 @@
+"""Tests for the memory-mapped shared key index."""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from heare_auth.shared_index import MappedSnapshot, write_index
+from heare_auth.storage import KeySnapshot, KeyStore
+
+
+def _keys(count: int) -> list:
+    return [
+        {"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}", "metadata": {"n": i % 3}}
+        for i in range(count)
+    ]
+
+
+def test_index_roundtrip(tmp_path):
+    """Test that a mapped index answers lookups exactly like the snapshot it was written from."""
+    past = (datetime.now(timezone.utc) - timedelta(days=1)).isoformat()
+    future = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys(_keys(500) + [
+        {"id": "key_expired", "secret": "sec_expired", "name": "Old", "expires_at": past},
+        {"id": "key_later", "secret": "sec_later", "name": "Ünïcode", "expires_at": future},
+        {"id": "key_bare", "secret": "sec_bare"},
+    ])
+    path = str(tmp_path / "keys.index")
+    write_index(path, store.snapshot)
+
+    mapped = MappedSnapshot(path)
+    assert mapped.key_count == 503
+    assert mapped.generation == store.generation
+
+    for secret in [f"sec_{i}" for i in range(500)] + ["sec_later", "sec_bare"]:
+        key_data = mapped.get_by_secret(secret)
+        expected = store.get_by_secret(secret)
+        assert key_data.id == expected.id
+        assert key_data.name == expected.name
+        assert key_data.metadata == (expected.metadata or {})
+        response = mapped.get_verify_response(secret, key_data)
+        assert response == store.get_verify_response(secret, expected)
+    assert mapped.get_by_secret("sec_expired") is None
+    assert mapped.get_by_secret("sec_missing") is None
+    response = mapped.get_verify_response("sec_7", mapped.get_by_secret("sec_7"))
+    assert json.loads(response)["key_id"] == "key_7"
+
+    # The file holds digests, never the secrets themselves
+    with open(path, "rb") as f:
+        assert b"sec_1" not in f.read()
+
+    (tmp_path / "bad.index").write_bytes(b"not an index" * 10)
+    with pytest.raises(ValueError):
+        MappedSnapshot(str(tmp_path / "bad.index"))
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 1000])
+def test_perfect_index_roundtrip(tmp_path, count):
+    """Test that a perfect hash index has one slot per key and finds every key."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys(_keys(count))
+    path = str(tmp_path / "keys.index")
+    write_index(path, store.snapshot, perfect=True)
+
+    mapped = MappedSnapshot(path)
+    assert mapped.perfect
+    assert mapped.key_count == count
+    for i in range(count):
+        key_data = mapped.get_by_secret(f"sec_{i}")
+        assert key_data.id == f"key_{i}"
+        assert mapped.get_verify_response(f"sec_{i}", key_data) == store.get_verify_response(
+            f"sec_{i}", store.get_by_secret(f"sec_{i}")
+        )
+    assert mapped.get_by_secret("sec_missing") is None
+
+
+def test_compiled_index_load(memory_s3, tmp_path):
+    """Test that a compiled index is mapped while it matches the keyring and ignored once stale."""
+    writer = KeyStore("test-bucket", "keys.json", storage_secret="s3cret", encryption="aead")
+    writer.s3 = memory_s3
+    writer.save_to_s3(_keys(50))
+    writer.load_from_s3()
+    writer.compile_index()
+    assert memory_s3.objects["keys.json.index"][0].startswith(KeyStore.ENCRYPTION_HEADER_V3)
+
+    path = str(tmp_path / "keys.index")
+    store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="s3cret", index_path=path, compiled_index=True
+    )
+    store.s3 = memory_s3
+    memory_s3.gets.clear()
+    assert store.load_from_s3() == 50
+    assert memory_s3.gets == ["keys.json.index"]  # The keyring itself is never parsed
+    assert isinstance(store.snapshot, MappedSnapshot)
+    assert store.snapshot.perfect
+    assert store.generation == 1
+    assert store.get_by_secret("sec_7").id == "key_7"
+    assert MappedSnapshot(path).generation == 1
+
+    # Unchanged keyring: one HEAD, nothing downloaded
+    memory_s3.gets.clear()
+    assert store.load_from_s3() == 50
+    assert store.last_load_changed is False
+    assert memory_s3.gets == []
+
+    # Once the keyring is rewritten the compiled index is stale until compiled again
+    writer.save_to_s3(_keys(60))
+    assert store.load_from_s3() == 60
+    assert isinstance(store.snapshot, KeySnapshot)
+    assert store.get_by_secret("sec_55").id == "key_55"
+    writer.load_from_s3()
+    writer.compile_index()
+    assert store.load_from_s3() == 60
+    assert isinstance(store.snapshot, MappedSnapshot)
+    assert store.get_by_secret("sec_55").id == "key_55"
+
+    with pytest.raises(ValueError):
+        KeyStore("test-bucket", "keys.json", compiled_index=True)
+
+
+def test_compiled_index_skipped_with_newer_changes(memory_s3, tmp_path):
+    """Test that change records newer than the compiled index skip it without downloading it."""
+    writer = KeyStore("test-bucket", "keys.json", change_log=True)
+    writer.s3 = memory_s3
+    writer.save_to_s3(_keys(10))
+    writer.load_from_s3()
+    writer.compile_index()
+    writer.append_change("create", key_data={"id": "key_new", "secret": "sec_new", "name": "New"})
+
+    path = str(tmp_path / "keys.index")
+    store = KeyStore(
+        "test-bucket", "keys.json", change_log=True, index_path=path, compiled_index=True
+    )
+    store.s3 = memory_s3
+    for _ in range(2):
+        memory_s3.gets.clear()
+        assert store.load_from_s3() == 11
+        assert "keys.json.index" not in memory_s3.gets
+        assert store.get_by_secret("sec_new").id == "key_new"
+
+
+def test_index_leader_and_follower(memory_s3, tmp_path):
+    """Test that only the lock holder loads from S3 and the others follow its index."""
+    path = str(tmp_path / "index" / "keys.index")
+    leader = KeyStore("test-bucket", "keys.json", index_path=path)
+    follower = KeyStore("test-bucket", "keys.json", index_path=path)
+    leader.s3 = follower.s3 = memory_s3
+
+    assert leader.acquire_index_lock()
+    assert not follower.acquire_index_lock()
+    assert follower.load_index() is None
+
+    leader.save_to_s3(_keys(10))
+    assert leader.load_from_s3() == 10
+    assert leader.index_error is None
+    assert follower.load_index() == 10
+    assert follower.last_load_changed is True
+    assert follower.generation == leader.generation
+    assert follower.get_by_secret("sec_4").id == "key_4"
+    # A mapped index holds no secrets, so only lookups by secret work
+    with pytest.raises(ValueError, match="mapped key index"):
+        follower.get_by_id("key_4")
+    with pytest.raises(ValueError, match="mapped key index"):
+        follower.get_all_keys()
+
+    # Unchanged files are not mapped again
+    assert follower.load_index() == 10
+    assert follower.last_load_changed is False
+
+    leader.save_to_s3(_keys(12))
+    leader.load_from_s3()
+    assert follower.load_index() == 12
+    assert follower.last_load_changed is True
+    assert follower.generation == leader.generation
+    assert follower.get_by_secret("sec_11").id == "key_11"
+
+    # When the holder exits, a follower takes over with a full load
+    os.close(leader._index_lock)
+    assert follower.acquire_index_lock()
+    assert follower.load_from_s3() == 12
+    assert follower.last_load_changed is True
+    assert follower.generation == leader.generation + 1
+    assert MappedSnapshot(path).generation == follower.generation
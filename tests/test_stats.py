@@ -0,0 +1,108 @@
+"""Tests for stats module."""
+
+import asyncio
+
+from heare_auth.stats import MetricsAggregator
+
+
+class FakePipeline:
+    """Collects pipeline calls for assertions."""
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def incr(self, metric_name, value=1):
+        self.sent.append(("incr", metric_name, value))
+
+    def gauge(self, metric_name, value):
+        self.sent.append(("gauge", metric_name, value))
+
+    def time(self, metric_name, value):
+        self.sent.append(("time", metric_name, value))
+
+
+class FakeStatsClient:
+    """Stats client that records what would have been sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    def pipeline(self):
+        return FakePipeline(self.sent)
+
+
+def test_metrics_aggregate_on_flush():
+    """Test that buffered metrics are aggregated into one pipeline."""
+    client = FakeStatsClient()
+    metrics = MetricsAggregator(client)
+
+    metrics.incr("verify.requests")
+    metrics.incr("verify.requests")
+    metrics.gauge("keys.count", 1)
+    metrics.gauge("keys.count", 2)
+    metrics.time("verify.duration", 1.5)
+    metrics.time("verify.duration", 2.5)
+
+    # Nothing is sent until a flush
+    assert client.sent == []
+
+    asyncio.run(metrics.flush())
+
+    assert ("incr", "verify.requests", 2) in client.sent
+    assert ("gauge", "keys.count", 2) in client.sent
+    assert ("time", "verify.duration", 1.5) in client.sent
+    assert ("time", "verify.duration", 2.5) in client.sent
+
+
+def test_metrics_drop_when_buffer_full():
+    """Test that timer samples beyond the buffer size are dropped and counted."""
+    client = FakeStatsClient()
+    metrics = MetricsAggregator(client, max_buffer=2)
+
+    for _ in range(5):
+        metrics.time("verify.duration", 1.0)
+
+    batch = metrics.drain()
+    assert batch.timers["verify.duration"] == [1.0, 1.0]
+    assert batch.counters["stats.dropped"] == 3
+    assert metrics.dropped == 0
+
+    # The bound applies per flush
+    metrics.time("verify.duration", 2.0)
+    assert metrics.drain().timers["verify.duration"] == [2.0]
+
+
+def test_metrics_counters_never_dropped():
+    """Test that counters and gauges stay exact however much traffic arrives."""
+    client = FakeStatsClient()
+    metrics = MetricsAggregator(client, max_buffer=10)
+
+    for i in range(10000):
+        metrics.incr("verify.requests")
+        metrics.incr("verify.success")
+        metrics.gauge("keys.count", i)
+        metrics.time("verify.duration", 1.0)
+
+    batch = metrics.drain()
+    assert batch.counters["verify.requests"] == 10000
+    assert batch.counters["verify.success"] == 10000
+    assert batch.gauges["keys.count"] == 9999
+    assert len(batch.timers["verify.duration"]) == 10
+    assert batch.counters["stats.dropped"] == 9990
+
+
+def test_metrics_disabled_without_client():
+    """Test that metrics are discarded when no stats client is configured."""
+    metrics = MetricsAggregator(None)
+
+    metrics.incr("verify.requests")
+    asyncio.run(metrics.flush())
+
+    batch = metrics.drain()
+    assert not (batch.counters or batch.gauges or batch.timers)
@@ -1,8 +1,27 @@
 """Tests for storage module."""
 
+import copy
+import io
+import json
+import os
+import pickle
 from datetime import datetime, timedelta, timezone
 
-from heare_auth.storage import KeyStore
+import pytest
+from botocore.exceptions import ClientError
+
+import heare_auth.encryption as encryption
+from heare_auth.encryption import compress
+from heare_auth.formats import iter_keyring, serialize_snapshot
+from heare_auth.storage import (
+    REJECTED_EXPIRY,
+    KeyMetadata,
+    KeyRecord,
+    KeyStore,
+    parse_expiry,
+    serialize_metadata,
+    shard_index,
+)
 
 
 def test_keystore_initialization():
@@ -17,14 +36,14 @@ def test_keystore_initialization():
 def test_get_by_secret():
     """Test getting key by secret."""
     store = KeyStore("test-bucket", "keys.json")
-    store.keys_by_secret = {
-        "sec_test123": {
+    store.set_keys([
+        {
             "id": "key_test456",
             "secret": "sec_test123",
             "name": "Test Key",
             "metadata": {"env": "test"},
         }
-    }
+    ])
 
     key = store.get_by_secret("sec_test123")
     assert key is not None
@@ -38,14 +57,14 @@ def test_get_by_secret():
 def test_get_by_id():
     """Test getting key by ID."""
     store = KeyStore("test-bucket", "keys.json")
-    store.keys_by_id = {
-        "key_test456": {
+    store.set_keys([
+        {
             "id": "key_test456",
             "secret": "sec_test123",
             "name": "Test Key",
             "metadata": {},
         }
-    }
+    ])
 
     key = store.get_by_id("key_test456")
     assert key is not None
@@ -58,10 +77,10 @@ def test_get_by_id():
 def test_get_all_keys():
     """Test getting all keys."""
     store = KeyStore("test-bucket", "keys.json")
-    store.keys_by_id = {
-        "key_1": {"id": "key_1", "name": "Key 1"},
-        "key_2": {"id": "key_2", "name": "Key 2"},
-    }
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "Key 1"},
+        {"id": "key_2", "secret": "sec_2", "name": "Key 2"},
+    ])
 
     keys = store.get_all_keys()
     assert len(keys) == 2
@@ -75,14 +94,14 @@ def test_get_by_secret_expired():
     
     # Create an expired key
     expired_time = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat().replace("+00:00", "Z")
-    store.keys_by_secret = {
-        "sec_expired": {
+    store.set_keys([
+        {
             "id": "key_expired",
             "secret": "sec_expired",
             "name": "Expired Key",
             "expires_at": expired_time,
         }
-    }
+    ])
     
     # Should return None for expired key
     key = store.get_by_secret("sec_expired")
@@ -95,14 +114,14 @@ def test_get_by_secret_not_expired():
     
     # Create a future expiry key
     future_time = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat().replace("+00:00", "Z")
-    store.keys_by_secret = {
-        "sec_valid": {
+    store.set_keys([
+        {
             "id": "key_valid",
             "secret": "sec_valid",
             "name": "Valid Key",
             "expires_at": future_time,
         }
-    }
+    ])
     
     # Should return the key
     key = store.get_by_secret("sec_valid")
@@ -114,14 +133,14 @@ def test_get_by_secret_no_expiry():
     """Test that keys without expiry are returned."""
     store = KeyStore("test-bucket", "keys.json")
     
-    store.keys_by_secret = {
-        "sec_noexpiry": {
+    store.set_keys([
+        {
             "id": "key_noexpiry",
             "secret": "sec_noexpiry",
             "name": "No Expiry Key",
             "expires_at": None,
         }
-    }
+    ])
     
     # Should return the key
     key = store.get_by_secret("sec_noexpiry")
@@ -129,6 +148,294 @@ def test_get_by_secret_no_expiry():
     assert key["id"] == "key_noexpiry"
 
 
+def test_get_by_secret_invalid_expiry_rejected():
+    """Test that keys with an unparseable expiry fail closed."""
+    store = KeyStore("test-bucket", "keys.json")
+
+    store.set_keys([
+        {
+            "id": "key_bad",
+            "secret": "sec_bad",
+            "name": "Bad Expiry Key",
+            "expires_at": "not-a-date",
+        }
+    ])
+
+    assert store.get_by_secret("sec_bad") is None
+    # Still listed for management via the CLI
+    assert store.get_by_id("key_bad") is not None
+
+
+def test_parse_expiry():
+    """Test converting expires_at values to epoch timestamps."""
+    assert parse_expiry(None) is None
+    assert parse_expiry("") is None
+    assert parse_expiry("garbage") == REJECTED_EXPIRY
+    assert parse_expiry("2025-01-01T00:00:00Z") == 1735689600.0
+    # Naive timestamps are treated as UTC
+    assert parse_expiry("2025-01-01T00:00:00") == 1735689600.0
+
+
+def test_remove_expired():
+    """Test that expired keys are removed from both indexes in deadline order."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "One", "expires_at": "2025-01-01T00:00:00Z"},
+        {"id": "key_2", "secret": "sec_2", "name": "Two", "expires_at": "2025-01-02T00:00:00Z"},
+        {"id": "key_3", "secret": "sec_3", "name": "Three", "expires_at": None},
+    ])
+
+    assert store.next_expiry() == 1735689600.0
+
+    # Only the first deadline has passed
+    assert store.remove_expired(now=1735689600.0 + 1) == 1
+    assert "sec_1" not in store.keys_by_secret
+    assert "key_1" not in store.keys_by_id
+    assert store.next_expiry() == 1735776000.0
+
+    assert store.remove_expired(now=1735776000.0 + 1) == 1
+    assert store.next_expiry() is None
+    assert list(store.keys_by_id) == ["key_3"]
+
+
+def test_remove_expired_duplicate_secrets_and_ids():
+    """Test that expiry follows the final indexes when secrets or IDs repeat."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        # The same secret twice: only the last entry is indexed
+        {"id": "key_1", "secret": "sec_dup", "expires_at": "2025-01-01T00:00:00Z"},
+        {"id": "key_1", "secret": "sec_dup", "expires_at": "2025-01-01T00:00:00Z"},
+        # One ID under two secrets: the expiring secret must not take the live key with it
+        {"id": "key_2", "secret": "sec_old", "expires_at": "2025-01-01T00:00:00Z"},
+        {"id": "key_2", "secret": "sec_new"},
+    ])
+    assert len(store.snapshot.expiry_order) == 2
+
+    assert store.remove_expired(now=1735689600.0 + 1) == 2
+    assert store.get_by_id("key_2").secret == "sec_new"
+    assert store.get_by_secret("sec_new").id == "key_2"
+    assert "sec_dup" not in store.keys_by_secret
+
+    # A change that gives a key another key's secret leaves one consistent owner
+    snapshot = store.snapshot.with_changes([
+        {
+            "seq": 1,
+            "op": "create",
+            "key": {"id": "key_3", "secret": "sec_new", "expires_at": "2099-01-01T00:00:00Z"},
+        },
+        {"seq": 2, "op": "delete", "key_id": "key_2"},
+    ])
+    assert snapshot.keys_by_secret["sec_new"].id == "key_3"
+    assert snapshot.expiry_order == ((4070908800.0, "sec_new"),)
+
+
+def test_verify_responses_precomputed():
+    """Test that /verify response bodies are serialized at load time."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "One", "metadata": {"env": "test"}},
+    ])
+
+    body = store.snapshot.responses_by_secret["sec_1"]
+    assert json.loads(body) == {
+        "valid": True,
+        "key_id": "key_1",
+        "name": "One",
+        "metadata": {"env": "test"},
+        "error": None,
+    }
+    assert store.get_verify_response("sec_1", store.get_by_secret("sec_1")) is body
+
+
+def test_key_record():
+    """Test that KeyRecord reads like the key dict it was built from."""
+    full = {
+        "id": "key_1",
+        "secret": "sec_1",
+        "name": "One",
+        "secret_type": "shared_secret",
+        "created_at": "2025-01-01T00:00:00Z",
+        "updated_at": None,
+        "expires_at": "2099-01-01T00:00:00Z",
+        "metadata": {"env": "test"},
+    }
+    record = KeyRecord.from_dict(full)
+    assert record == full
+    assert dict(record) == full
+    assert record.expiry == parse_expiry("2099-01-01T00:00:00Z")
+    assert KeyRecord.from_dict(record) is record
+    assert "sec_1" not in repr(record)
+
+    # Absent fields stay absent; unknown fields are kept
+    partial = {"id": "key_2", "secret": "sec_2", "owner": "team-a"}
+    record = KeyRecord.from_dict(partial)
+    assert dict(record) == partial
+    assert len(record) == 3
+    assert "name" not in record
+    assert record.name is None
+    assert record.get("name", "-") == "-"
+    assert record["owner"] == "team-a"
+    with pytest.raises(KeyError):
+        record["metadata"]
+
+    # Indexes hold records, and they serialize back to the same keyring
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([full, partial])
+    assert isinstance(store.get_by_id("key_1"), KeyRecord)
+    assert json.loads(store._serialize_keys(store.get_all_keys()))["keys"] == [full, partial]
+    assert list(iter_keyring([serialize_snapshot(store.get_all_keys())])) == [full, partial]
+
+
+def test_metadata_shared():
+    """Test that keys with identical metadata share one read-only mapping."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "One", "metadata": {"env": "prod", "n": 1}},
+        {"id": "key_2", "secret": "sec_2", "name": "Two", "metadata": {"env": "prod", "n": 1}},
+        {"id": "key_3", "secret": "sec_3", "name": "Three", "metadata": {"env": "prod", "n": True}},
+        {"id": "key_4", "secret": "sec_4", "name": "Four"},
+    ])
+    one, two, three, four = (store.get_by_id(f"key_{i}") for i in range(1, 5))
+
+    assert isinstance(one.metadata, KeyMetadata)
+    assert one.metadata is two.metadata
+    assert three.metadata is not one.metadata  # 1 and True are different JSON
+    assert three.metadata == {"env": "prod", "n": True}
+    assert four.metadata is None
+    with pytest.raises(TypeError):
+        one.metadata["env"] = "dev"
+    with pytest.raises(TypeError):
+        one.metadata.update(env="dev")
+
+    # Response bodies splice in the shared JSON and match a plain serialization
+    for key in (one, three, four):
+        response = json.loads(store.get_verify_response(key.secret, key))
+        assert response["metadata"] == (key.metadata or {})
+
+    # Change log records intern into the same table
+    snapshot = store.snapshot.with_changes([
+        {"seq": 1, "op": "create", "key": {"id": "key_5", "secret": "sec_5", "name": "Five",
+                                          "metadata": {"env": "prod", "n": 1}}},
+    ])
+    assert snapshot.keys_by_id["key_5"].metadata is one.metadata
+
+    # Copies keep the serialized JSON and stay read-only
+    for clone in (copy.copy(one.metadata), copy.deepcopy(one.metadata),
+                  pickle.loads(pickle.dumps(one.metadata))):
+        assert isinstance(clone, KeyMetadata)
+        assert clone == one.metadata
+        assert serialize_metadata(clone) == serialize_metadata(one.metadata)
+        with pytest.raises(TypeError):
+            clone["env"] = "dev"
+
+
+class FakeS3:
+    """Minimal S3 client that honours IfNoneMatch."""
+
+    def __init__(self, body: bytes, etag: str = '"v1"'):
+        self.body = body
+        self.etag = etag
+        self.calls = []
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # noqa: N803
+        self.calls.append(IfNoneMatch)
+        if IfNoneMatch == self.etag:
+            raise ClientError(
+                {
+                    "Error": {"Code": "304", "Message": "Not Modified"},
+                    "ResponseMetadata": {"HTTPStatusCode": 304},
+                },
+                "GetObject",
+            )
+        return {
+            "Body": io.BytesIO(self.body),
+            "ETag": self.etag,
+            "LastModified": datetime(2025, 1, 1, tzinfo=timezone.utc),
+        }
+
+
+def test_load_from_s3_conditional():
+    """Test that an unchanged object is not reloaded."""
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    body = store._encrypt_data(json.dumps(
+        {"keys": [{"id": "key_1", "secret": "sec_1", "name": "One"}]}
+    ).encode())
+    store.s3 = FakeS3(body)
+
+    assert store.load_from_s3() == 1
+    assert store.last_load_changed is True
+    assert store.etag == '"v1"'
+    indexes = store.keys_by_secret
+
+    # Unchanged: 304, indexes are kept as-is
+    assert store.load_from_s3() == 1
+    assert store.last_load_changed is False
+    assert store.keys_by_secret is indexes
+    assert store.s3.calls == [None, '"v1"']
+
+    # Changed: new ETag, indexes rebuilt
+    store.s3.etag = '"v2"'
+    assert store.load_from_s3() == 1
+    assert store.last_load_changed is True
+    assert store.keys_by_secret is not indexes
+
+    # Forced reloads skip the conditional request
+    store.load_from_s3(force=True)
+    assert store.s3.calls[-1] is None
+
+
+def test_load_from_s3_encrypted_stream():
+    """Test loading an encrypted keyring through the streaming path."""
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    keys = [{"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}"} for i in range(100)]
+    store.s3 = FakeS3(store._encrypt_data(json.dumps({"keys": keys}).encode()))
+
+    assert store.load_from_s3() == 100
+    assert store.get_by_secret("sec_42")["id"] == "key_42"
+
+    # A mismatched secret still fails loudly
+    wrong = KeyStore("test-bucket", "keys.json", storage_secret="wrong-secret")
+    wrong.s3 = store.s3
+    with pytest.raises(ValueError, match="invalid STORAGE_SECRET"):
+        wrong.load_from_s3()
+
+
+def test_snapshot_swap():
+    """Test that each change publishes a new immutable snapshot."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "One", "expires_at": "2025-01-01T00:00:00Z"},
+        {"id": "key_2", "secret": "sec_2", "name": "Two"},
+    ], etag='"v1"')
+    first = store.snapshot
+    assert first.generation == 1
+    assert first.etag == '"v1"'
+
+    # Readers holding the old snapshot keep a consistent view
+    store.set_keys([{"id": "key_3", "secret": "sec_3", "name": "Three"}])
+    assert store.generation == 2
+    assert first.get_by_secret("sec_2")["id"] == "key_2"
+    assert store.get_by_secret("sec_2") is None
+
+    # Snapshots cannot be modified
+    with pytest.raises(AttributeError):
+        first.generation = 5
+
+
+def test_remove_expired_publishes_snapshot():
+    """Test that expiring keys replaces the snapshot instead of mutating it."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([
+        {"id": "key_1", "secret": "sec_1", "name": "One", "expires_at": "2025-01-01T00:00:00Z"},
+    ])
+    before = store.snapshot
+
+    assert store.remove_expired(now=1735689600.0 + 1) == 1
+    assert "sec_1" in before.keys_by_secret
+    assert "sec_1" not in store.keys_by_secret
+    assert store.generation == before.generation + 1
+
+
 def test_encryption_roundtrip():
     """Test that data can be encrypted and decrypted."""
     store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret-key")
@@ -167,4 +474,378 @@ def test_decrypt_unencrypted_data():
     
     # Should return unchanged
     decrypted = store._decrypt_data(unencrypted_data)
-    assert decrypted == unencrypted_data
\ No newline at end of file
+    assert decrypted == unencrypted_data
+
+
+def test_compressed_encryption_roundtrip(monkeypatch):
+    """Test V2 payloads compress inside encryption while V1 payloads still decrypt."""
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret", compression="gzip")
+    keys = [
+        {"id": f"key_{i}", "secret": f"sec_{i:060d}", "name": f"Key {i}",
+         "metadata": {"env": "prod"}}
+        for i in range(2000)
+    ]
+    data = json.dumps({"keys": keys}, indent=2).encode()
+
+    encrypted = store._encrypt_data(data)
+    assert encrypted.startswith(b"HEARE_ENCRYPTED_V2:gzip:")
+    assert len(encrypted) * 5 < len(data)
+    assert store._decrypt_data(encrypted) == data
+
+    # Streaming loads decompress as they decrypt
+    store.s3 = FakeS3(encrypted)
+    assert store.load_from_s3() == 2000
+    assert store.get_by_secret(keys[7]["secret"])["id"] == "key_7"
+
+    v1 = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    assert store._decrypt_data(v1._encrypt_data(data)) == data
+    assert v1._decrypt_data(encrypted) == data
+
+    # A truncated stream or an unknown codec fails instead of loading partial data
+    corrupt = store.fernet.encrypt(compress(data, "gzip")[:-10])
+    with pytest.raises(ValueError, match="truncated"):
+        store._decrypt_data(b"HEARE_ENCRYPTED_V2:gzip:" + corrupt)
+    with pytest.raises(ValueError, match="codec"):
+        store._decrypt_data(b"HEARE_ENCRYPTED_V2:lz4:" + corrupt)
+
+    with pytest.raises(ValueError, match="STORAGE_SECRET"):
+        KeyStore("test-bucket", "keys.json", compression="gzip")
+    monkeypatch.setattr(encryption, "zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        KeyStore("test-bucket", "keys.json", storage_secret="test-secret", compression="zstd")
+
+
+def test_aead_encryption():
+    """Test AEAD keyrings load through KeyStore, compressed or not, and V1 still reads."""
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret", encryption="aead")
+    data = json.dumps({"keys": _keys(300)}).encode()
+
+    encrypted = store._encrypt_data(data)
+    assert encrypted.startswith(b"HEARE_ENCRYPTED_V3:")
+    store.s3 = FakeS3(encrypted)
+    assert store.load_from_s3() == 300
+    compressed = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", encryption="aead",
+        compression="gzip",
+    )
+    assert len(compressed._encrypt_data(data)) < len(encrypted) / 3
+    assert store._decrypt_data(compressed._encrypt_data(data)) == data
+    v1 = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    assert store._decrypt_data(v1._encrypt_data(data)) == data
+    assert v1._decrypt_data(encrypted) == data
+
+    wrong = KeyStore("test-bucket", "keys.json", storage_secret="wrong-secret")
+    with pytest.raises(ValueError, match="invalid STORAGE_SECRET"):
+        wrong._decrypt_data(encrypted)
+    with pytest.raises(ValueError, match="STORAGE_SECRET"):
+        KeyStore("test-bucket", "keys.json", encryption="aead")
+
+
+def test_zstd_compression():
+    """Test zstd compression when zstandard is installed."""
+    pytest.importorskip("zstandard")
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret", compression="zstd")
+    data = json.dumps({"keys": _keys(500)}).encode()
+    encrypted = store._encrypt_data(data)
+    assert encrypted.startswith(b"HEARE_ENCRYPTED_V2:zstd:")
+    assert store._decrypt_data(encrypted) == data
+
+def _keys(count):
+    return [{"id": f"key_{i}", "secret": f"sec_{i}", "name": f"Key {i}"} for i in range(count)]
+
+
+def test_sharded_roundtrip(memory_s3):
+    """Test saving a sharded keyring and loading it back."""
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret", fetch_workers=4)
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(50))
+
+    manifest = store.save_sharded(_keys(50), 8)
+    assert manifest["shard_count"] == 8
+    assert memory_s3.objects["keys.json"][1] == {"heare-auth-format": "manifest"}
+    assert all(key.startswith("keys.json.shards/") for key in manifest["shards"])
+    assert sum(len(store.read_shard(manifest, i)) for i in range(8)) == 50
+
+    assert store.load_from_s3() == 50
+    assert store.get_by_secret("sec_7")["id"] == "key_7"
+
+    # The manifest ETag makes polling conditional, as for a single file
+    assert store.load_from_s3() == 50
+    assert store.last_load_changed is False
+
+
+def test_sharded_write_touches_one_shard(memory_s3):
+    """Test that rewriting one shard leaves the others in place."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.s3 = memory_s3
+    manifest = store.save_sharded(_keys(20), 4)
+
+    index = shard_index("key_3", 4)
+    shard = [k for k in store.read_shard(manifest, index) if k["id"] != "key_3"]
+    memory_s3.puts.clear()
+    new_manifest = store.write_shard(manifest, index, shard)
+
+    # One new shard object plus the manifest
+    assert len(memory_s3.puts) == 2
+    assert new_manifest["shards"][index] != manifest["shards"][index]
+    assert manifest["shards"][index] not in memory_s3.objects
+    assert [a == b for a, b in zip(manifest["shards"], new_manifest["shards"])].count(False) == 1
+
+    assert store.load_from_s3() == 19
+    assert store.get_by_id("key_3") is None
+
+
+def test_missing_shard_fails_load(memory_s3):
+    """Test that a missing shard fails the load instead of emptying the keyring."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.s3 = memory_s3
+    manifest = store.save_sharded(_keys(10), 2)
+    store.load_from_s3()
+
+    del memory_s3.objects[manifest["shards"][1]]
+    with pytest.raises(ValueError, match="shard"):
+        store.load_from_s3(force=True)
+    assert len(store.keys_by_secret) == 10
+
+
+def test_save_to_s3_unshards(memory_s3):
+    """Test that writing a single file replaces a sharded layout."""
+    store = KeyStore("test-bucket", "keys.json")
+    store.s3 = memory_s3
+    store.save_sharded(_keys(10), 2)
+
+    store.save_to_s3(_keys(3))
+    assert store.read_manifest() is None
+    assert list(memory_s3.objects) == ["keys.json"]
+    assert store.load_from_s3() == 3
+
+
+def test_change_log_incremental_apply(memory_s3):
+    """Test that a refresh fetches and applies only new change records."""
+    writer = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    writer.s3 = memory_s3
+    writer.save_to_s3(_keys(5))
+    store = KeyStore("test-bucket", "keys.json", storage_secret="test-secret", change_log=True)
+    store.s3 = memory_s3
+
+    new_key = {
+        "id": "key_new", "secret": "sec_new", "name": "New", "expires_at": "2099-01-01T00:00:00Z"
+    }
+    assert writer.append_change("create", key_data=new_key) == 1
+    assert writer.append_change("delete", key_id="key_0") == 2
+    assert store.load_from_s3() == 5
+    assert store.log_seq == 2
+    assert store.get_by_secret("sec_0") is None
+    assert b"key_new" in store.snapshot.responses_by_secret["sec_new"]
+    assert store.next_expiry() is not None
+
+    # Nothing new: no records fetched and nothing published
+    generation = store.generation
+    memory_s3.gets.clear()
+    store.load_from_s3()
+    assert store.last_load_changed is False
+    assert store.generation == generation
+    assert memory_s3.gets == ["keys.json"]
+
+    # An update replaces the key's secret; only the new record is fetched
+    writer.append_change(
+        "update", key_data={"id": "key_new", "secret": "sec_rotated", "name": "New"}
+    )
+    memory_s3.gets.clear()
+    store.load_from_s3()
+    assert memory_s3.gets == ["keys.json", "keys.json.log/00000000000000000003.json"]
+    assert store.get_by_secret("sec_new") is None
+    assert store.get_by_secret("sec_rotated")["id"] == "key_new"
+    assert store.next_expiry() is None
+
+    with pytest.raises(ValueError, match="Unknown"):
+        writer.append_change("rename", key_id="key_1")
+
+
+def test_change_log_compaction_position(memory_s3):
+    """Test that records folded into the keyring are not applied again."""
+    store = KeyStore("test-bucket", "keys.json", change_log=True)
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(2))
+    store.append_change("delete", key_id="key_0")
+    store.append_change("create", key_data={"id": "key_0", "secret": "sec_again", "name": "Again"})
+    store.load_from_s3()
+
+    store.save_to_s3(store.get_all_keys(), log_seq=store.log_seq)
+    assert memory_s3.objects["keys.json"][1] == {"heare-auth-log-seq": "2"}
+
+    # Records survive until deleted, but the keyring's position skips them
+    fresh = KeyStore("test-bucket", "keys.json", change_log=True)
+    fresh.s3 = memory_s3
+    assert fresh.load_from_s3() == 2
+    assert fresh.get_by_secret("sec_again")["id"] == "key_0"
+
+    assert store.delete_changes(2) == 2
+    assert store.append_change("delete", key_id="key_1") == 3
+
+
+def test_change_log_append_during_compact(memory_s3, monkeypatch):
+    """Test that a record appended while a compact folds the log lands above the folded position."""
+    store = KeyStore("test-bucket", "keys.json", change_log=True)
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(2))
+    store.append_change("delete", key_id="key_0")
+    store.append_change("delete", key_id="key_1")
+
+    head_object = memory_s3.head_object
+    compacted = []
+
+    def head_then_compact(**kwargs):
+        # The compact folds and deletes records 1-2 right after the writer's HEAD
+        head = head_object(**kwargs)
+        if not compacted:
+            compacted.append(True)
+            memory_s3.put_object(Bucket="test-bucket", Key="keys.json", Body=b'{"keys": []}',
+                                 Metadata={"heare-auth-log-seq": "2"})
+            store.delete_changes(2)
+        return head
+
+    monkeypatch.setattr(memory_s3, "head_object", head_then_compact)
+    seq = store.append_change(
+        "create", key_data={"id": "key_new", "secret": "sec_new", "name": "New"}
+    )
+    assert seq == 3
+
+    reader = KeyStore("test-bucket", "keys.json", change_log=True)
+    reader.s3 = memory_s3
+    assert reader.load_from_s3() == 1
+    assert reader.get_by_secret("sec_new")["id"] == "key_new"
+
+
+def test_binary_keyring_format(memory_s3):
+    """Test writing and loading binary keyrings, single file and sharded."""
+    store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", keyring_format="binary"
+    )
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(20))
+    assert store._decrypt_data(memory_s3.objects["keys.json"][0]).startswith(b"HEARE_KEYS")
+
+    reader = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    reader.s3 = memory_s3
+    assert reader.load_from_s3() == 20
+    assert reader.get_by_secret("sec_4")["name"] == "Key 4"
+
+    manifest = store.save_sharded(_keys(20), 4)
+    assert sum(len(store.read_shard(manifest, i)) for i in range(4)) == 20
+    assert reader.load_from_s3() == 20
+
+    with pytest.raises(ValueError, match="format"):
+        KeyStore("test-bucket", "keys.json", keyring_format="xml")
+
+
+def test_snapshot_cache_roundtrip(memory_s3, tmp_path):
+    """Test that loads save an encrypted cache that a new store can boot from."""
+    cache_path = str(tmp_path / "cache" / "keys.cache")
+    store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", cache_path=cache_path
+    )
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(10))
+    store.load_from_s3()
+    assert store.cache_error is None
+    with open(cache_path, "rb") as f:
+        f.readline()
+        assert f.read().startswith(KeyStore.ENCRYPTION_HEADER)
+    assert os.stat(cache_path).st_mode & 0o777 == 0o600
+
+    booted = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", cache_path=cache_path
+    )
+    booted.s3 = memory_s3
+    assert booted.load_cache() == 10
+    assert booted.get_by_secret("sec_3")["id"] == "key_3"
+    assert booted.etag == store.etag
+
+    # Revalidation is a conditional GET that only touches the cache
+    os.utime(cache_path, (0, 0))
+    memory_s3.gets.clear()
+    assert booted.load_from_s3() == 10
+    assert booted.last_load_changed is False
+    assert memory_s3.gets == ["keys.json"]
+    assert os.stat(cache_path).st_mtime > 0
+
+    # A cache for another keyring, or none at all, is not used
+    other = KeyStore(
+        "test-bucket", "other.json", storage_secret="test-secret", cache_path=cache_path
+    )
+    assert other.load_cache() is None
+    missing = str(tmp_path / "missing")
+    missing_store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", cache_path=missing
+    )
+    assert missing_store.load_cache() is None
+
+    # Without a storage secret the cache would hold every secret in the clear
+    with pytest.raises(ValueError):
+        KeyStore("test-bucket", "keys.json", cache_path=cache_path)
+
+    # A cache that fails to decrypt is an error, not an empty keyring
+    wrong = KeyStore(
+        "test-bucket", "keys.json", storage_secret="wrong-secret", cache_path=cache_path
+    )
+    with pytest.raises(ValueError):
+        wrong.load_cache()
+
+
+def test_local_copies_rate_limited(memory_s3, tmp_path):
+    """Test that changes rewrite the cache and shared index at most once per interval."""
+    writer = KeyStore("test-bucket", "keys.json", storage_secret="test-secret")
+    writer.s3 = memory_s3
+    writer.save_to_s3(_keys(5))
+    cache_path = str(tmp_path / "keys.cache")
+    index_path = str(tmp_path / "keys.index")
+    store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", change_log=True,
+        cache_path=cache_path, index_path=index_path,
+        cache_write_interval=60, index_write_interval=60,
+    )
+    store.s3 = memory_s3
+    assert store.acquire_index_lock()
+    try:
+        # Missing files are written straight away
+        store.load_from_s3()
+        cached = KeyStore(
+            "test-bucket", "keys.json", storage_secret="test-secret", cache_path=cache_path
+        )
+        follower = KeyStore("test-bucket", "keys.json", index_path=index_path)
+        assert cached.load_cache() == 5
+        assert follower.load_index() == 5
+
+        # A change inside the interval is served but not yet written out
+        writer.append_change("delete", key_id="key_0")
+        store.load_from_s3()
+        assert store.get_by_secret("sec_0") is None
+        store.flush_local_copies()
+        assert cached.load_cache() == 5
+        assert follower.load_index() == 5
+
+        # Once the interval has passed the next flush writes both
+        store.cache_write_interval = store.index_write_interval = 0
+        store.flush_local_copies()
+        assert cached.load_cache() == 4
+        assert cached.log_seq == 1
+        assert follower.load_index() == 4
+        assert follower.get_by_secret("sec_0") is None
+    finally:
+        os.close(store._index_lock)
+
+
+def test_snapshot_cache_write_failure(memory_s3, tmp_path):
+    """Test that a failed cache write is recorded without failing the load."""
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache_path = str(blocker / "keys.cache")
+    store = KeyStore(
+        "test-bucket", "keys.json", storage_secret="test-secret", cache_path=cache_path
+    )
+    store.s3 = memory_s3
+    store.save_to_s3(_keys(3))
+
+    assert store.load_from_s3() == 3
+    assert store.cache_error is not None
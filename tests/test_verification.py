@@ -0,0 +1,44 @@
+"""Tests for verification module."""
+
+from structlog.testing import capture_logs
+
+import heare_auth.verification as verification
+from heare_auth.stats import MetricsAggregator
+from heare_auth.storage import KeyStore
+
+
+def test_record_verification(monkeypatch):
+    """Test that successes and failures are logged and counted the same way everywhere."""
+    metrics = MetricsAggregator(client=object())
+    monkeypatch.setattr(verification, "get_metrics", lambda: metrics)
+    store = KeyStore("test-bucket", "keys.json")
+    store.set_keys([{"id": "key_1", "secret": "sec_secret", "name": "One"}])
+    snapshot = store.snapshot
+
+    with capture_logs() as logs:
+        key_data = snapshot.get_by_secret("sec_secret")
+        verification.record_verification(snapshot, "sec_secret", key_data, 0.0, user_agent="ua")
+        verification.record_verification(
+            snapshot, "sec_wrong", None, 0.0, peer="p", transport="grpc"
+        )
+        verification.record_verification(snapshot, "ab", None, 0.0)
+
+    assert logs[0] == {
+        "event": "verification_success",
+        "log_level": "info",
+        "key_id": "key_1",
+        "key_name": "One",
+        "user_agent": "ua",
+        "generation": snapshot.generation,
+    }
+    assert logs[1]["event"] == "verification_failed"
+    assert logs[1]["secret_prefix"] == "sec_"
+    assert (logs[1]["peer"], logs[1]["transport"]) == ("p", "grpc")
+    assert logs[2]["secret_prefix"] == "***"
+    assert not any("sec_secret" in str(log) or "sec_wrong" in str(log) for log in logs)
+
+    batch = metrics.drain()
+    assert batch.counters["verify.requests"] == 3
+    assert batch.counters["verify.success"] == 1
+    assert batch.counters["verify.failed"] == 2
+    assert len(batch.timers["verify.duration"]) == 3
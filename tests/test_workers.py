@@ -0,0 +1,41 @@
+"""Tests for the worker control sockets."""
+
+import asyncio
+import os
+import socket
+
+from heare_auth.workers import send_command, serve_control, socket_path, stop_control, worker_pids
+
+
+def test_control_roundtrip(tmp_path):
+    """Test that a command reaches a worker's handler and its result comes back."""
+    directory = str(tmp_path / "workers")
+    commands = []
+
+    async def handler(command):
+        commands.append(command)
+        return {"pid": os.getpid(), "success": True}
+
+    async def scenario():
+        server = await serve_control(directory, handler)
+        try:
+            assert worker_pids(directory) == [os.getpid()]
+            return await send_command(directory, os.getpid(), "refresh", timeout=5)
+        finally:
+            await stop_control(server, directory)
+
+    assert asyncio.run(scenario()) == {"pid": os.getpid(), "success": True}
+    assert commands == ["refresh"]
+    assert worker_pids(directory) == []
+
+
+def test_control_removes_stale_sockets(tmp_path):
+    """Test that the socket of a worker that exited is removed, not reported as a failure."""
+    directory = str(tmp_path)
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path(directory, 4242))
+    stale.close()
+
+    assert worker_pids(directory) == [4242]
+    assert asyncio.run(send_command(directory, 4242, "refresh", timeout=5)) is None
+    assert worker_pids(directory) == []